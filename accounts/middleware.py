@@ -1,10 +1,16 @@
 import json
 import logging
+from urllib.parse import parse_qs
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
 from django.http import JsonResponse
 from django.utils import timezone
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import connection
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 
 logger = logging.getLogger(__name__)
 
@@ -147,4 +153,27 @@ class RoleBasedAccessMiddleware:
                 )
                 return JsonResponse({'error': 'Permission denied'}, status=403)
 
-        return None
\ No newline at end of file
+        return None
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """Channels middleware authenticating WebSocket connections with an access token in ``?token=``.
+
+    Browsers cannot set headers on WebSocket handshakes. Connections without
+    a valid token keep the session user set by AuthMiddlewareStack.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = parse_qs(scope.get('query_string', b'').decode()).get('token')
+        if token:
+            user = await self.get_user(token[0])
+            if user is not None:
+                scope = dict(scope, user=user)
+        return await super().__call__(scope, receive, send)
+
+    @database_sync_to_async
+    def get_user(self, raw_token):
+        authentication = JWTAuthentication()
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw_token))
+        except (InvalidToken, TokenError, AuthenticationFailed):
+            return None
@@ -72,4 +72,23 @@ class IsDepartmentManagerOrReadOnly(permissions.BasePermission):
             return obj.department == request.user.department
         elif hasattr(obj, 'employee'):
             return obj.employee.department == request.user.department
-        return False
\ No newline at end of file
+        return False
+
+class IsHRStaff(permissions.BasePermission):
+    """Custom permission to only allow HR staff and administrators (User.is_hr) to access the view."""
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_hr
+
+class IsHRStaffOrReadOnly(permissions.BasePermission):
+    """Custom permission to only allow HR staff and administrators to edit but allow read to authenticated users."""
+    def has_permission(self, request, view):
+        # Read permissions are allowed to any authenticated user
+        if request.method in permissions.SAFE_METHODS:
+            return request.user.is_authenticated
+        # Write permissions are only allowed to HR staff and administrators
+        return request.user.is_authenticated and request.user.is_hr
+
+class IsManager(permissions.BasePermission):
+    """Custom permission to only allow managers, HR staff and administrators (User.is_manager) to access the view."""
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_manager
@@ -80,9 +80,13 @@ def status_color(status):
     return color_map.get(status, 'secondary')
 
 @register.simple_tag
-def leave_duration(start_date, end_date, exclude_weekends=True):
-    """Calculate leave duration between two dates."""
+def leave_duration(start_date, end_date, exclude_weekends=True, employee=None):
+    """Calculate leave duration between two dates, on ``employee``'s holiday calendar if given."""
     try:
+        if employee is not None:
+            return calculate_leave_duration(
+                start_date, end_date, exclude_weekends, employee.country, employee.department_id
+            )
         return calculate_leave_duration(start_date, end_date, exclude_weekends)
     except (ValueError, TypeError):
         return 0
@@ -13,22 +13,22 @@ def generate_employee_id():
     random_id = str(uuid.uuid4().int)[:6]
     return f'EMP{year}{random_id}'
 
-def calculate_leave_duration(start_date, end_date, exclude_weekends=True):
-    """Calculate the duration of leave in days, optionally excluding weekends."""
-    if not isinstance(start_date, datetime):
-        start_date = datetime.combine(start_date, datetime.min.time())
-    if not isinstance(end_date, datetime):
-        end_date = datetime.combine(end_date, datetime.min.time())
-    
-    duration = 0
-    current_date = start_date
-    
-    while current_date <= end_date:
-        if not exclude_weekends or current_date.weekday() < 5:  # 0-4 represents Monday to Friday
-            duration += 1
-        current_date += timedelta(days=1)
-    
-    return duration
+def calculate_leave_duration(start_date, end_date, exclude_weekends=True, country='', department_id=None):
+    """Calculate the duration of leave in days.
+
+    Excluding weekends, this is the business days on the holiday calendar of
+    ``country`` and ``department_id``; otherwise the calendar days.
+    """
+    from leave.business_days import business_days
+
+    if isinstance(start_date, datetime):
+        start_date = start_date.date()
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+
+    if not exclude_weekends:
+        return max((end_date - start_date).days + 1, 0)
+    return business_days(start_date, end_date, country, department_id)
 
 def calculate_work_hours(check_in, check_out):
     """Calculate total work hours between check-in and check-out times."""
@@ -46,10 +46,14 @@ def calculate_overtime_hours(work_hours, standard_hours=8):
     return round(work_hours - standard_hours, 2)
 
 def calculate_net_salary(basic_salary, allowances, deductions):
-    """Calculate net salary after adding allowances and subtracting deductions."""
-    total_allowances = sum(allowance.amount for allowance in allowances)
-    total_deductions = sum(deduction.amount for deduction in deductions)
-    return basic_salary + total_allowances - total_deductions
+    """Calculate net salary after adding allowances and subtracting deductions.
+
+    Percentage allowances are taken of the basic salary and percentage
+    deductions of the gross salary, each rounded half-up to the cent.
+    """
+    gross_salary = basic_salary + sum(allowance.calculate_amount(basic_salary) for allowance in allowances)
+    total_deductions = sum(deduction.calculate_amount(gross_salary) for deduction in deductions)
+    return gross_salary - total_deductions
 
 def send_email_notification(subject, template_name, context, recipient_list, from_email=None):
     """Send HTML email using templates."""
@@ -0,0 +1,142 @@
+"""
+Materialization of absences.
+
+Employees who never punch in on a working day get no Attendance row at
+all. ``mark_absences`` fills that gap for one day: it takes the set of
+employees expected at work (active, hired and not past their contract
+end), subtracts those with an attendance on that day and those on an
+approved leave covering it, and inserts an 'absent' row for each employee
+left. On PostgreSQL and SQLite the difference is a SQL EXCEPT feeding one
+INSERT ... SELECT; elsewhere the sets are diffed in Python and the rows
+bulk-created. Either way inserts ignore conflicts on (employee, date), so
+the job can be rerun, or race a late punch, without duplicating rows or
+overwriting a real attendance.
+
+Weekends (Saturday and Sunday) are never marked, matching the working
+days of attendance.reports, and neither are employees whose holiday
+calendar (see leave.business_days) has the day off.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from leave.business_days import calendar_for
+from leave.models import Holiday, LeaveRequest
+
+from .models import Attendance
+from .rollups import refresh_day_rollups
+
+User = get_user_model()
+
+BATCH_SIZE = 2000
+
+# Backends where absences are inserted with one INSERT ... SELECT ... ON CONFLICT DO NOTHING
+INSERT_SELECT_VENDORS = ('postgresql', 'sqlite')
+
+NOTES = 'No punch recorded'
+
+
+def is_working_day(day):
+    return day.weekday() < 5
+
+
+def _on_holiday(employees, day):
+    """A Q matching the ``employees`` whose holiday calendar has ``day`` off, None if none do."""
+    if not Holiday.objects.filter(date=day).exists():
+        return None
+    off = Q(pk__in=[])
+    # One calendar per country and department, matched on the stored values
+    for country, department_id in employees.values_list('country', 'department_id').distinct().order_by():
+        if calendar_for(country, department_id).holidays_between(day, day):
+            off |= Q(country=country, department_id=department_id)
+    return off
+
+
+def expected_employees(day):
+    """Ids of the employees expected at work on ``day``, as a one-column queryset."""
+    employees = User.objects.filter(
+        Q(hire_date__isnull=True) | Q(hire_date__lte=day),
+        Q(contract_end_date__isnull=True) | Q(contract_end_date__gte=day),
+        is_active=True,
+    )
+    off = _on_holiday(employees, day)
+    if off is not None:
+        employees = employees.exclude(off)
+    return employees.values(absent_employee=F('pk')).order_by()
+
+
+def excused_employees(day):
+    """Ids of the employees with an attendance on ``day`` and of those on an approved leave covering it."""
+    recorded = Attendance.objects.filter(date=day).values('employee_id').order_by()
+    on_leave = LeaveRequest.objects.filter(
+        status='approved', start_date__lte=day, end_date__gte=day,
+    ).values('employee_id').order_by()
+    return recorded, on_leave
+
+
+def _insert_missing(day, missing, now):
+    """INSERT ... SELECT an absence for each id of the ``missing`` queryset; returns the rows inserted."""
+    quote = connection.ops.quote_name
+    values = {
+        'date': day,
+        'attendance_type': 'absent',
+        'overtime_hours': 0,
+        'is_late': False,
+        'is_early_leave': False,
+        'notes': NOTES,
+        'is_approved': False,
+        'created_at': now,
+        'updated_at': now,
+    }
+    fields = [Attendance._meta.get_field(name) for name in values]
+    select_sql, params = missing.query.sql_with_params()
+    sql = (
+        f'INSERT INTO {quote(Attendance._meta.db_table)} '
+        f'({quote("employee_id")}, {", ".join(quote(field.column) for field in fields)}) '
+        f'SELECT missing.absent_employee, {", ".join(["%s"] * len(fields))} FROM ({select_sql}) missing '
+        # WHERE true keeps SQLite from reading ON CONFLICT as a join constraint
+        f'WHERE true ON CONFLICT DO NOTHING'
+    )
+    prepared = [field.get_db_prep_save(values[field.name], connection) for field in fields]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (*prepared, *params))
+        return cursor.rowcount
+
+
+def _create_missing(day, missing, now):
+    absences = [
+        Attendance(
+            employee_id=employee_id,
+            date=day,
+            attendance_type='absent',
+            notes=NOTES,
+            created_at=now,
+            updated_at=now,
+        )
+        for employee_id in missing
+    ]
+    Attendance.objects.bulk_create(absences, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    return len(absences)
+
+
+def mark_absences(day):
+    """Create the 'absent' attendances of ``day``; returns how many were created."""
+    if not is_working_day(day):
+        return 0
+    expected = expected_employees(day)
+    recorded, on_leave = excused_employees(day)
+    now = timezone.now()
+    with transaction.atomic():
+        if connection.vendor in INSERT_SELECT_VENDORS:
+            created = _insert_missing(day, expected.difference(recorded, on_leave), now)
+        else:
+            missing = (
+                {row['absent_employee'] for row in expected}
+                - {row['employee_id'] for row in recorded}
+                - {row['employee_id'] for row in on_leave}
+            )
+            created = _create_missing(day, missing, now)
+        if created:
+            refresh_day_rollups(day, Attendance.objects.filter(date=day, attendance_type='absent').values('employee_id'))
+    return created
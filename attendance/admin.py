@@ -1,16 +1,19 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import Attendance, AttendancePolicy
+from .models import (
+    Attendance, AttendanceArchive, AttendancePolicy, DailyAttendanceRollup, MonthlyAttendanceRollup,
+)
 
 @admin.register(AttendancePolicy)
 class AttendancePolicyAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+    list_display = ('name', 'department', 'work_start_time', 'work_end_time', 'is_active')
+    list_filter = ('is_active', 'department')
     search_fields = ('name',)
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
-    list_display = ('employee', 'date', 'check_in', 'check_out', 'attendance_type', 'work_hours')
-    list_filter = ('date', 'attendance_type', 'employee__department')
+    list_display = ('employee', 'date', 'check_in', 'check_out', 'attendance_type', 'work_hours', 'is_late', 'is_early_leave')
+    list_filter = ('date', 'attendance_type', 'is_late', 'is_early_leave', 'employee__department')
     search_fields = ('employee__user__email', 'employee__employee_id')
     date_hierarchy = 'date'
     
@@ -19,14 +22,39 @@ class AttendanceAdmin(admin.ModelAdmin):
             'fields': ('employee', 'date', 'attendance_type')
         }),
         (_('Time Details'), {
-            'fields': ('check_in', 'check_out', 'work_hours', 'overtime_hours')
+            'fields': ('check_in', 'check_out', 'work_hours', 'overtime_hours', 'is_late', 'is_early_leave')
         }),
         (_('Additional Information'), {
             'fields': ('notes', 'is_approved', 'approved_by')
         }),
     )
     
-    readonly_fields = ('work_hours', 'overtime_hours')
+    readonly_fields = ('work_hours', 'overtime_hours', 'is_late', 'is_early_leave')
     
     def get_queryset(self, request):
         return super().get_queryset(request).select_related('employee', 'employee__user', 'employee__department')
+
+@admin.register(DailyAttendanceRollup)
+class DailyAttendanceRollupAdmin(admin.ModelAdmin):
+    list_display = ('date', 'department', 'days_recorded', 'present_days', 'work_hours', 'overtime_hours')
+    list_filter = ('department',)
+    date_hierarchy = 'date'
+
+@admin.register(MonthlyAttendanceRollup)
+class MonthlyAttendanceRollupAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'month', 'days_recorded', 'present_days', 'work_hours', 'overtime_hours')
+    search_fields = ('employee__email', 'employee__employee_id')
+    date_hierarchy = 'month'
+
+@admin.register(AttendanceArchive)
+class AttendanceArchiveAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'date', 'check_in', 'check_out', 'attendance_type', 'work_hours')
+    list_filter = ('attendance_type',)
+    search_fields = ('employee__email', 'employee__employee_id')
+    date_hierarchy = 'date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,68 @@
+"""
+Archival of closed years of attendance.
+
+``archive_year`` moves the attendances of a past year from Attendance to
+AttendanceArchive in batches of ARCHIVE_BATCH_SIZE rows. Each batch is
+one transaction: one INSERT ... SELECT into the archive, then one DELETE
+of the same rows, so an interrupted run leaves every row in exactly one
+of the tables and can simply be run again. AttendanceManager.between()
+reads both tables, so readers see the year throughout the move.
+
+The deletes bypass the Attendance signals on purpose: the rollups of an
+archived year keep describing its attendances, which no longer change.
+Rebuilding them would read the hot table only, so the
+rebuild_attendance_rollups command refuses archived ranges.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import Attendance, AttendanceArchive
+
+ARCHIVE_BATCH_SIZE = getattr(settings, 'ATTENDANCE_ARCHIVE_BATCH_SIZE', 5000)
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _move(batch):
+    """Copy the ``batch`` queryset into the archive and delete it from Attendance, two statements."""
+    quote = connection.ops.quote_name
+    fields = Attendance._meta.concrete_fields
+    columns = [field.column for field in fields]
+    rows = batch.values_list(*(field.attname for field in fields)).order_by()
+    select_sql, select_params = rows.query.sql_with_params()
+    ids_sql, ids_params = batch.values('pk').order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {quote(AttendanceArchive._meta.db_table)} '
+            f'({", ".join(quote(column) for column in columns)}) {select_sql}',
+            select_params,
+        )
+        moved = cursor.rowcount
+        cursor.execute(
+            f'DELETE FROM {quote(Attendance._meta.db_table)} '
+            f'WHERE {quote(Attendance._meta.pk.column)} IN ({ids_sql})',
+            ids_params,
+        )
+    return moved
+
+
+def archive_year(year, today, batch_size=None):
+    """Move the attendances of ``year`` to the archive; yields the running count after each batch.
+
+    Only years before ``today``'s are closed and can be archived.
+    """
+    if year >= today.year:
+        raise ArchiveError(f'{year} is not closed yet; only years before {today.year} can be archived.')
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    in_year = Attendance.objects.filter(date__year=year)
+    moved = 0
+    while True:
+        with transaction.atomic():
+            ids = list(in_year.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                return
+            # The batch is every row of the year up to its last id: earlier ones are already moved
+            moved += _move(in_year.filter(pk__lte=ids[-1]))
+        yield moved
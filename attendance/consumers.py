@@ -0,0 +1,80 @@
+import uuid
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from employees.models import Department
+from .presence import board, department_group, load_presence
+
+class PresenceConsumer(AsyncJsonWebsocketConsumer):
+    """Live "who's in" feed of one or more departments.
+
+    HR staff watch every department, or the ones named in
+    ``?department=<id>`` (repeatable, ``none`` for employees without one);
+    other managers watch their own department. On connect the consumer
+    sends a ``snapshot`` message with today's presence, then one
+    ``presence`` message per check-in or check-out.
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            await self.close(code=4401)
+            return
+        self.departments = await self.get_departments(user)
+        if self.departments is None:
+            await self.close(code=4403)
+            return
+
+        for department in self.departments:
+            await self.channel_layer.group_add(department_group(department), self.channel_name)
+        await self.accept()
+
+        missing = board.watch(self.departments)
+        if missing:
+            day, loaded = await database_sync_to_async(load_presence)(missing)
+            board.fill(day, loaded)
+        await self.send_json({
+            'type': 'snapshot',
+            'date': board.day.isoformat(),
+            'presence': board.snapshot(self.departments),
+        })
+
+    async def disconnect(self, code):
+        departments = getattr(self, 'departments', None)
+        if not departments:
+            return
+        board.unwatch(departments)
+        for department in departments:
+            await self.channel_layer.group_discard(department_group(department), self.channel_name)
+
+    async def receive_json(self, content, **kwargs):
+        # The feed is one-way
+        pass
+
+    async def presence_event(self, event):
+        board.apply(event)
+        message = {field: value for field, value in event.items() if field != 'type'}
+        await self.send_json(dict(message, type='presence'))
+
+    @database_sync_to_async
+    def get_departments(self, user):
+        """Department keys ``user`` may watch, None when none at all."""
+        requested = parse_qs(self.scope['query_string'].decode()).get('department', [])
+        if user.is_hr:
+            if not requested:
+                return [str(pk) for pk in Department.objects.values_list('pk', flat=True)] + [None]
+            departments = []
+            for value in requested:
+                if value == 'none':
+                    departments.append(None)
+                    continue
+                try:
+                    departments.append(str(uuid.UUID(value)))
+                except ValueError:
+                    return None
+            return list(dict.fromkeys(departments))
+        if user.role == 'manager' and user.department_id:
+            return [str(user.department_id)]
+        return None
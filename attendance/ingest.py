@@ -0,0 +1,201 @@
+"""
+Bulk ingestion of raw clock events from badge readers and kiosks.
+
+A batch of punches (employee, timestamp and an optional direction) is
+validated, deduplicated on (employee, timestamp) and folded per employee
+and day: the earliest punch is the check-in and the latest the check-out.
+A punch without a direction may be either. Punches are merged with the
+day's existing Attendance row, so replaying a batch, or sending it in
+pieces, ends in the same row.
+
+Existing rows are loaded in one query and written back with bulk_update,
+new rows with bulk_create, all in one transaction. Work and overtime hours
+and the late and early-leave flags come from Attendance.calculate_hours()
+under each employee's attendance policy, exactly as save() computes them.
+The rollups of the written days are then refreshed in one pass, and
+today's written rows published to the presence board.
+"""
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Attendance
+from .policies import policy_for
+from .presence import publish_attendances
+from .rollups import refresh_rollups
+
+User = get_user_model()
+
+MAX_PUNCHES = getattr(settings, 'ATTENDANCE_INGEST_MAX_PUNCHES', 50000)
+
+BATCH_SIZE = 1000
+
+DIRECTIONS = ('in', 'out')
+
+UPDATE_FIELDS = [
+    'attendance_type', 'check_in', 'check_out', 'work_hours', 'overtime_hours', 'is_late', 'is_early_leave',
+    'updated_at',
+]
+
+# A row created concurrently between the read and the insert makes the
+# insert fail; the fold is then retried against the now existing row
+ATTEMPTS = 3
+
+
+class IngestError(Exception):
+    pass
+
+
+def _timestamp(value):
+    if isinstance(value, datetime):
+        stamp = value
+    else:
+        stamp = parse_datetime(value) if isinstance(value, str) else None
+        if stamp is None:
+            raise ValueError('Enter a valid ISO 8601 timestamp.')
+    if timezone.is_naive(stamp):
+        stamp = timezone.make_aware(stamp)
+    return stamp
+
+
+def parse_punches(items):
+    """Validate raw punch dicts.
+
+    Each punch names the employee by primary key (``employee``) or badge
+    number (``employee_id``). Returns ``(punches, rejected)``: the unique
+    ``(employee pk, timestamp, direction)`` tuples, and an
+    ``{'index', 'error'}`` dict per invalid item.
+    """
+    if not isinstance(items, list):
+        raise IngestError('Expected a list of punches.')
+    if len(items) > MAX_PUNCHES:
+        raise IngestError(f'At most {MAX_PUNCHES} punches can be ingested at once.')
+
+    parsed = []
+    rejected = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            rejected.append({'index': index, 'error': 'Expected an object.'})
+            continue
+        direction = item.get('direction') or None
+        if direction is not None and direction not in DIRECTIONS:
+            rejected.append({'index': index, 'error': "Direction must be 'in' or 'out'."})
+            continue
+        if not item.get('employee') and not item.get('employee_id'):
+            rejected.append({'index': index, 'error': 'An employee or employee_id is required.'})
+            continue
+        try:
+            stamp = _timestamp(item.get('timestamp'))
+            employee = User._meta.pk.to_python(item['employee']) if item.get('employee') else None
+        except ValueError as exc:
+            rejected.append({'index': index, 'error': str(exc)})
+            continue
+        except ValidationError as exc:
+            rejected.append({'index': index, 'error': ' '.join(exc.messages)})
+            continue
+        parsed.append((index, employee, str(item.get('employee_id')), stamp, direction))
+
+    # Resolve employees in two queries, whichever way they are named
+    pks = {employee for _, employee, _, _, _ in parsed if employee is not None}
+    badges = {badge for _, employee, badge, _, _ in parsed if employee is None}
+    known = set(User.objects.filter(pk__in=pks).values_list('pk', flat=True)) if pks else set()
+    by_badge = dict(User.objects.filter(employee_id__in=badges).values_list('employee_id', 'pk')) if badges else {}
+
+    punches = {}
+    for index, employee, badge, stamp, direction in parsed:
+        pk = (employee if employee in known else None) if employee is not None else by_badge.get(badge)
+        if pk is None:
+            rejected.append({'index': index, 'error': 'Unknown employee.'})
+            continue
+        # The first occurrence of a duplicate wins
+        punches.setdefault((pk, stamp), direction)
+    rejected.sort(key=lambda rejection: rejection['index'])
+    return [(pk, stamp, direction) for (pk, stamp), direction in punches.items()], rejected
+
+
+def _fold(punches):
+    """Group punches by (employee pk, date) into (earliest in, latest out) bounds."""
+    days = {}
+    for pk, stamp, direction in punches:
+        bounds = days.setdefault((pk, timezone.localdate(stamp)), [None, None])
+        if direction != 'out' and (bounds[0] is None or stamp < bounds[0]):
+            bounds[0] = stamp
+        if direction != 'in' and (bounds[1] is None or stamp > bounds[1]):
+            bounds[1] = stamp
+    return days
+
+
+def _merge(attendance, check_in, check_out, policy):
+    """Widen ``attendance``'s punches to the batch bounds; returns whether it changed."""
+    before = (attendance.check_in, attendance.check_out)
+    if check_in is not None and (attendance.check_in is None or check_in < attendance.check_in):
+        attendance.check_in = check_in
+    if check_out is not None and (attendance.check_out is None or check_out > attendance.check_out):
+        attendance.check_out = check_out
+    if attendance.check_in and attendance.check_out and attendance.check_out <= attendance.check_in:
+        # A lone undirected punch bounds the day on both sides; it is only a check-in
+        attendance.check_out = before[1]
+    if (attendance.check_in, attendance.check_out) == before:
+        return False
+    if attendance.attendance_type == 'absent':
+        # Marked absent before the punches came in
+        attendance.attendance_type = 'present'
+    attendance.calculate_hours(policy)
+    return True
+
+
+@transaction.atomic
+def _write(days):
+    employee_ids = {pk for pk, _ in days}
+    dates = [day for _, day in days]
+    existing = {
+        (attendance.employee_id, attendance.date): attendance
+        for attendance in Attendance.objects.select_for_update().filter(
+            employee_id__in=employee_ids, date__range=(min(dates), max(dates))
+        )
+        if (attendance.employee_id, attendance.date) in days
+    }
+
+    departments = dict(User.objects.filter(pk__in=employee_ids).values_list('pk', 'department_id'))
+    now = timezone.now()
+    created = []
+    updated = []
+    for (pk, day), (check_in, check_out) in days.items():
+        attendance = existing.get((pk, day))
+        if attendance is None:
+            attendance = Attendance(employee_id=pk, date=day)
+            _merge(attendance, check_in, check_out, policy_for(departments.get(pk)))
+            attendance.updated_at = now
+            created.append(attendance)
+        elif _merge(attendance, check_in, check_out, policy_for(departments.get(pk))):
+            attendance.updated_at = now
+            updated.append(attendance)
+
+    Attendance.objects.bulk_create(created, batch_size=BATCH_SIZE)
+    Attendance.objects.bulk_update(updated, UPDATE_FIELDS, batch_size=BATCH_SIZE)
+    return created, updated
+
+
+def ingest_punches(punches):
+    """Fold ``(employee pk, timestamp, direction)`` punches into Attendance rows.
+
+    Returns ``(created, updated)`` lists of the written Attendance rows.
+    """
+    days = _fold(punches)
+    if not days:
+        return [], []
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            created, updated = _write(days)
+            break
+        except IntegrityError:
+            if attempt == ATTEMPTS:
+                raise
+    refresh_rollups((attendance.employee_id, attendance.date) for attendance in created + updated)
+    publish_attendances(created + updated)
+    return created, updated
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from attendance.archive import ARCHIVE_BATCH_SIZE, ArchiveError, archive_year
+
+class Command(BaseCommand):
+    help = 'Move the attendances of a closed year to the archive table, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, required=True, help='Year to archive (before the current one)')
+        parser.add_argument(
+            '--batch-size', type=int, default=ARCHIVE_BATCH_SIZE,
+            help=f'Rows moved per transaction (default {ARCHIVE_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive')
+        moved = 0
+        try:
+            for moved in archive_year(options['year'], timezone.localdate(), options['batch_size']):
+                self.stdout.write(f'{moved} attendances moved')
+        except ArchiveError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f'{moved} attendances of {options["year"]} archived'))
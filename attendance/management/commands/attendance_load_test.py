@@ -0,0 +1,134 @@
+import queue
+import statistics
+import threading
+import time
+from datetime import datetime, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+from django.utils import timezone
+
+from attendance import punches
+from attendance.models import Attendance
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'loadtest.invalid'
+
+class Command(BaseCommand):
+    help = (
+        'Replay a morning rush of check-ins followed by check-outs against the database '
+        'at a fixed rate and report punch latency per time window'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=3000)
+        parser.add_argument('--rate', type=int, default=6000, help='Punches per minute')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent punching threads')
+        parser.add_argument('--window', type=int, default=10, help='Report window in seconds')
+        parser.add_argument(
+            '--double-punch', type=float, default=0.05,
+            help='Share of punches sent twice at once, to exercise contention'
+        )
+        parser.add_argument('--keep', action='store_true', help='Keep the load test employees and punches')
+
+    def handle(self, *args, **options):
+        employees = self._employees(options['employees'])
+        # Punch on a fixed day of its own so runs never collide with real data
+        day = timezone.make_aware(datetime(2000, 1, 3, 9, 0))
+        Attendance.objects.filter(employee__in=employees, date=day.date()).delete()
+
+        every = round(1 / options['double_punch']) if options['double_punch'] else 0
+        schedule = []
+        for index, employee in enumerate(employees):
+            schedule.append((punches.check_in, employee, day, bool(every) and index % every == 0))
+        for index, employee in enumerate(employees):
+            schedule.append((punches.check_out, employee, day + timedelta(hours=9), False))
+
+        results = self._replay(schedule, options['rate'] / 60, options['workers'])
+        self._report(results, options['window'])
+
+        if not options['keep']:
+            Attendance.objects.filter(employee__in=employees).delete()
+            User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+
+    def _employees(self, count):
+        existing = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').count()
+        User.objects.bulk_create([
+            User(
+                email=f'employee{index}@{EMAIL_DOMAIN}',
+                employee_id=f'LOADTEST{index}',
+                first_name='Load',
+                last_name=f'Test {index}',
+            )
+            for index in range(existing, count)
+        ], batch_size=1000)
+        return list(User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').order_by('email')[:count])
+
+    def _replay(self, schedule, per_second, workers):
+        """Send the punches at ``per_second``; returns (scheduled offset, latency, outcome) tuples."""
+        pending = queue.Queue(maxsize=workers * 4)
+        results = []
+        lock = threading.Lock()
+        started = time.perf_counter()
+
+        def worker():
+            try:
+                while True:
+                    item = pending.get()
+                    if item is None:
+                        return
+                    due, punch, employee, now = item
+                    try:
+                        punch(employee, now)
+                        outcome = 'ok'
+                    except punches.PunchRefused:
+                        outcome = 'refused'
+                    except DatabaseError:
+                        outcome = 'error'
+                    finished = time.perf_counter()
+                    with lock:
+                        results.append((due - started, finished - due, outcome))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+
+        for index, (punch, employee, now, double) in enumerate(schedule):
+            due = started + index / per_second
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            pending.put((due, punch, employee, now))
+            if double:
+                pending.put((due, punch, employee, now))
+
+        for _ in threads:
+            pending.put(None)
+        for thread in threads:
+            thread.join()
+        return results
+
+    def _report(self, results, window):
+        self.stdout.write(f"{'window':>8} {'punches':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+                          f"{'max ms':>8} {'refused':>8} {'errors':>7}")
+        windows = {}
+        for offset, latency, outcome in results:
+            windows.setdefault(int(offset // window), []).append((latency, outcome))
+        for index in sorted(windows):
+            rows = windows[index]
+            latencies = sorted(latency * 1000 for latency, _ in rows)
+            quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+            self.stdout.write(
+                f'{index * window:>7}s {len(rows):>8} {quantiles[49]:>8.1f} {quantiles[94]:>8.1f} '
+                f'{quantiles[98]:>8.1f} {latencies[-1]:>8.1f} '
+                f"{sum(1 for _, outcome in rows if outcome == 'refused'):>8} "
+                f"{sum(1 for _, outcome in rows if outcome == 'error'):>7}"
+            )
+
+        errors = sum(1 for _, _, outcome in results if outcome == 'error')
+        style = self.style.SUCCESS if not errors else self.style.ERROR
+        self.stdout.write(style(f'{len(results)} punches, {errors} database errors'))
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from attendance.absences import mark_absences
+
+class Command(BaseCommand):
+    help = "Create 'absent' attendances for employees without any punch on a day (or range of days)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day, YYYY-MM-DD (defaults to yesterday)')
+        parser.add_argument('--end', help='Last day, YYYY-MM-DD (defaults to --start)')
+
+    def handle(self, *args, **options):
+        try:
+            start = (
+                datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start']
+                else timezone.localdate() - timedelta(days=1)
+            )
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else start
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        if end < start:
+            raise CommandError('--end must not be before --start')
+
+        day = start
+        total = 0
+        while day <= end:
+            total += mark_absences(day)
+            day += timedelta(days=1)
+        self.stdout.write(self.style.SUCCESS(f'{total} absences marked from {start} to {end}'))
@@ -0,0 +1,38 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+
+from attendance.models import Attendance, AttendanceArchive
+from attendance.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily and monthly attendance rollups for a date range (whole months)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day, YYYY-MM-DD (defaults to the first attendance)')
+        parser.add_argument('--end', help='Last day, YYYY-MM-DD (defaults to the last attendance)')
+
+    def handle(self, *args, **options):
+        bounds = Attendance.objects.aggregate(first=Min('date'), last=Max('date'))
+        try:
+            start = datetime.strptime(options['start'], '%Y-%m-%d').date() if options['start'] else bounds['first']
+            end = datetime.strptime(options['end'], '%Y-%m-%d').date() if options['end'] else bounds['last']
+        except ValueError:
+            raise CommandError('Dates must be in YYYY-MM-DD format')
+        if start is None or end is None:
+            self.stdout.write('No attendance to roll up')
+            return
+        if end < start:
+            raise CommandError('--end must not be before --start')
+        archived_through = AttendanceArchive.archived_through()
+        if archived_through is not None and start <= archived_through:
+            raise CommandError(
+                f'Attendance up to {archived_through} is archived and its rollups are kept as they are; '
+                f'start after {archived_through:%Y}'
+            )
+
+        daily, monthly = rebuild_rollups(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f'{daily} daily and {monthly} monthly rollup rows rebuilt from {start:%Y-%m} to {end:%Y-%m}'
+        ))
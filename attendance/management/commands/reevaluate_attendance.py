@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from attendance.policies import reevaluate
+from attendance.rollups import month_end, month_start
+
+class Command(BaseCommand):
+    help = 'Re-apply the current attendance policies to a month of attendances'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--month', help='Month to re-evaluate, YYYY-MM (defaults to the current month)')
+        parser.add_argument('--department', action='append', help='Only this department id (repeatable)')
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['month'], '%Y-%m').date() if options['month'] else timezone.localdate()
+        except ValueError:
+            raise CommandError('--month must be in YYYY-MM format')
+        start, end = month_start(day), month_end(day)
+        changed = reevaluate(start, end, options['department'])
+        self.stdout.write(self.style.SUCCESS(f'{changed} attendances changed from {start} to {end}'))
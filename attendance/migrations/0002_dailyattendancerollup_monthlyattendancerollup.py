@@ -0,0 +1,61 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0001_initial'),
+        ('employees', '0002_remove_department_manager_alter_department_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days_recorded', models.PositiveIntegerField(default=0)),
+                ('present_days', models.PositiveIntegerField(default=0)),
+                ('absent_days', models.PositiveIntegerField(default=0)),
+                ('half_days', models.PositiveIntegerField(default=0)),
+                ('work_from_home_days', models.PositiveIntegerField(default=0)),
+                ('work_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overtime_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance_rollups', to='employees.department')),
+            ],
+            options={
+                'verbose_name': 'daily attendance rollup',
+                'verbose_name_plural': 'daily attendance rollups',
+                'ordering': ['-date'],
+                'unique_together': {('department', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='MonthlyAttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('days_recorded', models.PositiveIntegerField(default=0)),
+                ('present_days', models.PositiveIntegerField(default=0)),
+                ('absent_days', models.PositiveIntegerField(default=0)),
+                ('half_days', models.PositiveIntegerField(default=0)),
+                ('work_from_home_days', models.PositiveIntegerField(default=0)),
+                ('work_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('overtime_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('month', models.DateField()),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_attendance_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'monthly attendance rollup',
+                'verbose_name_plural': 'monthly attendance rollups',
+                'ordering': ['-month'],
+                'unique_together': {('employee', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0002_dailyattendancerollup_monthlyattendancerollup'),
+        ('employees', '0002_remove_department_manager_alter_department_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendance',
+            name='is_early_leave',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='attendance',
+            name='is_late',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='attendancepolicy',
+            name='department',
+            field=models.ForeignKey(blank=True, help_text='Leave empty for the company-wide policy', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_policies', to='employees.department'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0003_attendance_is_early_leave_attendance_is_late_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['employee', '-date', '-check_in', '-id'], name='attendance_employee_keyset_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['-date', '-check_in', '-id'], name='attendance_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attendance', '0004_attendance_keyset_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('check_in', models.DateTimeField(blank=True, null=True)),
+                ('check_out', models.DateTimeField(blank=True, null=True)),
+                ('attendance_type', models.CharField(choices=[('present', 'Present'), ('absent', 'Absent'), ('half_day', 'Half Day'), ('work_from_home', 'Work From Home')], max_length=20)),
+                ('work_hours', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('overtime_hours', models.DecimalField(decimal_places=2, default=0, max_digits=5)),
+                ('is_late', models.BooleanField(default=False)),
+                ('is_early_leave', models.BooleanField(default=False)),
+                ('notes', models.TextField(blank=True)),
+                ('is_approved', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('approved_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_attendances', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'archived attendance',
+                'verbose_name_plural': 'archived attendances',
+                'ordering': ['-date', '-check_in'],
+                'indexes': [models.Index(fields=['-date', '-check_in', '-id'], name='attendance_archive_date_idx')],
+                'unique_together': {('employee', 'date')},
+            },
+        ),
+    ]
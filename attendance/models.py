@@ -3,6 +3,29 @@ from django.conf import settings
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+class AttendanceManager(models.Manager):
+    def between(self, start, end, **filters):
+        """Attendances from ``start`` to ``end``, including those moved to AttendanceArchive.
+
+        Ranges reaching into archived years are read from both tables with a
+        UNION ALL that yields Attendance instances; such a queryset can be
+        ordered, sliced and counted but not filtered further, so pass the
+        filters here. Other ranges return a plain queryset of the hot table.
+        """
+        attendances = self.filter(date__range=(start, end), **filters)
+        archived_through = AttendanceArchive.archived_through()
+        if archived_through is None or start > archived_through:
+            return attendances
+        archived = AttendanceArchive.objects.filter(date__range=(start, end), **filters)
+        return attendances.order_by().union(archived.order_by(), all=True).order_by('-date', '-check_in')
+
+    @staticmethod
+    def parts(queryset):
+        """The querysets of the tables ``queryset`` reads: both halves of a between() UNION, else itself."""
+        if not queryset.query.combinator:
+            return [queryset]
+        return [models.QuerySet(model=query.model, query=query.clone()) for query in queryset.query.combined_queries]
+
 class Attendance(models.Model):
     ATTENDANCE_TYPE_CHOICES = (
         ('present', 'Present'),
@@ -18,6 +41,8 @@ class Attendance(models.Model):
     attendance_type = models.CharField(max_length=20, choices=ATTENDANCE_TYPE_CHOICES, default='present')
     work_hours = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     overtime_hours = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    is_late = models.BooleanField(default=False)
+    is_early_leave = models.BooleanField(default=False)
     notes = models.TextField(blank=True)
     is_approved = models.BooleanField(default=False)
     approved_by = models.ForeignKey(
@@ -30,16 +55,28 @@ class Attendance(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
-    def save(self, *args, **kwargs):
+    objects = AttendanceManager()
+
+    def calculate_hours(self, policy=None):
+        """Set work and overtime hours and the late and early-leave flags.
+
+        ``policy`` is an attendance.policies.Policy; by default the one in
+        force for the employee's department.
+        """
+        if policy is None:
+            from .policies import policy_for
+            policy = policy_for(self.employee.department_id)
+        self.is_late = policy.is_late(self.date, self.check_in)
+        self.is_early_leave = policy.is_early_leave(self.date, self.check_out)
         if self.check_in and self.check_out:
             # Calculate work hours
             time_diff = self.check_out - self.check_in
             hours = time_diff.total_seconds() / 3600  # Convert to hours
             self.work_hours = round(hours, 2)
-            
-            # Calculate overtime (assuming 8-hour workday)
-            if hours > 8:
-                self.overtime_hours = round(hours - 8, 2)
+            self.overtime_hours = policy.overtime(hours)
+
+    def save(self, *args, **kwargs):
+        self.calculate_hours()
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -50,6 +87,61 @@ class Attendance(models.Model):
         verbose_name_plural = _('attendances')
         ordering = ['-date', '-check_in']
         unique_together = ['employee', 'date']
+        # Keys of attendance.pagination.AttendanceCursorPagination, with and without an employee filter
+        indexes = [
+            models.Index(fields=['employee', '-date', '-check_in', '-id'], name='attendance_employee_keyset_idx'),
+            models.Index(fields=['-date', '-check_in', '-id'], name='attendance_keyset_idx'),
+        ]
+
+class AttendanceArchive(models.Model):
+    """Attendances of closed years, moved out of Attendance by attendance.archive.
+
+    The columns mirror Attendance one for one, in the same order, so the
+    two tables can be read together (see AttendanceManager.between). Rows
+    keep their Attendance id and are not meant to change.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    employee = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='archived_attendances'
+    )
+    date = models.DateField()
+    check_in = models.DateTimeField(null=True, blank=True)
+    check_out = models.DateTimeField(null=True, blank=True)
+    attendance_type = models.CharField(max_length=20, choices=Attendance.ATTENDANCE_TYPE_CHOICES)
+    work_hours = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    overtime_hours = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    is_late = models.BooleanField(default=False)
+    is_early_leave = models.BooleanField(default=False)
+    notes = models.TextField(blank=True)
+    is_approved = models.BooleanField(default=False)
+    approved_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    @classmethod
+    def archived_through(cls):
+        """Date of the latest archived attendance, None when nothing is archived."""
+        return cls.objects.aggregate(last=models.Max('date'))['last']
+
+    def __str__(self):
+        return f"{self.employee} - {self.date}"
+
+    class Meta:
+        verbose_name = _('archived attendance')
+        verbose_name_plural = _('archived attendances')
+        ordering = ['-date', '-check_in']
+        unique_together = ['employee', 'date']
+        indexes = [
+            models.Index(fields=['-date', '-check_in', '-id'], name='attendance_archive_date_idx'),
+        ]
 
 class AttendancePolicy(models.Model):
     name = models.CharField(max_length=100)
@@ -59,6 +151,14 @@ class AttendancePolicy(models.Model):
     grace_period_minutes = models.IntegerField(default=15)
     minimum_work_hours = models.DecimalField(max_digits=4, decimal_places=2, default=8.00)
     overtime_threshold_hours = models.DecimalField(max_digits=4, decimal_places=2, default=8.00)
+    department = models.ForeignKey(
+        'employees.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='attendance_policies',
+        help_text=_('Leave empty for the company-wide policy')
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -70,3 +170,55 @@ class AttendancePolicy(models.Model):
         verbose_name = _('attendance policy')
         verbose_name_plural = _('attendance policies')
         ordering = ['-created_at']
+
+class AttendanceRollup(models.Model):
+    """Attendance totals over a set of Attendance rows, maintained by attendance.rollups."""
+    days_recorded = models.PositiveIntegerField(default=0)
+    present_days = models.PositiveIntegerField(default=0)
+    absent_days = models.PositiveIntegerField(default=0)
+    half_days = models.PositiveIntegerField(default=0)
+    work_from_home_days = models.PositiveIntegerField(default=0)
+    work_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    overtime_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+class DailyAttendanceRollup(AttendanceRollup):
+    """One department's attendance on one day; a null department groups employees without one."""
+    department = models.ForeignKey(
+        'employees.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='daily_attendance_rollups'
+    )
+    date = models.DateField()
+
+    def __str__(self):
+        return f"{self.department or _('No department')} - {self.date}"
+
+    class Meta:
+        verbose_name = _('daily attendance rollup')
+        verbose_name_plural = _('daily attendance rollups')
+        ordering = ['-date']
+        unique_together = ['department', 'date']
+
+class MonthlyAttendanceRollup(AttendanceRollup):
+    """One employee's attendance in one month, keyed by the month's first day."""
+    employee = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='monthly_attendance_rollups'
+    )
+    month = models.DateField()
+
+    def __str__(self):
+        return f"{self.employee} - {self.month:%Y-%m}"
+
+    class Meta:
+        verbose_name = _('monthly attendance rollup')
+        verbose_name_plural = _('monthly attendance rollups')
+        ordering = ['-month']
+        unique_together = ['employee', 'month']
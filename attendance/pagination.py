@@ -0,0 +1,112 @@
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class AttendanceCursorPagination(CursorPagination):
+    """Keyset pagination over (date, check_in, id), newest first.
+
+    DRF's CursorPagination only seeks on the first ordering field and skips
+    ties with an offset, which degrades on dates shared by thousands of
+    attendances. Here the cursor holds the whole key of the row at the edge
+    of the page, and the next page seeks past it on the (date, check_in, id)
+    indexes, so every page costs the same and no page counts the rows.
+    check_in can be NULL; NULLs sort where the database puts them in a
+    descending ORDER BY. The UNION querysets of Attendance.objects.between()
+    get the cursor condition on each of their parts.
+    """
+    key_fields = ('date', 'check_in', 'id')
+    ordering = ('-date', '-check_in', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        nulls_largest = connections[queryset.db].features.nulls_order_largest
+        self.model = queryset.model
+
+        if self.cursor is not None:
+            queryset = self._filter(queryset, self._beyond(self._key(self.cursor.position), reverse, nulls_largest))
+        ordering = [field[1:] for field in self.ordering] if reverse else list(self.ordering)
+        results = list(queryset.order_by(*ordering)[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        # Moving forward there is a previous page whenever we came from a cursor, and vice versa
+        self.has_next = has_more if not reverse else self.cursor is not None
+        self.has_previous = has_more if reverse else self.cursor is not None
+        return self.page
+
+    @staticmethod
+    def _filter(queryset, condition):
+        if not queryset.query.combinator:
+            return queryset.filter(condition)
+        # A UNION can't be filtered, its parts can; they share the key fields
+        parts = [part.filter(condition) for part in queryset.model.objects.parts(queryset)]
+        return parts[0].union(*parts[1:], all=queryset.query.combinator_all)
+
+    def _key(self, position):
+        try:
+            values = json.loads(position)
+            return [
+                None if value is None else self.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.key_fields, values, strict=True)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _beyond(self, key, reverse, nulls_largest):
+        """Q for the rows after ``key`` in the (descending, or ascending when ``reverse``) order."""
+        condition = Q()
+        matched = False
+        equal = Q()
+        for field, value in zip(self.key_fields, key):
+            step = self._step(field, value, reverse, nulls_largest)
+            if step is not None:
+                condition = (condition | (equal & step)) if matched else (equal & step)
+                matched = True
+            equal &= Q(**{f'{field}__isnull': True}) if value is None else Q(**{field: value})
+        if not matched:
+            return Q(pk__in=[])
+        # The redundant bound on the leading field lets the index range scan start at the cursor
+        leading = self.key_fields[0]
+        return Q(**{f'{leading}__gte' if reverse else f'{leading}__lte': key[0]}) & condition
+
+    def _step(self, field, value, reverse, nulls_largest):
+        """Q for values of ``field`` strictly past ``value`` in the page order, None if there are none."""
+        # Descending pages move towards smaller values, reverse ones towards larger values
+        towards_larger = reverse
+        if value is None:
+            # Past NULL are the non-NULL values only if NULL sits at the end we move away from
+            return Q(**{f'{field}__isnull': False}) if nulls_largest != towards_larger else None
+        step = Q(**{f'{field}__gt' if towards_larger else f'{field}__lt': value})
+        if nulls_largest == towards_larger and self.model._meta.get_field(field).null:
+            step |= Q(**{f'{field}__isnull': True})
+        return step
+
+    def _link(self, attendance, reverse):
+        position = json.dumps([getattr(attendance, field) for field in self.key_fields], cls=DjangoJSONEncoder)
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self._link(self.page[0], reverse=True)
@@ -0,0 +1,272 @@
+"""
+Attendance policy evaluation.
+
+The policy in force for an employee is the newest active AttendancePolicy
+of their department, else the newest active company-wide one (without a
+department), else the built-in default: no start or end time and overtime
+beyond STANDARD_WORK_HOURS. A punch is late when it comes after the start
+time plus the grace period, an early leave when it comes before the end
+time, and overtime is the work beyond the policy's threshold. Times of day
+are compared in the current time zone, on the attendance's date.
+
+Active policies are loaded once per process and reused for at most
+ATTENDANCE_POLICY_CACHE_TTL seconds; saving or deleting a policy clears
+the cache of the process that did it right away.
+
+When a policy changes, ``reevaluate`` recomputes the flags and hours of a
+date range of attendances in one pass over numpy arrays, and writes back
+only the rows that changed, a batch per statement.
+"""
+import time
+from datetime import datetime, time as dt_time
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Attendance, AttendancePolicy
+from .rollups import departments_filter, refresh_rollups
+
+User = get_user_model()
+
+# Work beyond this many hours a day is overtime when no policy says otherwise
+STANDARD_WORK_HOURS = 8
+
+POLICY_CACHE_TTL = getattr(settings, 'ATTENDANCE_POLICY_CACHE_TTL', 60)
+
+EVALUATED_FIELDS = ['work_hours', 'overtime_hours', 'is_late', 'is_early_leave', 'updated_at']
+
+BATCH_SIZE = 1000
+
+# Backends where changed rows are written back as one UPDATE ... FROM (VALUES ...) per batch
+UPDATE_FROM_VENDORS = ('postgresql', 'sqlite')
+
+MICROSECONDS = 10 ** 6
+
+
+def _microseconds(value):
+    """Microseconds since midnight of a time of day."""
+    return ((value.hour * 60 + value.minute) * 60 + value.second) * MICROSECONDS + value.microsecond
+
+
+class Policy:
+    """The evaluation rules of one AttendancePolicy, or the default ones."""
+
+    def __init__(self, pk=None, start=None, end=None, grace_minutes=0, overtime_threshold=STANDARD_WORK_HOURS):
+        self.pk = pk
+        # Microseconds into the day after which a check-in is late, and before which a check-out is early
+        self.late_after = None if start is None else _microseconds(start) + grace_minutes * 60 * MICROSECONDS
+        self.leave_from = None if end is None else _microseconds(end)
+        self.overtime_threshold = float(overtime_threshold)
+
+    @classmethod
+    def from_model(cls, policy):
+        return cls(
+            pk=policy.pk,
+            start=policy.work_start_time,
+            end=policy.work_end_time,
+            grace_minutes=policy.grace_period_minutes,
+            overtime_threshold=policy.overtime_threshold_hours,
+        )
+
+    @staticmethod
+    def _into_day(day, stamp):
+        local = timezone.make_naive(stamp) if timezone.is_aware(stamp) else stamp
+        delta = local - datetime.combine(day, dt_time.min)
+        return (delta.days * 86400 + delta.seconds) * MICROSECONDS + delta.microseconds
+
+    def is_late(self, day, check_in):
+        return bool(check_in and self.late_after is not None and self._into_day(day, check_in) > self.late_after)
+
+    def is_early_leave(self, day, check_out):
+        return bool(check_out and self.leave_from is not None and self._into_day(day, check_out) < self.leave_from)
+
+    def overtime(self, hours):
+        return round(hours - self.overtime_threshold, 2) if hours > self.overtime_threshold else 0
+
+
+DEFAULT_POLICY = Policy()
+
+_policies = {}
+
+
+def _load():
+    """Department id (None for company-wide) -> Policy of the newest active policies."""
+    policies = {}
+    for policy in AttendancePolicy.objects.filter(is_active=True).order_by('created_at', 'pk'):
+        policies[policy.department_id] = Policy.from_model(policy)
+    return policies
+
+
+def active_policies():
+    cached = _policies.get('active')
+    if cached and time.monotonic() - cached[0] < POLICY_CACHE_TTL:
+        return cached[1]
+    policies = _load()
+    _policies['active'] = (time.monotonic(), policies)
+    return policies
+
+
+def clear_policy_cache():
+    _policies.clear()
+
+
+def policy_for(department_id):
+    """The Policy in force for employees of ``department_id`` (None for no department)."""
+    policies = active_policies()
+    return policies.get(department_id) or policies.get(None) or DEFAULT_POLICY
+
+
+def _naive(values, tz=None):
+    """Aware datetimes as naive datetime64[us] in ``tz``, UTC by default; None becomes NaT."""
+    if tz is None:
+        # The database hands datetimes back in UTC
+        convert = lambda value: value.replace(tzinfo=None)
+    else:
+        convert = lambda value: value.astimezone(tz).replace(tzinfo=None)
+    return np.array([None if value is None else convert(value) for value in values], dtype='datetime64[us]')
+
+
+def _evaluate(policies, department_codes, days, check_ins, check_outs):
+    """Vectorized Policy evaluation over aligned arrays.
+
+    Returns (hours, overtime, is_late, is_early_leave); hours and overtime
+    are NaN where the row lacks a check-in or check-out.
+    """
+    late_after = np.array(
+        [np.iinfo(np.int64).max if p.late_after is None else p.late_after for p in policies], dtype=np.int64
+    )
+    leave_from = np.array([-1 if p.leave_from is None else p.leave_from for p in policies], dtype=np.int64)
+    thresholds = np.array([p.overtime_threshold for p in policies])
+
+    utc_in, utc_out = _naive(check_ins), _naive(check_outs)
+    if timezone.get_current_timezone_name() == 'UTC':
+        local_in, local_out = utc_in, utc_out
+    else:
+        tz = timezone.get_current_timezone()
+        local_in, local_out = _naive(check_ins, tz), _naive(check_outs, tz)
+
+    midnight = days.astype('datetime64[us]')
+    has_in, has_out = ~np.isnat(local_in), ~np.isnat(local_out)
+    into_day_in = np.where(has_in, (local_in - midnight).astype(np.int64), 0)
+    into_day_out = np.where(has_out, (local_out - midnight).astype(np.int64), 0)
+    is_late = has_in & (into_day_in > late_after[department_codes])
+    is_early_leave = has_out & (into_day_out < leave_from[department_codes])
+
+    # Hours elapsed between the instants, as Attendance.calculate_hours() counts them
+    worked = has_in & has_out
+    hours = np.where(worked, (utc_out - utc_in).astype(np.int64) / MICROSECONDS / 3600, np.nan)
+    threshold = thresholds[department_codes]
+    overtime = np.where(hours > threshold, hours - threshold, 0.0)
+    overtime[~worked] = np.nan
+    return hours, overtime, is_late, is_early_leave
+
+
+def _rounded(values):
+    """Python's float round() to 2 places, exactly as Attendance.calculate_hours() rounds."""
+    return np.array([round(value, 2) for value in values.tolist()])
+
+
+def _stored(values):
+    return np.array([np.nan if value is None else float(value) for value in values])
+
+
+def _differs(new, old):
+    return ~((new == old) | (np.isnan(new) & np.isnan(old)))
+
+
+def _update_from_values(attendances):
+    """Write the evaluated fields of ``attendances`` with one UPDATE ... FROM (VALUES ...) per batch."""
+    quote = connection.ops.quote_name
+    table = quote(Attendance._meta.db_table)
+    fields = [Attendance._meta.pk] + [Attendance._meta.get_field(name) for name in EVALUATED_FIELDS]
+    if connection.vendor == 'postgresql':
+        # Typed like bulk_update() types its CASE; PostgreSQL would otherwise infer
+        # each column's type from the first row, and take a NULL there for text
+        placeholders = [f'CAST(%s AS {field.cast_db_type(connection)})' for field in fields]
+    else:
+        # SQLite casts by type affinity, which would turn datetimes into numbers
+        placeholders = ['%s'] * len(fields)
+    row = f'({", ".join(placeholders)})'
+    # VALUES columns are named column1, column2, ... on both backends
+    assignments = ', '.join(
+        f'{quote(field.column)} = changes.column{position}' for position, field in enumerate(fields[1:], 2)
+    )
+    batch_size = min(BATCH_SIZE, connection.ops.bulk_batch_size(fields, attendances) or BATCH_SIZE)
+    with connection.cursor() as cursor:
+        for start in range(0, len(attendances), batch_size):
+            batch = attendances[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(getattr(attendance, field.attname), connection)
+                for attendance in batch for field in fields
+            ]
+            cursor.execute(
+                f'UPDATE {table} SET {assignments} FROM (VALUES {", ".join([row] * len(batch))}) AS changes '
+                f'WHERE {table}.{quote(Attendance._meta.pk.column)} = changes.column1',
+                params,
+            )
+
+
+def reevaluate(start, end, department_ids=None):
+    """Re-apply the current policies to the attendances from ``start`` to ``end``.
+
+    ``department_ids`` limits it to employees of these departments (None in
+    it for employees without one). Returns the number of rows changed.
+    """
+    clear_policy_cache()
+    attendances = Attendance.objects.filter(date__range=(start, end))
+    if department_ids is not None:
+        attendances = attendances.filter(departments_filter(set(department_ids), 'employee__department_id'))
+    rows = list(attendances.order_by('pk').values_list(
+        'pk', 'employee_id', 'employee__department_id', 'date', 'check_in', 'check_out',
+        'work_hours', 'overtime_hours', 'is_late', 'is_early_leave',
+    ))
+    if not rows:
+        return 0
+    columns = list(zip(*rows))
+
+    # Dense code per department, pointing into the list of their policies
+    codes = {}
+    department_codes = np.fromiter(
+        (codes.setdefault(department, len(codes)) for department in columns[2]), dtype=np.int64, count=len(rows)
+    )
+    evaluated = [policy_for(department) for department in codes]
+    hours, overtime, is_late, is_early_leave = _evaluate(
+        evaluated, department_codes, np.array(columns[3], dtype='datetime64[D]'), columns[4], columns[5]
+    )
+
+    # Hours are only recomputed where both punches exist; other rows keep theirs
+    stored_hours, stored_overtime = _stored(columns[6]), _stored(columns[7])
+    worked = ~np.isnan(hours)
+    hours = np.where(worked, _rounded(hours), stored_hours)
+    overtime = np.where(worked, _rounded(overtime), stored_overtime)
+    changed_rows = np.flatnonzero(
+        _differs(hours, stored_hours) | _differs(overtime, stored_overtime)
+        | (is_late != np.array(columns[8], dtype=bool)) | (is_early_leave != np.array(columns[9], dtype=bool))
+    )
+
+    now = timezone.now()
+    changed = [
+        Attendance(
+            pk=columns[0][index],
+            employee_id=columns[1][index],
+            date=columns[3][index],
+            work_hours=None if np.isnan(hours[index]) else Decimal(str(hours[index])),
+            overtime_hours=Decimal(str(overtime[index])),
+            is_late=bool(is_late[index]),
+            is_early_leave=bool(is_early_leave[index]),
+            updated_at=now,
+        )
+        for index in changed_rows.tolist()
+    ]
+
+    with transaction.atomic():
+        if connection.vendor in UPDATE_FROM_VENDORS:
+            _update_from_values(changed)
+        else:
+            Attendance.objects.bulk_update(changed, EVALUATED_FIELDS, batch_size=BATCH_SIZE)
+        refresh_rollups((attendance.employee_id, attendance.date) for attendance in changed)
+    return len(changed)
@@ -0,0 +1,186 @@
+"""
+Real-time "who's in" presence board.
+
+Each check-in and check-out is published once, after its transaction
+commits, to the channel group of the employee's department
+(``presence.department.<id>``, or ``presence.department.none``). Bulk
+ingestion publishes the rows of today it wrote the same way. The
+WebSocket consumers in attendance.consumers join the groups of the
+departments they watch and relay the events.
+
+Every process serving WebSockets keeps a PresenceBoard: today's presence
+per watched department, updated by the events its consumers receive. A
+department is loaded from Attendance once, when the process gets its
+first watcher for it; later subscribers get the snapshot from memory.
+Departments nobody watches any more are dropped, since their events stop
+reaching the process, and the board starts empty again at midnight.
+
+Publishing is best effort: a punch is recorded even when the channel
+layer is unreachable.
+"""
+import logging
+from datetime import date
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Attendance
+from .rollups import departments_filter
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPE = 'presence.event'
+
+ENTRY_FIELDS = ('employee', 'employee_name', 'department', 'status', 'check_in', 'check_out')
+
+
+def department_group(department):
+    return f'presence.department.{department or "none"}'
+
+
+def _entry(employee_id, name, department_id, check_in, check_out):
+    return {
+        'employee': str(employee_id),
+        'employee_name': name,
+        'department': str(department_id) if department_id else None,
+        'status': 'out' if check_out else 'in',
+        'check_in': check_in.isoformat() if check_in else None,
+        'check_out': check_out.isoformat() if check_out else None,
+    }
+
+
+def _publish(events):
+    """Send ``events`` to their department groups once the current transaction commits."""
+    def send():
+        layer = get_channel_layer()
+        if layer is None:
+            return
+        for event in events:
+            try:
+                async_to_sync(layer.group_send)(department_group(event['department']), event)
+            except Exception:
+                logger.warning('Presence event for %s not published', event['employee'], exc_info=True)
+
+    transaction.on_commit(send)
+
+
+def publish_punch(employee, attendance):
+    """Send ``attendance``'s presence to its department group once the punch is committed."""
+    event = _entry(
+        employee.pk, employee.get_full_name(), employee.department_id, attendance.check_in, attendance.check_out
+    )
+    event.update(type=EVENT_TYPE, date=attendance.date.isoformat())
+    _publish([event])
+
+
+def publish_attendances(attendances):
+    """publish_punch() for many written ``attendances`` at once, their employees read in one query.
+
+    Only today's attendances are sent, the board showing nothing else.
+    """
+    today = timezone.now().date()
+    attendances = [attendance for attendance in attendances if attendance.date == today and attendance.check_in]
+    if not attendances:
+        return
+    employees = {
+        pk: (f'{first} {middle} {last}' if middle else f'{first} {last}', department_id)
+        for pk, first, middle, last, department_id in get_user_model().objects.filter(
+            pk__in={attendance.employee_id for attendance in attendances}
+        ).values_list('pk', 'first_name', 'middle_name', 'last_name', 'department_id')
+    }
+    events = []
+    for attendance in attendances:
+        name, department_id = employees[attendance.employee_id]
+        event = _entry(attendance.employee_id, name, department_id, attendance.check_in, attendance.check_out)
+        event.update(type=EVENT_TYPE, date=attendance.date.isoformat())
+        events.append(event)
+    _publish(events)
+
+
+def load_presence(departments):
+    """Today's entries of ``departments`` (department ids as strings, None for no department), one query."""
+    today = timezone.now().date()
+    attendances = Attendance.objects.filter(
+        departments_filter(set(departments), 'employee__department_id'),
+        date=today,
+        check_in__isnull=False,
+    ).values_list(
+        'employee_id', 'employee__first_name', 'employee__middle_name', 'employee__last_name',
+        'employee__department_id', 'check_in', 'check_out',
+    )
+    loaded = {department: {} for department in departments}
+    for employee_id, first, middle, last, department_id, check_in, check_out in attendances:
+        # As User.get_full_name() spells it
+        name = f'{first} {middle} {last}' if middle else f'{first} {last}'
+        entry = _entry(employee_id, name, department_id, check_in, check_out)
+        loaded[entry['department']][entry['employee']] = entry
+    return today, loaded
+
+
+class PresenceBoard:
+    """Today's presence of the departments watched in this process.
+
+    Departments are keyed by their id as a string, None standing for
+    employees without one. Only touched from the event loop.
+    """
+
+    def __init__(self):
+        self.day = None
+        # Department -> employee id -> entry
+        self.departments = {}
+        self.watchers = {}
+        self.filled = set()
+
+    def _roll_over(self, day):
+        if self.day is None or day > self.day:
+            self.day = day
+            for entries in self.departments.values():
+                entries.clear()
+
+    def watch(self, departments):
+        """Count a watcher of ``departments``; returns those still to be loaded from the database."""
+        self._roll_over(timezone.now().date())
+        for department in departments:
+            self.watchers[department] = self.watchers.get(department, 0) + 1
+            self.departments.setdefault(department, {})
+        return [department for department in departments if department not in self.filled]
+
+    def unwatch(self, departments):
+        for department in departments:
+            self.watchers[department] -= 1
+            if not self.watchers[department]:
+                # Its events stop reaching this process, so the entries would go stale
+                del self.watchers[department]
+                self.departments.pop(department, None)
+                self.filled.discard(department)
+
+    def fill(self, day, loaded):
+        """Merge entries read by load_presence(); events received meanwhile win."""
+        self._roll_over(day)
+        if day < self.day:
+            return
+        for department, entries in loaded.items():
+            if department in self.departments:
+                self.departments[department] = {**entries, **self.departments[department]}
+                self.filled.add(department)
+
+    def apply(self, event):
+        """Record a published event."""
+        day = date.fromisoformat(event['date'])
+        self._roll_over(day)
+        entries = self.departments.get(event['department'])
+        if entries is not None and day == self.day:
+            entries[event['employee']] = {field: event[field] for field in ENTRY_FIELDS}
+
+    def snapshot(self, departments):
+        entries = []
+        for department in departments:
+            entries.extend(self.departments.get(department, {}).values())
+        return sorted(entries, key=lambda entry: (entry['employee_name'], entry['employee']))
+
+
+# The board of this process
+board = PresenceBoard()
@@ -0,0 +1,213 @@
+"""
+Single-statement check-in and check-out.
+
+A check-in is one ``INSERT ... ON CONFLICT (employee_id, date) DO UPDATE``
+that only touches an existing row when it has no check-in yet, and a
+check-out is one ``UPDATE ... WHERE check_out IS NULL``; both use
+RETURNING to hand back the row. Concurrent punches for the same employee
+and day therefore cannot race each other into an IntegrityError, and the
+common case costs a single round trip. The reason a punch was refused is
+only looked up when it is refused.
+
+Backends without ON CONFLICT/RETURNING (MySQL) fall back to a locked
+read-then-write in a transaction.
+
+The statements bypass Attendance.save() and its signals, so each punch
+adds the change it made to the rollups of its day and month itself, in
+the same transaction (see attendance.rollups.apply_rollup_delta). That
+needs the attendance's previous state, which the statements are written
+to pin down: a check-in either inserts the row, only sets the check-in
+time of an existing one, which no rollup counts, or turns an absence
+marked by attendance.absences into a presence; a check-out first
+only takes rows without recorded hours. A check-out of a row whose hours
+were entered by hand takes a second statement and refreshes the rollups.
+Every punch is also published to the presence board (see
+attendance.presence).
+"""
+from django.db import IntegrityError, connection, transaction
+
+from .models import Attendance
+from .policies import policy_for
+from .presence import publish_punch
+from .rollups import apply_rollup_delta, contribution, refresh_rollups
+
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+
+HOURS_SQL = {
+    'postgresql': 'CAST(EXTRACT(EPOCH FROM (%s - {check_in})) AS numeric) / 3600',
+    'sqlite': '(julianday(%s) - julianday({check_in})) * 24.0',
+}
+
+
+class PunchRefused(Exception):
+    pass
+
+
+def _columns():
+    fields = list(Attendance._meta.concrete_fields)
+    quote = connection.ops.quote_name
+    return fields, ', '.join(f'{quote(Attendance._meta.db_table)}.{quote(field.column)}' for field in fields)
+
+
+def _check_out_refusal(employee, day):
+    if not Attendance.objects.filter(employee=employee, date=day).exists():
+        return PunchRefused('No check-in record found for today.')
+    return PunchRefused('Already checked out today.')
+
+
+def _contribution(attendance):
+    return contribution(attendance.attendance_type, attendance.work_hours, attendance.overtime_hours)
+
+
+def _fetch_one(sql, params, employee):
+    attendances = list(Attendance.objects.raw(sql, params))
+    if not attendances:
+        return None
+    attendance = attendances[0]
+    # The employee is the one punching; spare the serializer a query
+    attendance.employee = employee
+    return attendance
+
+
+def check_in(employee, now):
+    """Record ``employee``'s check-in at ``now``; raises PunchRefused if already checked in."""
+    if connection.vendor not in UPSERT_VENDORS:
+        return _check_in_locked(employee, now)
+
+    quote = connection.ops.quote_name
+    table = quote(Attendance._meta.db_table)
+    fields, returning = _columns()
+    attendance = Attendance(employee=employee, date=now.date(), check_in=now)
+    attendance.is_late = policy_for(employee.department_id).is_late(attendance.date, now)
+    insert_fields = [field for field in fields if not field.primary_key]
+    values = [
+        field.get_db_prep_save(field.pre_save(attendance, add=True), connection)
+        for field in insert_fields
+    ]
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in insert_fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(insert_fields))}) '
+        f'ON CONFLICT ({quote("employee_id")}, {quote("date")}) DO UPDATE SET '
+        f'{quote("check_in")} = excluded.{quote("check_in")}, '
+        f'{quote("is_late")} = excluded.{quote("is_late")}, '
+        f'{quote("updated_at")} = excluded.{quote("updated_at")} '
+        f'WHERE {table}.{quote("check_in")} IS NULL AND {table}.{quote("attendance_type")} <> %s '
+        f'RETURNING {returning}'
+    )
+    # An absence marked before the employee showed up turns into a presence
+    present = (
+        f'UPDATE {table} SET '
+        f'{quote("check_in")} = %s, {quote("is_late")} = %s, {quote("updated_at")} = %s, '
+        f'{quote("attendance_type")} = %s '
+        f'WHERE {quote("employee_id")} = %s AND {quote("date")} = %s '
+        f'AND {quote("check_in")} IS NULL AND {quote("attendance_type")} = %s '
+        f'RETURNING {returning}'
+    )
+    prepared = {field.name: value for field, value in zip(insert_fields, values)}
+    present_params = [
+        prepared['check_in'], prepared['is_late'], prepared['updated_at'], 'present',
+        prepared['employee'], prepared['date'], 'absent',
+    ]
+    with transaction.atomic():
+        created = attendance.created_at
+        attendance = _fetch_one(sql, [*values, 'absent'], employee)
+        if attendance is not None:
+            if attendance.created_at == created:
+                apply_rollup_delta(
+                    employee.pk, employee.department_id, attendance.date, None, _contribution(attendance)
+                )
+        else:
+            attendance = _fetch_one(present, present_params, employee)
+            if attendance is None:
+                # The conflicting row already has a check-in
+                raise PunchRefused('Already checked in today.')
+            before = contribution('absent', attendance.work_hours, attendance.overtime_hours)
+            apply_rollup_delta(employee.pk, employee.department_id, attendance.date, before, _contribution(attendance))
+    publish_punch(employee, attendance)
+    return attendance
+
+
+def check_out(employee, now):
+    """Record ``employee``'s check-out at ``now`` with its work and overtime hours."""
+    if connection.vendor not in UPSERT_VENDORS:
+        return _check_out_locked(employee, now)
+
+    quote = connection.ops.quote_name
+    table = quote(Attendance._meta.db_table)
+    _, returning = _columns()
+    day = now.date()
+    policy = policy_for(employee.department_id)
+    stamp = Attendance._meta.get_field('check_out').get_db_prep_save(now, connection)
+    early = Attendance._meta.get_field('is_early_leave').get_db_prep_save(policy.is_early_leave(day, now), connection)
+    hours = HOURS_SQL[connection.vendor].format(check_in=f'{table}.{quote("check_in")}')
+    update = (
+        f'UPDATE {table} SET '
+        f'{quote("check_out")} = %s, '
+        f'{quote("is_early_leave")} = %s, '
+        f'{quote("work_hours")} = CASE WHEN {quote("check_in")} IS NULL THEN {quote("work_hours")} '
+        f'ELSE ROUND({hours}, 2) END, '
+        f'{quote("overtime_hours")} = CASE WHEN {quote("check_in")} IS NULL THEN {quote("overtime_hours")} '
+        f'WHEN {hours} > %s THEN ROUND({hours} - %s, 2) ELSE 0 END, '
+        f'{quote("updated_at")} = %s '
+        f'WHERE {quote("employee_id")} = %s AND {quote("date")} = %s AND {quote("check_out")} IS NULL '
+    )
+    employee_id = Attendance._meta.get_field('employee').get_db_prep_save(employee.pk, connection)
+    params = [
+        stamp,
+        early,
+        stamp,
+        stamp, policy.overtime_threshold, stamp, policy.overtime_threshold,
+        stamp,
+        employee_id, Attendance._meta.get_field('date').get_db_prep_save(day, connection),
+    ]
+    with transaction.atomic():
+        # Without hours before, the row only adds its new hours to the rollups
+        attendance = _fetch_one(
+            f'{update} AND {quote("work_hours")} IS NULL AND {quote("overtime_hours")} = 0 RETURNING {returning}',
+            params,
+            employee,
+        )
+        if attendance is not None:
+            after = _contribution(attendance)
+            before = {**after, 'work_hours': 0, 'overtime_hours': 0}
+            apply_rollup_delta(employee.pk, employee.department_id, day, before, after)
+        else:
+            attendance = _fetch_one(f'{update} RETURNING {returning}', params, employee)
+            if attendance is None:
+                raise _check_out_refusal(employee, day)
+            refresh_rollups([(employee.pk, day)])
+    publish_punch(employee, attendance)
+    return attendance
+
+
+def _check_in_locked(employee, now):
+    try:
+        with transaction.atomic():
+            attendance, created = Attendance.objects.select_for_update().get_or_create(
+                employee=employee, date=now.date(), defaults={'check_in': now}
+            )
+            if not created:
+                if attendance.check_in:
+                    raise PunchRefused('Already checked in today.')
+                attendance.check_in = now
+                if attendance.attendance_type == 'absent':
+                    attendance.attendance_type = 'present'
+                attendance.save()
+    except IntegrityError:
+        # Lost the race to create the row: the other punch checked in
+        raise PunchRefused('Already checked in today.')
+    publish_punch(employee, attendance)
+    return attendance
+
+
+def _check_out_locked(employee, now):
+    with transaction.atomic():
+        attendance = Attendance.objects.select_for_update().filter(employee=employee, date=now.date()).first()
+        if attendance is None:
+            raise PunchRefused('No check-in record found for today.')
+        if attendance.check_out:
+            raise PunchRefused('Already checked out today.')
+        attendance.check_out = now
+        attendance.save()
+    publish_punch(employee, attendance)
+    return attendance
@@ -0,0 +1,239 @@
+"""
+Attendance reports aggregated in the database.
+
+Reports read the rollup tables maintained by attendance.rollups, so their
+cost grows with the number of days, departments and employees in the
+range rather than with the number of attendance rows:
+
+* ``employee`` totals come from MonthlyAttendanceRollup when the range
+  covers whole months. Other ranges are aggregated from Attendance in one
+  GROUP BY query, LEFT JOINed through a FilteredRelation with conditional
+  aggregates (``COUNT(...) FILTER (WHERE ...)``). Employees without any
+  attendance in the range still get a row, with zero present days. Ranges
+  reaching into archived years are read through
+  ``Attendance.objects.between()`` and grouped table by table.
+* ``department`` totals sum DailyAttendanceRollup per department and add
+  the number of active employees of each.
+* ``day`` totals sum DailyAttendanceRollup per date, for dashboards;
+  ``marked_absent`` counts the attendances recorded as absent.
+
+``total_days`` is the number of working days (Monday to Friday) in the
+range; ``absent_days`` is the working days left without a presence.
+"""
+import csv
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, FloatField, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Concat, Greatest, Round, Trim
+
+from .models import Attendance, DailyAttendanceRollup
+from .rollups import PRESENT_TYPES, month_end, month_start
+
+User = get_user_model()
+
+EMPLOYEE_COLUMNS = (
+    'employee', 'employee_id', 'employee_name', 'department_id', 'department_name',
+    'total_days', 'present_days', 'absent_days', 'half_days', 'work_from_home_days',
+    'total_work_hours', 'total_overtime_hours', 'attendance_percentage',
+)
+
+DEPARTMENT_COLUMNS = (
+    'department_id', 'department_name', 'employee_count',
+    'total_days', 'present_days', 'absent_days', 'half_days', 'work_from_home_days',
+    'total_work_hours', 'total_overtime_hours', 'attendance_percentage',
+)
+
+
+def working_days(start, end):
+    """Number of Monday to Friday days from ``start`` to ``end`` inclusive."""
+    if end < start:
+        return 0
+    days = (end - start).days + 1
+    weeks, rest = divmod(days, 7)
+    count = weeks * 5
+    for offset in range(rest):
+        if (start + timedelta(days=offset)).weekday() < 5:
+            count += 1
+    return count
+
+
+def _hours(expression):
+    return Coalesce(Round(Sum(expression), 2), Value(0.0), output_field=FloatField())
+
+
+def _attendance_aggregates():
+    return {
+        'present_days': Count('period', filter=Q(period__attendance_type__in=PRESENT_TYPES)),
+        'half_days': Count('period', filter=Q(period__attendance_type='half_day')),
+        'work_from_home_days': Count('period', filter=Q(period__attendance_type='work_from_home')),
+        'total_work_hours': _hours('period__work_hours'),
+        'total_overtime_hours': _hours('period__overtime_hours'),
+    }
+
+
+def _rollup_aggregates(prefix=''):
+    return {
+        'present_days': Coalesce(Sum(f'{prefix}present_days'), 0),
+        'half_days': Coalesce(Sum(f'{prefix}half_days'), 0),
+        'work_from_home_days': Coalesce(Sum(f'{prefix}work_from_home_days'), 0),
+        'total_work_hours': _hours(f'{prefix}work_hours'),
+        'total_overtime_hours': _hours(f'{prefix}overtime_hours'),
+    }
+
+
+def _percentage(present, expected):
+    return Round(Cast(present, FloatField()) * 100 / expected, 2)
+
+
+def _whole_months(start, end):
+    return start == month_start(start) and end == month_end(end)
+
+
+def _employee_columns(employees):
+    return employees.values(
+        'employee_id',
+        'department_id',
+        employee=F('id'),
+        employee_name=Trim(Concat('first_name', Value(' '), 'last_name')),
+        department_name=F('department__name'),
+    )
+
+
+def _period_totals(attendances):
+    """Employee id -> aggregates of ``attendances``, a UNION of Attendance.objects.between().
+
+    A UNION can't be grouped, so each of its tables is, and the totals added up.
+    """
+    totals = {}
+    for part in Attendance.objects.parts(attendances):
+        rows = part.values('employee_id').annotate(
+            present_days=Count('id', filter=Q(attendance_type__in=PRESENT_TYPES)),
+            half_days=Count('id', filter=Q(attendance_type='half_day')),
+            work_from_home_days=Count('id', filter=Q(attendance_type='work_from_home')),
+            total_work_hours=Coalesce(Sum('work_hours'), Value(Decimal('0.00'))),
+            total_overtime_hours=Coalesce(Sum('overtime_hours'), Value(Decimal('0.00'))),
+        ).order_by()
+        for row in rows:
+            employee_totals = totals.setdefault(row.pop('employee_id'), dict.fromkeys(row, 0))
+            for column, value in row.items():
+                employee_totals[column] += value
+    for employee_totals in totals.values():
+        for column in ('total_work_hours', 'total_overtime_hours'):
+            employee_totals[column] = round(float(employee_totals[column]), 2)
+    return totals
+
+
+def _archived_employee_report(employees, attendances, total_days):
+    """employee_report() rows of the ``attendances`` of a range reaching into AttendanceArchive, three queries."""
+    totals = _period_totals(attendances)
+    empty = {
+        'present_days': 0, 'half_days': 0, 'work_from_home_days': 0,
+        'total_work_hours': 0.0, 'total_overtime_hours': 0.0,
+    }
+    rows = []
+    for row in _employee_columns(employees).order_by('department__name', 'last_name', 'first_name', 'id'):
+        row.update(totals.get(row['employee'], empty), total_days=total_days)
+        row['absent_days'] = max(total_days - row['present_days'], 0)
+        row['attendance_percentage'] = round(row['present_days'] * 100 / total_days, 2) if total_days else 0.0
+        rows.append(row)
+    return rows
+
+
+def employee_report(start, end, department=None):
+    """Per-employee attendance totals between ``start`` and ``end``, one query outside the archive."""
+    total_days = working_days(start, end)
+    employees = User.objects.filter(is_active=True)
+    if department:
+        employees = employees.filter(department_id=department)
+
+    if _whole_months(start, end):
+        period = FilteredRelation(
+            'monthly_attendance_rollups',
+            condition=Q(monthly_attendance_rollups__month__range=(start, end)),
+        )
+        aggregates = _rollup_aggregates('period__')
+    else:
+        attendances = Attendance.objects.between(start, end, employee__in=employees.values('pk'))
+        if attendances.query.combinator:
+            return _archived_employee_report(employees, attendances, total_days)
+        period = FilteredRelation('attendances', condition=Q(attendances__date__range=(start, end)))
+        aggregates = _attendance_aggregates()
+
+    return _employee_columns(employees.annotate(period=period)).annotate(
+        total_days=Value(total_days),
+        **aggregates,
+    ).annotate(
+        absent_days=Greatest(Value(total_days) - F('present_days'), Value(0)),
+        attendance_percentage=_percentage(F('present_days'), total_days) if total_days else Value(0.0),
+    ).order_by('department__name', 'last_name', 'first_name', 'id')
+
+
+def department_report(start, end, department=None):
+    """Per-department attendance totals between ``start`` and ``end``, two queries."""
+    total_days = working_days(start, end)
+    rollups = DailyAttendanceRollup.objects.filter(date__range=(start, end))
+    employees = User.objects.filter(is_active=True)
+    if department:
+        rollups = rollups.filter(department_id=department)
+        employees = employees.filter(department_id=department)
+
+    rows = {
+        row['department_id']: dict(row, employee_count=0)
+        for row in rollups.values('department_id', department_name=F('department__name'))
+        .annotate(**_rollup_aggregates()).order_by()
+    }
+    for row in employees.values('department_id', department_name=F('department__name')).annotate(
+        employee_count=Count('id')
+    ).order_by():
+        rows.setdefault(row['department_id'], dict(
+            row, present_days=0, half_days=0, work_from_home_days=0,
+            total_work_hours=0.0, total_overtime_hours=0.0,
+        ))['employee_count'] = row['employee_count']
+
+    for row in rows.values():
+        expected = row['employee_count'] * total_days
+        row['total_days'] = total_days
+        row['absent_days'] = max(expected - row['present_days'], 0)
+        row['attendance_percentage'] = round(row['present_days'] * 100 / expected, 2) if expected else 0.0
+    return sorted(rows.values(), key=lambda row: (row['department_name'] is not None, row['department_name'] or ''))
+
+
+def day_report(start, end, department=None):
+    """Attendance totals per day between ``start`` and ``end``, one query."""
+    rollups = DailyAttendanceRollup.objects.filter(date__range=(start, end))
+    if department:
+        rollups = rollups.filter(department_id=department)
+    return rollups.values('date').annotate(
+        days_recorded=Sum('days_recorded'),
+        marked_absent=Sum('absent_days'),
+        **_rollup_aggregates(),
+    ).order_by('date')
+
+
+DAY_COLUMNS = (
+    'date', 'days_recorded', 'present_days', 'marked_absent', 'half_days', 'work_from_home_days',
+    'total_work_hours', 'total_overtime_hours',
+)
+
+REPORTS = {
+    'employee': (employee_report, EMPLOYEE_COLUMNS),
+    'department': (department_report, DEPARTMENT_COLUMNS),
+    'day': (day_report, DAY_COLUMNS),
+}
+
+
+class _Echo:
+    """File-like object whose write returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, columns):
+    """Yield ``rows`` (dicts) as CSV lines, header first."""
+    writer = csv.writer(_Echo(), lineterminator='\n')
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(['' if row[column] is None else row[column] for column in columns])
@@ -0,0 +1,275 @@
+"""
+Maintenance of the attendance rollup tables.
+
+DailyAttendanceRollup holds one row per (department, date) and
+MonthlyAttendanceRollup one row per (employee, month). A refresh takes
+the (employee_id, date) keys of the Attendance rows that changed, deletes
+the rollup rows they fall into and re-aggregates those rows from
+Attendance with one INSERT ... SELECT per table, so it is idempotent and
+safe to call from signals, punches, bulk ingestion and the rebuild
+command alike. A refresh never reads more than the attendances of the
+affected departments and employees on the affected days and months.
+
+Employees are counted in the department they belong to when the rollup is
+refreshed; moving employees between departments leaves their past days in
+the old department until the range is rebuilt.
+
+Punches change one attendance at a time in a known way, so instead of a
+refresh they add the difference the change makes to the rollup rows it
+falls into, with one ``INSERT ... ON CONFLICT DO UPDATE SET x = x +
+excluded.x`` per table (see ``apply_rollup_delta``). This keeps a punch
+from re-aggregating its department's whole day, and relies on the rollups
+being complete, which the rebuild command ensures for data written before
+they existed. Employees without a department and backends without
+ON CONFLICT get a refresh instead.
+
+Every refresh_rollups() and apply_rollup_delta() call then sends
+``attendances_changed`` with its keys, so other apps can follow attendance
+writes, including the bulk and raw SQL ones that skip the model signals.
+
+A refresh racing another one on the same key may fail its insert on the
+unique key; it is then retried, and sees the other refresh's rows. Rows
+without a department are not covered by the unique key on every backend,
+so such a race can leave a duplicate; the next refresh of that day
+replaces both.
+"""
+from calendar import monthrange
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, TruncMonth
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import Attendance, DailyAttendanceRollup, MonthlyAttendanceRollup
+
+User = get_user_model()
+
+PRESENT_TYPES = ('present', 'half_day', 'work_from_home')
+
+ROLLUP_FIELDS = (
+    'days_recorded', 'present_days', 'absent_days', 'half_days', 'work_from_home_days',
+    'work_hours', 'overtime_hours',
+)
+
+ATTEMPTS = 3
+
+# Backends supporting INSERT ... ON CONFLICT DO UPDATE
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+
+# Sent with ``keys``, the (employee_id, date) pairs of attendances written or deleted
+attendances_changed = Signal()
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def month_end(day):
+    return day.replace(day=monthrange(day.year, day.month)[1])
+
+
+def _hours(field):
+    return Coalesce(Sum(field), Value(Decimal('0.00')))
+
+
+def _totals(attendances):
+    return attendances.annotate(
+        days_recorded=Count('id'),
+        present_days=Count('id', filter=Q(attendance_type__in=PRESENT_TYPES)),
+        absent_days=Count('id', filter=Q(attendance_type='absent')),
+        half_days=Count('id', filter=Q(attendance_type='half_day')),
+        work_from_home_days=Count('id', filter=Q(attendance_type='work_from_home')),
+        work_hours=_hours('work_hours'),
+        overtime_hours=_hours('overtime_hours'),
+    ).order_by()
+
+
+def _insert(model, totals, keys, now):
+    """Insert the grouped ``totals`` queryset into ``model``'s table in one statement."""
+    quote = connection.ops.quote_name
+    select_sql, params = totals.query.sql_with_params()
+    columns = list(keys) + list(ROLLUP_FIELDS)
+    sql = (
+        f'INSERT INTO {quote(model._meta.db_table)} '
+        f'({", ".join(quote(column) for column in columns + ["updated_at"])}) '
+        f'SELECT {", ".join(quote(column) for column in columns)}, %s FROM ({select_sql}) totals'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (now, *params))
+
+
+def departments_filter(departments, field):
+    """Q matching ``field`` against department ids, None standing for no department."""
+    ids = {department for department in departments if department is not None}
+    condition = Q(**{f'{field}__in': ids})
+    if None in departments:
+        condition |= Q(**{f'{field}__isnull': True})
+    return condition
+
+
+def _refresh_daily(days, departments, now):
+    """Recompute the daily rollups on the days matched by ``days`` (a Q on date).
+
+    ``departments`` limits the refresh to these department ids; None refreshes all.
+    """
+    rollups = DailyAttendanceRollup.objects.filter(days)
+    attendances = Attendance.objects.filter(days)
+    if departments is not None:
+        rollups = rollups.filter(departments_filter(departments, 'department_id'))
+        attendances = attendances.filter(departments_filter(departments, 'employee__department_id'))
+    rollups.delete()
+    _insert(
+        DailyAttendanceRollup,
+        _totals(attendances.annotate(department_id=F('employee__department_id')).values('department_id', 'date')),
+        ('department_id', 'date'),
+        now,
+    )
+
+
+def _refresh_monthly(months, employees, now):
+    """Recompute the monthly rollups of ``months`` (first days).
+
+    ``employees`` limits the refresh to these employee ids; None refreshes all.
+    """
+    in_months = Q()
+    for month in months:
+        in_months |= Q(date__range=(month, month_end(month)))
+    rollups = MonthlyAttendanceRollup.objects.filter(month__in=months)
+    attendances = Attendance.objects.filter(in_months)
+    if employees is not None:
+        rollups = rollups.filter(employee_id__in=employees)
+        attendances = attendances.filter(employee_id__in=employees)
+    rollups.delete()
+    _insert(
+        MonthlyAttendanceRollup,
+        _totals(attendances.annotate(month=TruncMonth('date')).values('employee_id', 'month')),
+        ('employee_id', 'month'),
+        now,
+    )
+
+
+def _retrying(refresh):
+    for attempt in range(1, ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                return refresh()
+        except IntegrityError:
+            if attempt == ATTEMPTS:
+                raise
+
+
+def refresh_rollups(keys):
+    """Recompute the rollups covering an iterable of (employee_id, date) keys."""
+    keys = set(keys)
+    if not keys:
+        return 0
+    employees = {employee_id for employee_id, _ in keys}
+    dates = {day for _, day in keys}
+
+    def refresh():
+        now = timezone.now()
+        departments = set(User.objects.filter(pk__in=employees).values_list('department_id', flat=True))
+        _refresh_daily(Q(date__in=dates), departments, now)
+        _refresh_monthly({month_start(day) for day in dates}, employees, now)
+
+    _retrying(refresh)
+    attendances_changed.send(sender=Attendance, keys=keys)
+    return len(keys)
+
+
+def contribution(attendance_type, work_hours, overtime_hours):
+    """What one attendance adds to each rollup field of the rollups it falls into."""
+    return {
+        'days_recorded': 1,
+        'present_days': int(attendance_type in PRESENT_TYPES),
+        'absent_days': int(attendance_type == 'absent'),
+        'half_days': int(attendance_type == 'half_day'),
+        'work_from_home_days': int(attendance_type == 'work_from_home'),
+        'work_hours': work_hours or Decimal('0.00'),
+        'overtime_hours': overtime_hours or Decimal('0.00'),
+    }
+
+
+def _add(model, keys, deltas, now):
+    """Add ``deltas`` to the ``model`` rollup row of ``keys`` (a dict of key columns), creating it if missing."""
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    # The inserted row is checked against the non-negative columns before the
+    # conflict is, so it only carries the increases; the update adds the deltas
+    values = {**keys, **{field: max(delta, 0) for field, delta in deltas.items()}, 'updated_at': now}
+    fields = [model._meta.get_field(name) for name in values]
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES ({", ".join(["%s"] * len(fields))}) '
+        f'ON CONFLICT ({", ".join(quote(model._meta.get_field(name).column) for name in keys)}) DO UPDATE SET '
+        + ', '.join(f'{quote(field)} = {table}.{quote(field)} + %s' for field in ROLLUP_FIELDS)
+        + f', {quote("updated_at")} = excluded.{quote("updated_at")}'
+    )
+    params = [field.get_db_prep_save(values[field.name], connection) for field in fields]
+    params += [model._meta.get_field(field).get_db_prep_save(deltas[field], connection) for field in ROLLUP_FIELDS]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def apply_rollup_delta(employee_id, department_id, day, before, after):
+    """Update the rollups of one attendance changing from ``before`` to ``after``.
+
+    Both are ``contribution()`` dicts, None when there is no row. Meant to
+    run in the transaction that wrote the attendance, so a concurrent
+    refresh either sees the change or has its rows adjusted after it.
+    """
+    keys = [(employee_id, day)]
+    if department_id is None or connection.vendor not in UPSERT_VENDORS:
+        return refresh_rollups(keys)
+    deltas = {
+        field: (after[field] if after else 0) - (before[field] if before else 0)
+        for field in ROLLUP_FIELDS
+    }
+    if any(deltas.values()):
+        now = timezone.now()
+        _add(DailyAttendanceRollup, {'department': department_id, 'date': day}, deltas, now)
+        _add(MonthlyAttendanceRollup, {'employee': employee_id, 'month': month_start(day)}, deltas, now)
+    attendances_changed.send(sender=Attendance, keys=set(keys))
+    return len(keys)
+
+
+def refresh_day_rollups(day, employees):
+    """Recompute the rollups of ``day`` for ``employees``, an iterable or queryset of user ids.
+
+    Meant for changes touching much of a day, where refresh_rollups() would
+    pass one query parameter per employee.
+    """
+    def refresh():
+        now = timezone.now()
+        _refresh_daily(Q(date=day), None, now)
+        _refresh_monthly({month_start(day)}, employees, now)
+
+    _retrying(refresh)
+
+
+def rebuild_rollups(start, end):
+    """Rebuild every rollup from ``start`` to ``end``, widened to whole months.
+
+    Returns the number of daily and monthly rollup rows written.
+    """
+    start, end = month_start(start), month_end(end)
+    months = []
+    month = start
+    while month <= end:
+        months.append(month)
+        month = month_end(month) + timedelta(days=1)
+
+    def rebuild():
+        now = timezone.now()
+        _refresh_daily(Q(date__range=(start, end)), None, now)
+        _refresh_monthly(months, None, now)
+        return (
+            DailyAttendanceRollup.objects.filter(date__range=(start, end)).count(),
+            MonthlyAttendanceRollup.objects.filter(month__range=(start, end)).count(),
+        )
+
+    return _retrying(rebuild)
@@ -0,0 +1,6 @@
+from django.urls import path
+from .consumers import PresenceConsumer
+
+websocket_urlpatterns = [
+    path('ws/attendance/presence/', PresenceConsumer.as_asgi()),
+]
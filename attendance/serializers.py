@@ -8,16 +8,14 @@ class AttendancePolicySerializer(serializers.ModelSerializer):
     class Meta:
         model = AttendancePolicy
         fields = (
-            'id', 'name', 'description', 'work_days', 'work_start_time',
-            'work_end_time', 'break_start_time', 'break_end_time',
-            'grace_period_minutes', 'overtime_threshold_minutes',
-            'created_at', 'updated_at'
+            'id', 'name', 'description', 'department', 'work_start_time',
+            'work_end_time', 'grace_period_minutes', 'minimum_work_hours',
+            'overtime_threshold_hours', 'is_active', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
 class AttendanceSerializer(serializers.ModelSerializer):
     employee_name = serializers.SerializerMethodField()
-    policy_name = serializers.CharField(source='policy.name', read_only=True)
     total_work_hours = serializers.SerializerMethodField()
     overtime_hours = serializers.SerializerMethodField()
 
@@ -25,10 +23,10 @@ class AttendanceSerializer(serializers.ModelSerializer):
         model = Attendance
         fields = (
             'id', 'employee', 'employee_name', 'date', 'check_in',
-            'check_out', 'attendance_type', 'work_hours', 'overtime_hours',
-            'notes', 'is_approved', 'approved_by', 'created_at', 'updated_at'
+            'check_out', 'attendance_type', 'work_hours', 'total_work_hours', 'overtime_hours',
+            'is_late', 'is_early_leave', 'notes', 'is_approved', 'approved_by', 'created_at', 'updated_at'
         )
-        read_only_fields = ('id', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'is_late', 'is_early_leave', 'created_at', 'updated_at')
     
     def get_employee_name(self, obj):
         return obj.employee.get_full_name() if obj.employee else None
@@ -40,16 +38,43 @@ class AttendanceSerializer(serializers.ModelSerializer):
         return obj.overtime_hours or 0
 
 class AttendanceReportSerializer(serializers.Serializer):
-    employee_id = serializers.IntegerField()
+    employee = serializers.UUIDField()
+    employee_id = serializers.CharField()
     employee_name = serializers.CharField()
-    department = serializers.CharField()
+    department_id = serializers.UUIDField(allow_null=True)
+    department_name = serializers.CharField(allow_null=True)
+    total_days = serializers.IntegerField()
+    present_days = serializers.IntegerField()
+    absent_days = serializers.IntegerField()
+    half_days = serializers.IntegerField()
+    work_from_home_days = serializers.IntegerField()
+    total_work_hours = serializers.FloatField()
+    total_overtime_hours = serializers.FloatField()
+    attendance_percentage = serializers.FloatField()
+
+class DepartmentAttendanceReportSerializer(serializers.Serializer):
+    department_id = serializers.UUIDField(allow_null=True)
+    department_name = serializers.CharField(allow_null=True)
+    employee_count = serializers.IntegerField()
     total_days = serializers.IntegerField()
     present_days = serializers.IntegerField()
     absent_days = serializers.IntegerField()
+    half_days = serializers.IntegerField()
+    work_from_home_days = serializers.IntegerField()
     total_work_hours = serializers.FloatField()
     total_overtime_hours = serializers.FloatField()
     attendance_percentage = serializers.FloatField()
 
+class DailyAttendanceReportSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    days_recorded = serializers.IntegerField()
+    present_days = serializers.IntegerField()
+    marked_absent = serializers.IntegerField()
+    half_days = serializers.IntegerField()
+    work_from_home_days = serializers.IntegerField()
+    total_work_hours = serializers.FloatField()
+    total_overtime_hours = serializers.FloatField()
+
 class EmployeeAttendanceSerializer(serializers.ModelSerializer):
     total_work_hours = serializers.SerializerMethodField()
     overtime_hours = serializers.SerializerMethodField()
@@ -58,7 +83,7 @@ class EmployeeAttendanceSerializer(serializers.ModelSerializer):
         model = Attendance
         fields = (
             'id', 'date', 'check_in', 'check_out', 'attendance_type',
-            'work_hours', 'overtime_hours', 'notes'
+            'work_hours', 'total_work_hours', 'overtime_hours', 'is_late', 'is_early_leave', 'notes'
         )
 
     def get_total_work_hours(self, obj):
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .models import Attendance, AttendancePolicy
+from .policies import clear_policy_cache
+from .rollups import refresh_rollups
+from .tasks import schedule_reevaluation
+
+@receiver(pre_save, sender=Attendance)
+def remember_previous_attendance_key(sender, instance, **kwargs):
+    """Keep the stored employee and date so post_save can refresh the rollups they left."""
+    instance._rollup_previous = None
+    if instance.pk:
+        instance._rollup_previous = Attendance.objects.filter(pk=instance.pk).values_list(
+            'employee_id', 'date'
+        ).first()
+
+@receiver(post_save, sender=Attendance)
+def update_attendance_rollups(sender, instance, **kwargs):
+    keys = {(instance.employee_id, instance.date)}
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        keys.add(previous)
+    refresh_rollups(keys)
+
+@receiver(post_delete, sender=Attendance)
+def remove_from_attendance_rollups(sender, instance, **kwargs):
+    refresh_rollups([(instance.employee_id, instance.date)])
+
+@receiver(post_save, sender=AttendancePolicy)
+@receiver(post_delete, sender=AttendancePolicy)
+def reevaluate_after_policy_change(sender, instance, **kwargs):
+    """Apply the changed policies to this month's attendances."""
+    clear_policy_cache()
+    schedule_reevaluation()
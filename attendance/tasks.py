@@ -0,0 +1,43 @@
+"""
+Background attendance jobs: re-evaluation after a policy change and the
+nightly absence detection (scheduled by CELERY_BEAT_SCHEDULE).
+
+Set CELERY_TASK_ALWAYS_EAGER=True to run it in-process.
+"""
+import logging
+from datetime import date, timedelta
+
+from celery import shared_task
+from django.db import transaction
+from django.utils import timezone
+
+from .absences import mark_absences
+from .policies import reevaluate
+from .rollups import month_start
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def reevaluate_attendance(start, end, department_ids=None):
+    """Re-apply the current policies to attendances between two ISO dates."""
+    changed = reevaluate(date.fromisoformat(start), date.fromisoformat(end), department_ids)
+    logger.info('Attendance from %s to %s re-evaluated: %d rows changed', start, end, changed)
+    return changed
+
+
+def schedule_reevaluation():
+    """Re-evaluate the current month once the policy change is committed."""
+    today = timezone.localdate()
+    transaction.on_commit(
+        lambda: reevaluate_attendance.delay(month_start(today).isoformat(), today.isoformat())
+    )
+
+
+@shared_task
+def mark_absent_employees(day=None):
+    """Mark the absences of an ISO date, by default yesterday's."""
+    day = date.fromisoformat(day) if day else timezone.localdate() - timedelta(days=1)
+    marked = mark_absences(day)
+    logger.info('%d absences marked on %s', marked, day)
+    return marked
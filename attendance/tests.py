@@ -1,3 +1,567 @@
-from django.test import TestCase
+import threading
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from channels.auth import AuthMiddlewareStack
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.middleware import JWTAuthMiddleware
+from employees.models import Department
+from leave.business_days import clear_holiday_cache
+from leave.models import Holiday
+from . import ingest, policies, punches, reports
+from .absences import mark_absences
+from .archive import archive_year
+from .models import (
+    Attendance, AttendanceArchive, AttendancePolicy, DailyAttendanceRollup, MonthlyAttendanceRollup,
+)
+from .presence import PresenceBoard, load_presence
+from .rollups import ROLLUP_FIELDS, rebuild_rollups
+from .routing import websocket_urlpatterns
+
+User = get_user_model()
+
+urlpatterns = [
+    path('api/attendance/', include('attendance.urls')),
+]
+
+
+def create_user(email, **extra):
+    return User.objects.create_user(
+        email=email, password='password123', first_name='Test', last_name=email.split('@')[0], **extra
+    )
+
+
+def at(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute))
+
+
+class PunchTests(TestCase):
+    def setUp(self):
+        self.employee = create_user('employee@example.com')
+        self.day = datetime(2025, 3, 3).date()
+
+    def test_check_in_then_check_out_records_hours(self):
+        punches.check_in(self.employee, at(self.day, 9))
+        attendance = punches.check_out(self.employee, at(self.day, 19, 30))
+
+        self.assertEqual(attendance.work_hours, Decimal('10.50'))
+        self.assertEqual(attendance.overtime_hours, Decimal('2.50'))
+        self.assertEqual(Attendance.objects.get().check_in, at(self.day, 9))
+
+    def test_second_punch_of_a_kind_is_refused(self):
+        with self.assertRaisesMessage(punches.PunchRefused, 'No check-in record found for today.'):
+            punches.check_out(self.employee, at(self.day, 17))
+        punches.check_in(self.employee, at(self.day, 9))
+        with self.assertRaisesMessage(punches.PunchRefused, 'Already checked in today.'):
+            punches.check_in(self.employee, at(self.day, 9, 5))
+        punches.check_out(self.employee, at(self.day, 17))
+        with self.assertRaisesMessage(punches.PunchRefused, 'Already checked out today.'):
+            punches.check_out(self.employee, at(self.day, 17, 5))
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.employees = [
+            create_user(f'employee{number}@example.com', department=self.department) for number in range(3)
+        ]
+        self.loner = create_user('loner@example.com')
+        self.day = datetime(2025, 3, 3).date()
+
+    def rollups(self):
+        return (
+            sorted(DailyAttendanceRollup.objects.values_list('date', *ROLLUP_FIELDS, 'department_id'), key=str),
+            sorted(MonthlyAttendanceRollup.objects.values_list('employee_id', 'month', *ROLLUP_FIELDS), key=str),
+        )
+
+    def assertRollupsMatchRebuild(self):
+        incremental = self.rollups()
+        rebuild_rollups(self.day, self.day)
+        self.assertEqual(incremental, self.rollups())
+
+    def test_punches_keep_rollups_equal_to_a_rebuild(self):
+        Attendance.objects.create(employee=self.employees[2], date=self.day, attendance_type='work_from_home')
+        for hour, employee in enumerate(self.employees + [self.loner]):
+            punches.check_in(employee, at(self.day, 8 + hour))
+        self.assertRollupsMatchRebuild()
+
+        for employee in self.employees + [self.loner]:
+            punches.check_out(employee, at(self.day, 18, 15))
+        self.assertRollupsMatchRebuild()
+        daily = DailyAttendanceRollup.objects.get(department=self.department)
+        self.assertEqual((daily.days_recorded, daily.present_days, daily.work_from_home_days), (3, 3, 1))
+        self.assertEqual(daily.work_hours, Decimal('27.75'))
+
+    def test_check_out_after_hours_entered_by_hand(self):
+        employee = self.employees[0]
+        Attendance.objects.create(
+            employee=employee, date=self.day, check_in=at(self.day, 9), work_hours=Decimal('4.00')
+        )
+        Attendance.objects.filter(employee=employee).update(overtime_hours=Decimal('1.00'))
+
+        punches.check_out(employee, at(self.day, 19))
+
+        self.assertRollupsMatchRebuild()
+        self.assertEqual(MonthlyAttendanceRollup.objects.get(employee=employee).overtime_hours, Decimal('2.00'))
+
+    def test_punch_does_not_reaggregate_the_department(self):
+        rebuild_rollups(self.day, self.day)
+        punches.check_in(self.employees[0], at(self.day, 9))
+        with CaptureQueriesContext(connection) as queries:
+            punches.check_in(self.employees[1], at(self.day, 9))
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertFalse([sql for sql in statements if sql.startswith('DELETE')])
+        self.assertEqual(DailyAttendanceRollup.objects.get(department=self.department).present_days, 2)
+
+
+class PolicyReevaluationTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.day = datetime(2025, 3, 3).date()
+        self.addCleanup(policies.clear_policy_cache)
+
+    def test_reevaluate_writes_back_changed_rows(self):
+        employees = [create_user(f'employee{number}@example.com', department=self.department) for number in range(3)]
+        open_row = Attendance.objects.create(employee=employees[0], date=self.day, check_in=at(self.day, 9, 30))
+        late = Attendance.objects.create(
+            employee=employees[1], date=self.day, check_in=at(self.day, 9, 30), check_out=at(self.day, 19)
+        )
+        on_time = Attendance.objects.create(
+            employee=employees[2], date=self.day, check_in=at(self.day, 8, 55), check_out=at(self.day, 17)
+        )
+        AttendancePolicy.objects.create(
+            name='Engineering', description='', department=self.department,
+            work_start_time=datetime.min.time().replace(hour=9), work_end_time=datetime.min.time().replace(hour=17),
+            grace_period_minutes=10, overtime_threshold_hours=Decimal('9.00'),
+        )
+
+        # One row per batch, so some batches hold only NULL hours
+        with mock.patch.object(policies, 'BATCH_SIZE', 1):
+            self.assertEqual(policies.reevaluate(self.day, self.day), 3)
+
+        open_row.refresh_from_db()
+        late.refresh_from_db()
+        on_time.refresh_from_db()
+        self.assertEqual((open_row.is_late, open_row.work_hours), (True, None))
+        self.assertEqual((late.is_late, late.work_hours, late.overtime_hours), (True, Decimal('9.50'), Decimal('0.50')))
+        self.assertEqual((on_time.is_late, on_time.overtime_hours), (False, Decimal('0.00')))
+        self.assertEqual(policies.reevaluate(self.day, self.day), 0)
+
+
+class AbsenceTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.day = datetime(2025, 3, 3).date()
+        self.addCleanup(clear_holiday_cache)
+
+    def test_holidays_are_not_marked_absent(self):
+        off = create_user('off@example.com', department=self.department, country='France')
+        abroad = create_user('abroad@example.com', department=self.department, country='Germany')
+        elsewhere = create_user('elsewhere@example.com', country='France')
+        Holiday.objects.create(name='Team day', date=self.day, country='france', department=self.department)
+
+        mark_absences(self.day)
+        self.assertEqual(
+            set(Attendance.objects.filter(attendance_type='absent').values_list('employee_id', flat=True))
+            & {off.pk, abroad.pk, elsewhere.pk},
+            {abroad.pk, elsewhere.pk},
+        )
+        self.assertFalse(Attendance.objects.filter(employee=off).exists())
+
+        Holiday.objects.create(name='New day', date=self.day)
+        Attendance.objects.all().delete()
+        self.assertEqual(mark_absences(self.day), 0)
+
+    def test_punching_in_after_being_marked_absent(self):
+        late, batched = create_user('late@example.com', department=self.department), create_user('batched@example.com')
+        mark_absences(self.day)
+
+        attendance = punches.check_in(late, at(self.day, 11))
+        ingest.ingest_punches([(batched.pk, at(self.day, 9), None), (batched.pk, at(self.day, 17), None)])
+
+        self.assertEqual((attendance.attendance_type, attendance.check_in), ('present', at(self.day, 11)))
+        self.assertEqual(Attendance.objects.get(employee=batched).attendance_type, 'present')
+        daily = DailyAttendanceRollup.objects.get(department=self.department)
+        self.assertEqual((daily.present_days, daily.absent_days, daily.days_recorded), (1, 0, 1))
+        monthly = MonthlyAttendanceRollup.objects.get(employee=batched)
+        self.assertEqual((monthly.present_days, monthly.absent_days), (1, 0))
+        with self.assertRaisesMessage(punches.PunchRefused, 'Already checked in today.'):
+            punches.check_in(late, at(self.day, 12))
+
+
+class ConcurrentPunchTests(TransactionTestCase):
+    """Punches sent at once by several clients, as badge readers and retries do."""
+
+    EMPLOYEES = 8
+    PUNCHES_PER_EMPLOYEE = 4
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('An in-memory SQLite database refuses concurrent writers instead of queueing them')
+
+    def test_concurrent_check_ins_leave_one_row_per_employee_and_day(self):
+        employees = [create_user(f'employee{number}@example.com') for number in range(self.EMPLOYEES)]
+        day = datetime(2025, 3, 3).date()
+        jobs = [employee for employee in employees for _ in range(self.PUNCHES_PER_EMPLOYEE)]
+        barrier = threading.Barrier(len(jobs))
+        outcomes = []
+        lock = threading.Lock()
+
+        def punch(employee):
+            try:
+                barrier.wait()
+                try:
+                    punches.check_in(employee, at(day, 9))
+                    outcome = 'ok'
+                except punches.PunchRefused:
+                    outcome = 'refused'
+                except IntegrityError:
+                    outcome = 'integrity error'
+                with lock:
+                    outcomes.append((employee.pk, outcome))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=punch, args=(employee,)) for employee in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), len(jobs))
+        self.assertNotIn('integrity error', {outcome for _, outcome in outcomes})
+        for employee in employees:
+            self.assertEqual(
+                sorted(outcome for pk, outcome in outcomes if pk == employee.pk),
+                ['ok'] + ['refused'] * (self.PUNCHES_PER_EMPLOYEE - 1),
+            )
+        self.assertEqual(Attendance.objects.filter(date=day).count(), self.EMPLOYEES)
+        self.assertEqual(
+            set(Attendance.objects.filter(date=day).values_list('check_in', flat=True)), {at(day, 9)}
+        )
+        # Everyone can still check out once
+        for employee in employees:
+            punches.check_out(employee, at(day, 17) + timedelta(minutes=1))
+        self.assertFalse(Attendance.objects.filter(date=day, check_out__isnull=True).exists())
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class IngestTests(APITestCase):
+    def setUp(self):
+        self.hr = create_user('hr@example.com', role='hr')
+        self.employee = create_user('employee@example.com')
+        self.day = datetime(2025, 3, 3).date()
+        self.client.force_authenticate(self.hr)
+
+    def ingest(self, punches):
+        response = self.client.post('/api/attendance/ingest/', punches, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_punches_fold_into_one_row_per_day(self):
+        punches = [
+            {'employee': str(self.employee.pk), 'timestamp': at(self.day, 9, 5).isoformat()},
+            {'employee_id': self.employee.employee_id, 'timestamp': at(self.day, 12).isoformat()},
+            {'employee': str(self.employee.pk), 'timestamp': at(self.day, 17, 35).isoformat(), 'direction': 'out'},
+            {'employee': str(self.employee.pk), 'timestamp': at(self.day, 9, 5).isoformat()},
+            {'employee': str(self.hr.pk), 'timestamp': 'yesterday'},
+            {'employee_id': 'UNKNOWN', 'timestamp': at(self.day, 9).isoformat()},
+        ]
+
+        data = self.ingest(punches)
+
+        self.assertEqual(
+            (data['received'], data['accepted'], data['duplicates'], data['created'], data['updated']),
+            (6, 3, 1, 1, 0),
+        )
+        self.assertEqual([rejection['index'] for rejection in data['rejected']], [4, 5])
+        attendance = Attendance.objects.get()
+        self.assertEqual((attendance.check_in, attendance.check_out), (at(self.day, 9, 5), at(self.day, 17, 35)))
+        self.assertEqual(attendance.work_hours, Decimal('8.50'))
+
+    def test_replaying_a_batch_in_pieces_ends_in_the_same_row(self):
+        first = {'employee': str(self.employee.pk), 'timestamp': at(self.day, 9).isoformat()}
+        last = {'employee': str(self.employee.pk), 'timestamp': at(self.day, 18).isoformat()}
+        self.ingest([last])
+        data = self.ingest([first, last])
+        self.assertEqual((data['created'], data['updated']), (0, 1))
+        self.assertEqual(self.ingest([first, last])['updated'], 0)
+
+        attendance = Attendance.objects.get()
+        self.assertEqual((attendance.check_in, attendance.check_out), (at(self.day, 9), at(self.day, 18)))
+
+    def test_todays_rows_are_published_to_the_presence_board(self):
+        department = Department.objects.create(name='Engineering', code='ENG')
+        colleague = create_user('colleague@example.com', department=department)
+        today = timezone.localdate()
+        layer = mock.Mock(group_send=mock.AsyncMock())
+
+        with mock.patch('attendance.presence.get_channel_layer', return_value=layer):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.ingest([
+                    {'employee': str(colleague.pk), 'timestamp': at(today, 9).isoformat()},
+                    {'employee': str(self.employee.pk), 'timestamp': at(self.day, 9).isoformat()},
+                ])
+
+        layer.group_send.assert_awaited_once()
+        group, event = layer.group_send.await_args.args
+        self.assertEqual(group, f'presence.department.{department.pk}')
+        self.assertEqual(
+            (event['type'], event['employee'], event['employee_name'], event['status'], event['date']),
+            ('presence.event', str(colleague.pk), 'Test colleague', 'in', today.isoformat()),
+        )
+
+    def test_employee_cannot_ingest(self):
+        self.client.force_authenticate(self.employee)
+        response = self.client.post('/api/attendance/ingest/', [], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class PresenceFeedTests(TransactionTestCase):
+    """The WebSocket feed, authenticated by an access token as browsers send it.
+
+    A TransactionTestCase: channels closes connections left in a transaction
+    before each database call.
+    """
+
+    application = JWTAuthMiddleware(AuthMiddlewareStack(URLRouter(websocket_urlpatterns)))
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.other_department = Department.objects.create(name='Sales', code='SAL')
+        self.manager = create_user('manager@example.com', role='manager', department=self.department)
+        self.employee = create_user('employee@example.com', department=self.department)
+        self.outsider = create_user('outsider@example.com', department=self.other_department)
+        self.today = timezone.localdate()
+        Attendance.objects.create(employee=self.employee, date=self.today, check_in=at(self.today, 9))
+        patcher = mock.patch('attendance.consumers.board', PresenceBoard())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def connect(self, user, **params):
+        if user is not None:
+            params['token'] = str(AccessToken.for_user(user))
+        communicator = WebsocketCommunicator(self.application, f'/ws/attendance/presence/?{urlencode(params)}')
+        connected, code = await communicator.connect()
+        return communicator, connected, code
+
+    async def test_a_valid_token_gets_todays_snapshot(self):
+        communicator, connected, _ = await self.connect(self.manager)
+
+        self.assertTrue(connected)
+        snapshot = await communicator.receive_json_from()
+        self.assertEqual((snapshot['type'], snapshot['date']), ('snapshot', self.today.isoformat()))
+        self.assertEqual(
+            [(entry['employee'], entry['status']) for entry in snapshot['presence']], [(str(self.employee.pk), 'in')]
+        )
+        await communicator.disconnect()
+
+    async def test_connections_without_a_valid_token_are_refused(self):
+        _, connected, code = await self.connect(None)
+        self.assertEqual((connected, code), (False, 4401))
+        _, connected, code = await self.connect(None, token='not-a-token')
+        self.assertEqual((connected, code), (False, 4401))
+
+    async def test_employees_cannot_watch_another_department(self):
+        _, connected, code = await self.connect(self.outsider, department=str(self.department.pk))
+        self.assertEqual((connected, code), (False, 4403))
+
+        hr = await database_sync_to_async(create_user)('hr@example.com', role='hr')
+        communicator, connected, _ = await self.connect(hr, department=str(self.other_department.pk))
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['presence'], [])
+        await communicator.disconnect()
+
+    async def test_later_subscribers_get_the_snapshot_without_reading_attendance(self):
+        with mock.patch('attendance.consumers.load_presence', wraps=load_presence) as load:
+            first, _, _ = await self.connect(self.manager)
+            loaded = await first.receive_json_from()
+            second, _, _ = await self.connect(self.manager)
+            snapshot = await second.receive_json_from()
+        await first.disconnect()
+        await second.disconnect()
+
+        load.assert_called_once_with([str(self.department.pk)])
+        self.assertEqual(snapshot, loaded)
+
+    async def test_punches_are_relayed_to_the_department_watchers(self):
+        communicator, _, _ = await self.connect(self.manager)
+        await communicator.receive_json_from()
+
+        await database_sync_to_async(punches.check_in)(self.manager, timezone.now())
+
+        message = await communicator.receive_json_from()
+        self.assertEqual(
+            (message['type'], message['employee'], message['status']), ('presence', str(self.manager.pk), 'in')
+        )
+        await communicator.disconnect()
+
+
+class ReportTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.first = create_user('first@example.com', department=self.department)
+        self.second = create_user('second@example.com', department=self.department)
+        # Monday 3 to Friday 7 March 2025
+        for offset in range(5):
+            day = datetime(2025, 3, 3 + offset).date()
+            Attendance.objects.create(employee=self.first, date=day, check_in=at(day, 9), check_out=at(day, 18))
+        Attendance.objects.create(
+            employee=self.second, date=datetime(2025, 3, 3).date(), attendance_type='work_from_home'
+        )
+        Attendance.objects.create(employee=self.second, date=datetime(2025, 3, 4).date(), attendance_type='absent')
+        rebuild_rollups(datetime(2025, 3, 1).date(), datetime(2025, 3, 31).date())
+
+    def test_employee_report_from_rollups_matches_attendances(self):
+        start, end = datetime(2025, 3, 1).date(), datetime(2025, 3, 31).date()
+        from_rollups = list(reports.employee_report(start, end, self.department))
+        # A range ending a day early is aggregated from Attendance instead
+        from_attendances = list(reports.employee_report(start, datetime(2025, 3, 30).date(), self.department))
+
+        self.assertEqual(len(from_rollups), 2)
+        for rollup_row, attendance_row in zip(from_rollups, from_attendances):
+            for column in ('employee', 'present_days', 'work_from_home_days', 'total_work_hours'):
+                self.assertEqual(rollup_row[column], attendance_row[column])
+        first = next(row for row in from_rollups if row['employee'] == self.first.pk)
+        self.assertEqual((first['total_days'], first['present_days'], first['absent_days']), (21, 5, 16))
+        self.assertEqual(first['total_work_hours'], 45.0)
+
+    def test_department_and_day_reports(self):
+        start, end = datetime(2025, 3, 3).date(), datetime(2025, 3, 7).date()
+        department, = reports.department_report(start, end, self.department)
+        self.assertEqual((department['employee_count'], department['present_days']), (2, 6))
+        self.assertEqual(department['absent_days'], 4)
+        self.assertEqual(department['attendance_percentage'], 60.0)
+
+        days = {row['date']: row for row in reports.day_report(start, end, self.department)}
+        self.assertEqual(days[start]['present_days'], 2)
+        self.assertEqual(days[datetime(2025, 3, 4).date()]['marked_absent'], 1)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ReportExportTests(APITestCase):
+    def test_csv_export_streams_every_row(self):
+        department = Department.objects.create(name='Engineering', code='ENG')
+        user = create_user('first@example.com', department=department)
+        create_user('second@example.com', department=department)
+        self.client.force_authenticate(user)
+
+        response = self.client.get('/api/attendance/report/', {
+            'start_date': '2025-03-03', 'end_date': '2025-03-07',
+            'department': str(department.pk), 'group_by': 'department', 'export': 'csv',
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('attendance_department_20250303_20250307.csv', response['Content-Disposition'])
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(','), list(reports.DEPARTMENT_COLUMNS))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[1].split(',')[2:4], ['2', '5'])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class PaginationTests(APITestCase):
+    def setUp(self):
+        self.employee = create_user('employee@example.com')
+        self.other = create_user('other@example.com')
+        self.client.force_authenticate(self.employee)
+        # Many rows share a date, and some a check-in or none at all
+        for employee in (self.employee, self.other):
+            for offset in range(4):
+                day = datetime(2025, 3, 3 + offset).date()
+                Attendance.objects.create(employee=employee, date=day, check_in=at(day, 9) if offset % 2 else None)
+        self.order = list(Attendance.objects.order_by('-date', '-check_in', '-id').values_list('id', flat=True))
+
+    def walk(self, url, link):
+        ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            url = response.data[link]
+            pages += 1
+        return ids, pages
+
+    def test_pages_follow_the_key_order_both_ways(self):
+        ids, pages = self.walk('/api/attendance/?page_size=3', 'next')
+        self.assertEqual(ids, self.order)
+        self.assertEqual(pages, 3)
+
+        last = self.client.get('/api/attendance/?page_size=3')
+        while last.data['next']:
+            last = self.client.get(last.data['next'])
+        self.assertIsNone(last.data['next'])
+        back, _ = self.walk(last.data['previous'], 'previous')
+        # Each page still lists its rows newest first
+        self.assertEqual(back, self.order[3:6] + self.order[:3])
+
+    def test_employee_listing_pages_one_employee(self):
+        ids, _ = self.walk(f'/api/attendance/employee/{self.other.pk}/?page_size=2', 'next')
+        expected = Attendance.objects.filter(employee=self.other).order_by('-date', '-check_in', '-id')
+        self.assertEqual(ids, list(expected.values_list('id', flat=True)))
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get('/api/attendance/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ArchiveReadTests(APITestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.employee = create_user('employee@example.com', department=self.department)
+        self.client.force_authenticate(self.employee)
+        # Monday 30 December 2024 to Friday 3 January 2025
+        for offset in range(5):
+            day = datetime(2024, 12, 30).date() + timedelta(days=offset)
+            Attendance.objects.create(
+                employee=self.employee, date=day, check_in=at(day, 9), check_out=at(day, 18),
+                attendance_type='work_from_home' if offset == 1 else 'present',
+            )
+        self.start, self.end = datetime(2024, 12, 16).date(), datetime(2025, 1, 10).date()
+        self.report = list(reports.employee_report(self.start, self.end, self.department))
+        self.listed = list(Attendance.objects.order_by('-date', '-check_in', '-id').values_list('id', flat=True))
+        list(archive_year(2024, datetime(2025, 6, 1).date(), batch_size=1))
+
+    def test_archive_moved_the_year(self):
+        self.assertEqual(AttendanceArchive.objects.count(), 2)
+        self.assertEqual(Attendance.objects.count(), 3)
+        self.assertIsNotNone(Attendance.objects.between(self.start, self.end).query.combinator)
+
+    def test_partial_range_report_reads_the_archive(self):
+        report = reports.employee_report(self.start, self.end, self.department)
+        self.assertEqual(report, self.report)
+        self.assertEqual((report[0]['present_days'], report[0]['work_from_home_days']), (5, 1))
+        self.assertEqual(report[0]['total_work_hours'], 45.0)
+
+    def test_employee_listing_pages_across_the_archive(self):
+        url = f'/api/attendance/employee/{self.employee.pk}/'
+        ids = []
+        response = self.client.get(url, {'start_date': '2024-12-16', 'end_date': '2025-01-10', 'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(ids, self.listed)
+
+        previous = self.client.get(response.data['previous'])
+        self.assertEqual([row['id'] for row in previous.data['results']], self.listed[2:4])
+        # Without a range the listing stays on the current attendances
+        self.assertEqual(len(self.client.get(url).data['results']), 3)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AttendanceViewSet, AttendancePolicyViewSet
+from .views import AttendanceViewSet, AttendancePolicyViewSet, AttendanceReportView, EmployeeAttendanceView
 
 app_name = 'attendance'
 
@@ -9,5 +9,7 @@ router.register('policies', AttendancePolicyViewSet)
 router.register('', AttendanceViewSet)
 
 urlpatterns = [
+    path('report/', AttendanceReportView.as_view(), name='attendance-report'),
+    path('employee/<uuid:employee_id>/', EmployeeAttendanceView.as_view(), name='employee-attendance'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,11 +1,21 @@
 from rest_framework import generics, status, permissions, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from django.db.models import Q
+from django.db.models import Q, QuerySet
 from datetime import datetime, timedelta
+from accounts.permissions import IsHRStaff
+from . import ingest, punches, reports
 from .models import Attendance, AttendancePolicy
-from .serializers import AttendanceSerializer, AttendancePolicySerializer, AttendanceReportSerializer, EmployeeAttendanceSerializer
+from .pagination import AttendanceCursorPagination
+from .parsers import NDJSONParser
+from .serializers import (
+    AttendanceSerializer, AttendancePolicySerializer, AttendanceReportSerializer,
+    DailyAttendanceReportSerializer, DepartmentAttendanceReportSerializer, EmployeeAttendanceSerializer,
+)
 
 class AttendancePolicyViewSet(viewsets.ModelViewSet):
     queryset = AttendancePolicy.objects.all()
@@ -16,9 +26,10 @@ class AttendanceViewSet(viewsets.ModelViewSet):
     queryset = Attendance.objects.all()
     serializer_class = AttendanceSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = AttendanceCursorPagination
 
     def get_queryset(self):
-        queryset = Attendance.objects.all()
+        queryset = Attendance.objects.select_related('employee')
         employee = self.request.query_params.get('employee', None)
         date = self.request.query_params.get('date', None)
         status = self.request.query_params.get('status', None)
@@ -38,103 +49,118 @@ class AttendanceViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['post'])
     def check_in(self, request):
-        employee = request.user.employee
-        now = timezone.now()
-        
-        # Check if already checked in today
-        existing_attendance = Attendance.objects.filter(
-            employee=employee,
-            date=now.date()
-        ).first()
-
-        if existing_attendance and existing_attendance.check_in:
-            return Response(
-                {"detail": "Already checked in today."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if existing_attendance:
-            existing_attendance.check_in = now
-            existing_attendance.save()
-            serializer = self.get_serializer(existing_attendance)
-        else:
-            attendance = Attendance.objects.create(
-                employee=employee,
-                date=now.date(),
-                check_in=now
-            )
-            serializer = self.get_serializer(attendance)
-
+        try:
+            attendance = punches.check_in(request.user, timezone.now())
+        except punches.PunchRefused as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = self.get_serializer(attendance)
         return Response(serializer.data)
 
     @action(detail=False, methods=['post'])
     def check_out(self, request):
-        employee = request.user.employee
-        now = timezone.now()
-        
         try:
-            attendance = Attendance.objects.get(
-                employee=employee,
-                date=now.date()
-            )
-        except Attendance.DoesNotExist:
-            return Response(
-                {"detail": "No check-in record found for today."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        if attendance.check_out:
-            return Response(
-                {"detail": "Already checked out today."},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        attendance.check_out = now
-        attendance.save()
+            attendance = punches.check_out(request.user, timezone.now())
+        except punches.PunchRefused as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         serializer = self.get_serializer(attendance)
         return Response(serializer.data)
 
+    @action(
+        detail=False,
+        methods=['post'],
+        parser_classes=[JSONParser, NDJSONParser],
+        permission_classes=[permissions.IsAuthenticated, IsHRStaff],
+    )
+    def ingest(self, request):
+        """Bulk-load raw clock events, as a JSON list or NDJSON, from badge readers and kiosks."""
+        items = request.data
+        if isinstance(items, dict):
+            items = items.get('punches')
+        try:
+            punch_list, rejected = ingest.parse_punches(items)
+        except ingest.IngestError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        created, updated = ingest.ingest_punches(punch_list)
+        return Response({
+            'received': len(items),
+            'accepted': len(punch_list),
+            'duplicates': len(items) - len(punch_list) - len(rejected),
+            'rejected': rejected,
+            'created': len(created),
+            'updated': len(updated),
+        })
+
 class EmployeeAttendanceView(generics.ListAPIView):
+    """An employee's attendances; with ``?start_date=&end_date=`` also those of archived years."""
     serializer_class = EmployeeAttendanceSerializer
     permission_classes = (permissions.IsAuthenticated,)
+    pagination_class = AttendanceCursorPagination
 
     def get_queryset(self):
         employee_id = self.kwargs['employee_id']
         start_date = self.request.query_params.get('start_date', None)
         end_date = self.request.query_params.get('end_date', None)
 
-        queryset = Attendance.objects.filter(employee_id=employee_id)
-
         if start_date and end_date:
             try:
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
-                queryset = queryset.filter(date__range=[start, end])
+                return Attendance.objects.between(start, end, employee_id=employee_id)
             except ValueError:
                 pass
 
-        return queryset
+        return Attendance.objects.filter(employee_id=employee_id)
 
 class AttendanceReportView(generics.ListAPIView):
-    serializer_class = AttendanceReportSerializer
+    """Attendance totals per employee, or per department or day with ``?group_by=department|day``.
+
+    Defaults to the current month; ``?export=csv`` streams the whole report as CSV.
+    """
     permission_classes = (permissions.IsAuthenticated,)
 
-    def get_queryset(self):
-        department = self.request.query_params.get('department', None)
+    def get_report(self):
+        group_by = self.request.query_params.get('group_by', 'employee')
+        if group_by not in reports.REPORTS:
+            raise ValidationError({"group_by": f"Choose one of: {', '.join(reports.REPORTS)}."})
+        return group_by
+
+    def get_range(self):
         start_date = self.request.query_params.get('start_date', None)
         end_date = self.request.query_params.get('end_date', None)
+        today = timezone.localdate()
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today.replace(day=1)
+            end = datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else today
+        except ValueError:
+            raise ValidationError({"detail": "Dates must be in YYYY-MM-DD format."})
+        if end < start:
+            raise ValidationError({"detail": "end_date must not be before start_date."})
+        return start, end
+
+    def get_serializer_class(self):
+        return {
+            'department': DepartmentAttendanceReportSerializer,
+            'day': DailyAttendanceReportSerializer,
+        }.get(self.get_report(), AttendanceReportSerializer)
 
-        queryset = Attendance.objects.all()
-
-        if department:
-            queryset = queryset.filter(employee__department_id=department)
-
-        if start_date and end_date:
-            try:
-                start = datetime.strptime(start_date, '%Y-%m-%d').date()
-                end = datetime.strptime(end_date, '%Y-%m-%d').date()
-                queryset = queryset.filter(date__range=[start, end])
-            except ValueError:
-                pass
-
-        return queryset
+    def get_queryset(self):
+        report, _ = reports.REPORTS[self.get_report()]
+        start, end = self.get_range()
+        return report(start, end, self.request.query_params.get('department', None))
+
+    def list(self, request, *args, **kwargs):
+        if request.query_params.get('export') != 'csv':
+            return super().list(request, *args, **kwargs)
+        _, columns = reports.REPORTS[self.get_report()]
+        start, end = self.get_range()
+        rows = self.get_queryset()
+        if isinstance(rows, QuerySet):
+            rows = rows.iterator(chunk_size=2000)
+        response = StreamingHttpResponse(
+            reports.stream_csv(rows, columns),
+            content_type='text/csv',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="attendance_{self.get_report()}_{start:%Y%m%d}_{end:%Y%m%d}.csv"'
+        )
+        return response
@@ -0,0 +1,16 @@
+"""
+Celery application for the HR backend.
+
+Configuration is read from the CELERY_* entries in backend/settings.py and
+tasks are discovered in each installed app's ``tasks`` module.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+app = Celery('backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
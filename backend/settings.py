@@ -5,6 +5,7 @@ Django settings for HR Management System
 import os
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -84,6 +85,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # A file, unlike the default in-memory test database, lets concurrency tests write from several threads
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -109,6 +112,9 @@ CHANNEL_LAYERS = {
         },
     },
 }
+# Single-process layer without Redis (tests, local development)
+if os.getenv('CHANNEL_LAYERS_IN_MEMORY', 'False') == 'True':
+    CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
 
 # Celery Configuration
 CELERY_BROKER_URL = f'{REDIS_URL}/0'
@@ -118,6 +124,24 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 CELERY_BEAT_SCHEDULER = 'django_celery_beat.schedulers:DatabaseScheduler'
+CELERY_BEAT_SCHEDULE = {
+    # Materialize yesterday's absences once the day is over
+    'mark-absent-employees': {
+        'task': 'attendance.tasks.mark_absent_employees',
+        'schedule': crontab(hour=1, minute=0),
+    },
+}
+# Run tasks in-process instead of through the broker (tests, local development)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False') == 'True'
+CELERY_TASK_EAGER_PROPAGATES = CELERY_TASK_ALWAYS_EAGER
+
+# Payroll runs
+PAYROLL_CHUNK_SIZE = int(os.getenv('PAYROLL_CHUNK_SIZE', '2000'))
+
+# Leave submissions: least share of a department working on any day, and
+# whether falling below it warns ('warn'), refuses the request ('block') or is not checked ('off')
+LEAVE_MIN_STAFFING_RATIO = float(os.getenv('LEAVE_MIN_STAFFING_RATIO', '0.5'))
+LEAVE_COVERAGE_ENFORCEMENT = os.getenv('LEAVE_COVERAGE_ENFORCEMENT', 'warn')
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
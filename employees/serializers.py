@@ -25,4 +25,13 @@ class DepartmentSerializer(serializers.ModelSerializer):
 class PositionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Position
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class EmployeeListSerializer(serializers.ModelSerializer):
+    full_name = serializers.CharField(source='get_full_name', read_only=True)
+    department_name = serializers.CharField(source='department.name', read_only=True, default=None)
+
+    class Meta:
+        model = User
+        fields = ('id', 'employee_id', 'full_name', 'department_name')
+        read_only_fields = fields
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import LeaveType, LeaveBalance, LeaveRequest
+from .models import LeaveType, LeaveBalance, LeaveRequest, Holiday
 
 @admin.register(LeaveType)
 class LeaveTypeAdmin(admin.ModelAdmin):
@@ -43,3 +43,10 @@ class LeaveRequestAdmin(admin.ModelAdmin):
         if obj and obj.status != 'pending':
             return self.readonly_fields + ('employee', 'leave_type', 'start_date', 'end_date', 'reason')
         return self.readonly_fields
+
+@admin.register(Holiday)
+class HolidayAdmin(admin.ModelAdmin):
+    list_display = ('name', 'date', 'country', 'department')
+    list_filter = ('country', 'department')
+    search_fields = ('name',)
+    date_hierarchy = 'date'
@@ -0,0 +1,151 @@
+"""
+Business-day arithmetic for leave durations.
+
+A leave lasts the weekdays from its start to its end date, both included,
+minus the holidays of the employee's calendar falling on them. Weekdays
+are counted in closed form, whole weeks first and then the remainder, and
+holidays by bisecting a sorted array of day ordinals, so a duration costs
+the same whatever the length of the leave. ``business_days_many`` does
+the same arithmetic over numpy arrays to recompute many requests at once.
+
+The calendar of an employee holds the holidays of their country (or of
+every country) and of their department (or of every department). Holidays
+are loaded once per process and reused for at most
+LEAVE_HOLIDAY_CACHE_TTL seconds; saving or deleting one clears the cache
+of the process that did it right away.
+"""
+import time
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Holiday, LeaveRequest
+
+HOLIDAY_CACHE_TTL = getattr(settings, 'LEAVE_HOLIDAY_CACHE_TTL', 300)
+
+BATCH_SIZE = 1000
+
+_holidays = {}
+
+
+def _country(country):
+    return (country or '').strip().casefold()
+
+
+def _weekdays(start, end):
+    """Monday to Friday days from ordinal ``start`` to ``end``, both included."""
+    days = end - start + 1
+    if days <= 0:
+        return 0
+    weeks, rest = divmod(days, 7)
+    weekday = (start + 6) % 7
+    # Weekdays among the ``rest`` days left after the whole weeks, in this week and the next
+    return weeks * 5 + max(0, min(weekday + rest, 5) - weekday) + max(0, weekday + rest - 7)
+
+
+def weekdays_between(start, end):
+    """Monday to Friday days from ``start`` to ``end``, both included."""
+    return _weekdays(start.toordinal(), end.toordinal())
+
+
+class HolidayCalendar:
+    """The holidays of one country and department falling on weekdays, as sorted day ordinals."""
+
+    def __init__(self, ordinals):
+        self.ordinals = sorted({ordinal for ordinal in ordinals if (ordinal + 6) % 7 < 5})
+        self.array = np.array(self.ordinals, dtype=np.int64)
+
+    def holidays_between(self, start, end):
+        return bisect_right(self.ordinals, end.toordinal()) - bisect_left(self.ordinals, start.toordinal())
+
+    def business_days(self, start, end):
+        if end < start:
+            return 0
+        return weekdays_between(start, end) - self.holidays_between(start, end)
+
+    def business_days_many(self, starts, ends):
+        """Business days of each span of the ``starts`` and ``ends`` ordinal arrays."""
+        days = np.maximum(ends - starts + 1, 0)
+        weeks, rest = np.divmod(days, 7)
+        weekday = (starts + 6) % 7
+        weekdays = (
+            weeks * 5
+            + np.maximum(0, np.minimum(weekday + rest, 5) - weekday)
+            + np.maximum(0, weekday + rest - 7)
+        )
+        holidays = np.searchsorted(self.array, ends, side='right') - np.searchsorted(self.array, starts, side='left')
+        return np.where(days > 0, weekdays - holidays, 0)
+
+
+def _load():
+    return list(Holiday.objects.values_list('date', 'country', 'department_id'))
+
+
+def _cached():
+    cached = _holidays.get('loaded')
+    if cached and time.monotonic() - cached[0] < HOLIDAY_CACHE_TTL:
+        return cached[1]
+    loaded = {'holidays': _load(), 'calendars': {}}
+    _holidays['loaded'] = (time.monotonic(), loaded)
+    return loaded
+
+
+def clear_holiday_cache():
+    _holidays.clear()
+
+
+def calendar_for(country='', department_id=None):
+    """The HolidayCalendar of employees of ``country`` and ``department_id``."""
+    loaded = _cached()
+    key = (_country(country), department_id)
+    calendar = loaded['calendars'].get(key)
+    if calendar is None:
+        calendar = HolidayCalendar(
+            day.toordinal() for day, holiday_country, holiday_department in loaded['holidays']
+            if (not holiday_country or _country(holiday_country) == key[0])
+            and (holiday_department is None or holiday_department == department_id)
+        )
+        loaded['calendars'][key] = calendar
+    return calendar
+
+
+def business_days(start, end, country='', department_id=None):
+    """Business days from ``start`` to ``end``, both included, for employees of ``country`` and ``department_id``."""
+    return calendar_for(country, department_id).business_days(start, end)
+
+
+def business_days_many(spans):
+    """Business days of each (start, end, country, department_id) of ``spans``, as a numpy array."""
+    spans = list(spans)
+    durations = np.zeros(len(spans), dtype=np.int64)
+    if not spans:
+        return durations
+    starts = np.fromiter((span[0].toordinal() for span in spans), dtype=np.int64, count=len(spans))
+    ends = np.fromiter((span[1].toordinal() for span in spans), dtype=np.int64, count=len(spans))
+    # One vectorized pass per calendar
+    positions = {}
+    for position, (_, _, country, department_id) in enumerate(spans):
+        positions.setdefault((_country(country), department_id), []).append(position)
+    for (country, department_id), indexes in positions.items():
+        indexes = np.array(indexes, dtype=np.int64)
+        durations[indexes] = calendar_for(country, department_id).business_days_many(starts[indexes], ends[indexes])
+    return durations
+
+
+def recompute_durations(requests):
+    """Bring the total_days of the ``requests`` queryset up to date; returns the number changed."""
+    rows = list(requests.order_by('pk').values_list(
+        'pk', 'start_date', 'end_date', 'employee__country', 'employee__department_id', 'total_days'
+    ))
+    if not rows:
+        return 0
+    durations = business_days_many(row[1:5] for row in rows)
+    now = timezone.now()
+    changed = [
+        LeaveRequest(pk=row[0], total_days=int(duration), updated_at=now)
+        for row, duration in zip(rows, durations) if row[5] != duration
+    ]
+    LeaveRequest.objects.bulk_update(changed, ['total_days', 'updated_at'], batch_size=BATCH_SIZE)
+    return len(changed)
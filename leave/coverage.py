@@ -0,0 +1,124 @@
+"""
+Department coverage check for leave submissions.
+
+A new request is checked against the approved leaves of the employee's
+department: on each business day of the request (on the employee's
+holiday calendar), the share of the department's active employees still
+working once the requester is out must stay at or above
+LEAVE_MIN_STAFFING_RATIO. LEAVE_COVERAGE_ENFORCEMENT says what happens
+to the days below it: 'warn' returns them with the created request,
+'block' refuses the request, 'off' skips the check.
+
+The number of employees out on each day is precomputed per department
+and month: each employee's approved leaves are merged into disjoint
+spans, added to a difference array (+1 on a span's first day, -1 after
+its last) and summed up. The months are cached with the department's
+active headcount under the team calendar generation of the department
+(see leave.team_calendar), so approvals invalidate them too, and a check
+then costs a few cache reads and numpy operations whatever the size of
+the department.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+from .business_days import calendar_for
+from .models import LeaveRequest
+from .team_calendar import CACHE_TTL, department_generation
+
+User = get_user_model()
+
+MIN_STAFFING_RATIO = getattr(settings, 'LEAVE_MIN_STAFFING_RATIO', 0.5)
+
+# 'warn', 'block' or 'off'
+COVERAGE_ENFORCEMENT = getattr(settings, 'LEAVE_COVERAGE_ENFORCEMENT', 'warn')
+
+
+def _months(start, end):
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + timedelta(days=31)).replace(day=1)
+
+
+def _out_per_day(department_id, month):
+    """Employees of ``department_id`` on approved leave on each day of ``month``, as an array."""
+    days = monthrange(month.year, month.month)[1]
+    end = month.replace(day=days)
+    leaves = LeaveRequest.objects.filter(
+        status='approved',
+        employee__department_id=department_id,
+        # Only active employees make up the headcount the leaves are taken from
+        employee__is_active=True,
+        start_date__lte=end,
+        end_date__gte=month,
+    ).values_list('employee_id', 'start_date', 'end_date').order_by('employee_id', 'start_date')
+
+    diff = np.zeros(days + 1, dtype=np.int64)
+    current = None
+    for employee_id, start_date, end_date in leaves:
+        first, last = max((start_date - month).days, 0), min((end_date - month).days, days - 1)
+        if current and current[0] == employee_id and first <= current[2] + 1:
+            # Overlapping or adjacent leaves of one employee count them once
+            current[2] = max(current[2], last)
+            continue
+        if current:
+            diff[current[1]] += 1
+            diff[current[2] + 1] -= 1
+        current = [employee_id, first, last]
+    if current:
+        diff[current[1]] += 1
+        diff[current[2] + 1] -= 1
+    return np.cumsum(diff[:-1])
+
+
+def _department_month(department_id, month):
+    """(active headcount, out per day array) of ``department_id`` in ``month``, from the cache if there."""
+    key = f'leave:coverage:{department_id}:{department_generation(department_id)}:{month:%Y-%m}'
+    cached = cache.get(key)
+    if cached is None:
+        headcount = User.objects.filter(department_id=department_id, is_active=True).count()
+        cached = (headcount, _out_per_day(department_id, month))
+        cache.set(key, cached, CACHE_TTL)
+    return cached
+
+
+def coverage_shortfalls(employee, start, end, ratio=None):
+    """Business days from ``start`` to ``end`` on which ``employee`` being out leaves their department understaffed.
+
+    Returns a list of dicts with the date, the employees still working and
+    the department's headcount, empty when coverage holds or the employee
+    has no department.
+    """
+    department_id = employee.department_id
+    if department_id is None or end < start:
+        return []
+    ratio = MIN_STAFFING_RATIO if ratio is None else ratio
+
+    months = [_department_month(department_id, month) for month in _months(start, end)]
+    headcount = months[0][0]
+    if not headcount:
+        return []
+    offset = start.day - 1
+    out = np.concatenate([array for _, array in months])[offset:offset + (end - start).days + 1]
+
+    ordinals = np.arange(start.toordinal(), end.toordinal() + 1)
+    # Days the requester is already out on don't take anyone else away
+    already_out = np.zeros(len(ordinals), dtype=bool)
+    for start_date, end_date in LeaveRequest.objects.filter(
+        employee=employee, status='approved', start_date__lte=end, end_date__gte=start
+    ).values_list('start_date', 'end_date').order_by():
+        already_out[max((start_date - start).days, 0):(end_date - start).days + 1] = True
+
+    working = headcount - out - (~already_out).astype(np.int64)
+    holidays = calendar_for(employee.country, department_id).array
+    business = ((ordinals + 6) % 7 < 5) & ~np.isin(ordinals, holidays)
+    short = np.flatnonzero(business & (working < ratio * headcount))
+    return [
+        {'date': date.fromordinal(int(ordinals[day])), 'working': int(working[day]), 'headcount': headcount}
+        for day in short
+    ]
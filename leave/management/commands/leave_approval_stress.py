@@ -0,0 +1,130 @@
+import random
+import threading
+from collections import Counter
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection
+
+from leave.models import LeaveBalance, LeaveRequest, LeaveType
+from leave.reviews import ReviewRefused, review
+
+User = get_user_model()
+
+EMAIL_DOMAIN = 'leavestress.invalid'
+
+LEAVE_TYPE_NAME = 'Approval stress test'
+
+class Command(BaseCommand):
+    help = (
+        'Approve one-day leave requests from parallel threads, each request twice, '
+        'and check that no balance charge was lost or overdrawn'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=40, help='Pending requests per employee')
+        parser.add_argument('--days', type=int, default=25, help='Balance of each employee')
+        parser.add_argument('--workers', type=int, default=16, help='Concurrent approving threads')
+        parser.add_argument('--keep', action='store_true', help='Keep the stress test employees and requests')
+
+    def handle(self, *args, **options):
+        employees, leave_type = self._setup(options['employees'], options['requests'], options['days'])
+        reviewer = employees[0]
+        requests = list(LeaveRequest.objects.filter(leave_type=leave_type))
+        # Two reviewers for every request, in random order
+        schedule = requests * 2
+        random.shuffle(schedule)
+
+        outcomes = self._approve(schedule, reviewer, options['workers'])
+        failures = self._check(leave_type, options['days'])
+
+        self.stdout.write(
+            f"{outcomes['approved']} approved, {outcomes['refused']} refused, "
+            f"{outcomes['error']} database errors"
+        )
+        for failure in failures:
+            self.stdout.write(self.style.ERROR(failure))
+        if not failures:
+            self.stdout.write(self.style.SUCCESS('Every approval charged its balance exactly once'))
+
+        if not options['keep']:
+            leave_type.delete()
+            User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').delete()
+
+    def _setup(self, employees, requests, days):
+        LeaveType.objects.filter(name=LEAVE_TYPE_NAME).delete()
+        leave_type = LeaveType.objects.create(name=LEAVE_TYPE_NAME, days_allowed=days)
+        existing = User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').count()
+        User.objects.bulk_create([
+            User(
+                email=f'employee{index}@{EMAIL_DOMAIN}',
+                employee_id=f'LEAVESTRESS{index}',
+                first_name='Leave',
+                last_name=f'Stress {index}',
+            )
+            for index in range(existing, employees)
+        ])
+        employees = list(User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').order_by('email')[:employees])
+        # A day of its own, a Monday, so holidays and real balances stay out of it
+        day = date(2000, 1, 3)
+        LeaveBalance.objects.bulk_create([
+            LeaveBalance(
+                employee=employee, leave_type=leave_type, year=day.year, total_days=days, remaining_days=days
+            )
+            for employee in employees
+        ])
+        LeaveRequest.objects.bulk_create([
+            LeaveRequest(
+                employee=employee, leave_type=leave_type, start_date=day, end_date=day,
+                total_days=1, reason='Stress test'
+            )
+            for employee in employees for _ in range(requests)
+        ])
+        return employees, leave_type
+
+    def _approve(self, schedule, reviewer, workers):
+        outcomes = Counter()
+        lock = threading.Lock()
+        pending = iter(schedule)
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        leave_request = next(pending, None)
+                    if leave_request is None:
+                        return
+                    try:
+                        review(leave_request, 'approved', reviewer)
+                        outcome = 'approved'
+                    except ReviewRefused:
+                        outcome = 'refused'
+                    except DatabaseError:
+                        outcome = 'error'
+                    with lock:
+                        outcomes[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def _check(self, leave_type, days):
+        approved = Counter(
+            LeaveRequest.objects.filter(leave_type=leave_type, status='approved').values_list('employee_id', flat=True)
+        )
+        failures = []
+        for balance in LeaveBalance.objects.filter(leave_type=leave_type).select_related('employee'):
+            charged = approved[balance.employee_id]
+            if balance.used_days != charged or balance.remaining_days != days - charged or charged > days:
+                failures.append(
+                    f'{balance.employee}: {charged} approved days, balance used {balance.used_days} '
+                    f'and remaining {balance.remaining_days} of {days}'
+                )
+        return failures
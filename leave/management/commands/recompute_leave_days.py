@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from leave.business_days import recompute_durations
+from leave.models import LeaveRequest
+
+class Command(BaseCommand):
+    help = 'Recompute the business days of leave requests from the current holiday calendars'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--status', action='append', choices=[choice for choice, _ in LeaveRequest.STATUS_CHOICES],
+            help='Only requests with this status (repeatable; defaults to pending, decided requests '
+                 'keep the duration their balance was charged with)'
+        )
+
+    def handle(self, *args, **options):
+        statuses = options['status'] or ['pending']
+        changed = recompute_durations(LeaveRequest.objects.filter(status__in=statuses))
+        self.stdout.write(self.style.SUCCESS(f'{changed} leave requests updated'))
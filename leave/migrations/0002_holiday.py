@@ -0,0 +1,33 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0002_remove_department_manager_alter_department_options_and_more'),
+        ('leave', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Holiday',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('date', models.DateField()),
+                ('country', models.CharField(blank=True, help_text='Leave empty for every country', max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('department', models.ForeignKey(blank=True, help_text='Leave empty for every department', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='holidays', to='employees.department')),
+            ],
+            options={
+                'verbose_name': 'holiday',
+                'verbose_name_plural': 'holidays',
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date'], name='leave_holiday_date_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0002_holiday'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['status', 'end_date', 'start_date'], name='leave_request_overlap_idx'),
+        ),
+    ]
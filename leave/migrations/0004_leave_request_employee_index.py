@@ -0,0 +1,17 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('leave', '0003_leave_request_overlap_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='leaverequest',
+            index=models.Index(fields=['employee', 'status', 'end_date'], name='leave_request_employee_idx'),
+        ),
+    ]
@@ -70,14 +70,57 @@ class LeaveRequest(models.Model):
     def __str__(self):
         return f"{self.employee} - {self.leave_type} ({self.start_date} to {self.end_date})"
 
+    def calculate_duration(self):
+        """Business days from start to end date on the employee's holiday calendar."""
+        from .business_days import business_days
+        return business_days(
+            self.start_date, self.end_date, self.employee.country, self.employee.department_id
+        )
+
     def save(self, *args, **kwargs):
-        # Calculate total days if not provided
-        if not self.total_days:
-            delta = self.end_date - self.start_date
-            self.total_days = delta.days + 1
+        # Decided requests keep the duration their balance was charged with
+        if not self.total_days or self.status == 'pending':
+            self.total_days = self.calculate_duration()
         super().save(*args, **kwargs)
 
     class Meta:
         verbose_name = _('leave request')
         verbose_name_plural = _('leave requests')
         ordering = ['-created_at']
+        # Interval-overlap lookups of leave.team_calendar: status = ... AND end_date >= ... AND start_date <= ...,
+        # and of one employee's leaves (leave.coverage)
+        indexes = [
+            models.Index(fields=['status', 'end_date', 'start_date'], name='leave_request_overlap_idx'),
+            models.Index(fields=['employee', 'status', 'end_date'], name='leave_request_employee_idx'),
+        ]
+
+class Holiday(models.Model):
+    """A public or company holiday, not counted as a business day of leave.
+
+    A holiday without a country applies in every country, one without a
+    department to every department.
+    """
+    name = models.CharField(max_length=100)
+    date = models.DateField()
+    country = models.CharField(max_length=100, blank=True, help_text=_('Leave empty for every country'))
+    department = models.ForeignKey(
+        'employees.Department',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='holidays',
+        help_text=_('Leave empty for every department')
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.date})"
+
+    class Meta:
+        verbose_name = _('holiday')
+        verbose_name_plural = _('holidays')
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['date'], name='leave_holiday_date_idx'),
+        ]
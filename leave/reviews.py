@@ -0,0 +1,200 @@
+"""
+Race-free review of leave requests.
+
+A review is one transaction of conditional updates. The request moves out
+of 'pending' with an ``UPDATE ... WHERE status = 'pending'``, so of two
+reviewers acting at once only one gets a row back. An approval then
+charges the balance of the request's leave type for the year it starts in
+with ``UPDATE ... SET used_days = used_days + n WHERE remaining_days >= n``;
+the database applies concurrent charges one after the other against the
+current row, so none is lost and none overdraws the balance. When the
+charge matches no row the whole review is rolled back and refused.
+
+``review_many`` reviews a batch of requests in a handful of statements:
+the requests are read and locked with one query, their balances found
+with a plain read and then exactly those locked by id, both in id order
+so that concurrent batches queue instead of deadlocking; every request
+the balances can cover (earliest first) changes status in
+one conditional UPDATE, and the balances are charged with one conditional
+``UPDATE ... FROM (VALUES ...)`` per batch of balances. Requests that
+cannot be reviewed are reported and left alone.
+
+Every review sends ``leave_requests_reviewed`` once, inside its
+transaction, so the notifications of a batch go out together.
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+
+from .models import LeaveBalance, LeaveRequest
+
+# Most requests one bulk review may take
+BULK_REVIEW_LIMIT = getattr(settings, 'LEAVE_BULK_REVIEW_LIMIT', 1000)
+
+BATCH_SIZE = 500
+
+# Backends where the balances of a bulk review are charged with one UPDATE ... FROM (VALUES ...) per batch
+UPDATE_FROM_VENDORS = ('postgresql', 'sqlite')
+
+# Sent with ``requests``, the ids of the requests reviewed, their new ``status`` and the ``reviewer``
+leave_requests_reviewed = Signal()
+
+
+class ReviewRefused(Exception):
+    pass
+
+
+def _charge(leave_request, days, now):
+    balances = LeaveBalance.objects.filter(
+        employee_id=leave_request.employee_id,
+        leave_type_id=leave_request.leave_type_id,
+        year=leave_request.start_date.year,
+    )
+    charged = balances.filter(remaining_days__gte=days).update(
+        used_days=F('used_days') + days,
+        remaining_days=F('remaining_days') - days,
+        updated_at=now,
+    )
+    if not charged:
+        remaining = balances.values_list('remaining_days', flat=True).first()
+        if remaining is None:
+            raise ReviewRefused('No leave balance found for this type of leave.')
+        raise ReviewRefused(f'Insufficient leave balance. Available: {remaining} days')
+
+
+def review(leave_request, status, reviewer, rejection_reason=''):
+    """Approve or reject a pending ``leave_request``; approving charges its leave balance.
+
+    Raises ReviewRefused, changing nothing, when the request was already
+    reviewed or the balance cannot cover it. Returns the reviewed request.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        reviewed = LeaveRequest.objects.filter(pk=leave_request.pk, status='pending').update(
+            status=status,
+            approved_by=reviewer,
+            rejection_reason=rejection_reason or '',
+            updated_at=now,
+        )
+        if not reviewed:
+            raise ReviewRefused('This leave request has already been reviewed.')
+        if status == 'approved':
+            # Read under the row lock the update took, after any holiday recomputation
+            days = LeaveRequest.objects.filter(pk=leave_request.pk).values_list('total_days', flat=True).get()
+            _charge(leave_request, days, now)
+        leave_requests_reviewed.send(
+            sender=LeaveRequest, requests=[leave_request.pk], status=status, reviewer=reviewer
+        )
+    leave_request.refresh_from_db()
+    return leave_request
+
+
+def _charge_many(charges, now):
+    """Add balance id -> days of ``charges`` to the balances that can still cover them.
+
+    Returns the number of balances charged.
+    """
+    if connection.vendor not in UPDATE_FROM_VENDORS:
+        return sum(
+            LeaveBalance.objects.filter(pk=pk, remaining_days__gte=days).update(
+                used_days=F('used_days') + days,
+                remaining_days=F('remaining_days') - days,
+                updated_at=now,
+            )
+            for pk, days in charges.items()
+        )
+    quote = connection.ops.quote_name
+    table = quote(LeaveBalance._meta.db_table)
+    used = quote(LeaveBalance._meta.get_field('used_days').column)
+    remaining = quote(LeaveBalance._meta.get_field('remaining_days').column)
+    updated_at = LeaveBalance._meta.get_field('updated_at')
+    rows = list(charges.items())
+    charged = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            batch = rows[start:start + BATCH_SIZE]
+            # VALUES columns are named column1, column2, ... on both backends
+            cursor.execute(
+                f'UPDATE {table} SET {used} = {table}.{used} + changes.column2, '
+                f'{remaining} = {table}.{remaining} - changes.column2, {quote(updated_at.column)} = %s '
+                f'FROM (VALUES {", ".join(["(%s, %s)"] * len(batch))}) AS changes '
+                f'WHERE {table}.{quote(LeaveBalance._meta.pk.column)} = changes.column1 '
+                f'AND {table}.{remaining} >= changes.column2',
+                [updated_at.get_db_prep_save(now, connection)] + [value for row in batch for value in row],
+            )
+            charged += cursor.rowcount
+    return charged
+
+
+def review_many(ids, status, reviewer, rejection_reason='', requests=None):
+    """Approve or reject the pending leave requests of ``ids`` together.
+
+    ``requests`` is the queryset the ids are looked up in, all requests by
+    default. Approvals are taken earliest first while the balance of their
+    leave type and year covers them. Returns the ids reviewed and a dict of
+    the ids refused with the reason.
+    """
+    ids = list(dict.fromkeys(ids))
+    requests = LeaveRequest.objects.all() if requests is None else requests
+    now = timezone.now()
+    refused = {}
+    with transaction.atomic():
+        rows = {
+            row[0]: row for row in requests.select_for_update(of=('self',)).filter(pk__in=ids).values_list(
+                'pk', 'employee_id', 'leave_type_id', 'start_date', 'total_days', 'status'
+            ).order_by('pk')
+        }
+        pending = []
+        for pk in ids:
+            if pk not in rows:
+                refused[pk] = 'Not found.'
+            elif rows[pk][5] != 'pending':
+                refused[pk] = 'This leave request has already been reviewed.'
+            else:
+                pending.append(rows[pk])
+
+        reviewed = [row[0] for row in pending]
+        charges = {}
+        if status == 'approved' and pending:
+            keys = {(row[1], row[2], row[3].year) for row in pending}
+            # The filter also matches balances of other combinations of these employees, types
+            # and years; only the balances of the requests are locked
+            balance_ids = [
+                pk for pk, *key in LeaveBalance.objects.filter(
+                    employee_id__in={key[0] for key in keys},
+                    leave_type_id__in={key[1] for key in keys},
+                    year__in={key[2] for key in keys},
+                ).values_list('pk', 'employee_id', 'leave_type_id', 'year').order_by()
+                if tuple(key) in keys
+            ]
+            balances = {
+                (employee_id, leave_type_id, year): [pk, remaining]
+                for pk, employee_id, leave_type_id, year, remaining in LeaveBalance.objects.select_for_update().filter(
+                    pk__in=balance_ids
+                ).values_list('pk', 'employee_id', 'leave_type_id', 'year', 'remaining_days').order_by('pk')
+            }
+            reviewed = []
+            for pk, employee_id, leave_type_id, start_date, days, _ in sorted(pending, key=lambda row: (row[3], row[0])):
+                balance = balances.get((employee_id, leave_type_id, start_date.year))
+                if balance is None:
+                    refused[pk] = 'No leave balance found for this type of leave.'
+                elif balance[1] < days:
+                    refused[pk] = f'Insufficient leave balance. Available: {balance[1]} days'
+                else:
+                    balance[1] -= days
+                    charges[balance[0]] = charges.get(balance[0], 0) + days
+                    reviewed.append(pk)
+
+        if reviewed:
+            changed = LeaveRequest.objects.filter(pk__in=reviewed, status='pending').update(
+                status=status,
+                approved_by=reviewer,
+                rejection_reason=rejection_reason or '',
+                updated_at=now,
+            )
+            if changed != len(reviewed) or _charge_many(charges, now) != len(charges):
+                raise ReviewRefused('These leave requests changed during the review; please try again.')
+            leave_requests_reviewed.send(sender=LeaveRequest, requests=reviewed, status=status, reviewer=reviewer)
+    return reviewed, refused
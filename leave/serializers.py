@@ -1,6 +1,10 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
+from employees.serializers import EmployeeListSerializer
+from .business_days import business_days
+from .coverage import COVERAGE_ENFORCEMENT, coverage_shortfalls
 from .models import LeaveType, LeaveBalance, LeaveRequest
+from .reviews import BULK_REVIEW_LIMIT
 
 User = get_user_model()
 
@@ -49,15 +53,16 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
             'id', 'employee', 'employee_details', 'leave_type',
             'leave_type_name', 'start_date', 'end_date', 'duration_days',
             'reason', 'status', 'approved_by', 'rejection_reason',
-            'attachments', 'created_at', 'updated_at'
+            'documents', 'created_at', 'updated_at'
         )
+        # Requests are always filed by the user submitting them
         read_only_fields = (
-            'id', 'status', 'approved_by', 'rejection_reason',
+            'id', 'employee', 'status', 'approved_by', 'rejection_reason',
             'created_at', 'updated_at'
         )
 
     def get_duration_days(self, obj):
-        return obj.calculate_duration()
+        return obj.total_days
 
     def validate(self, data):
         # Validate date range
@@ -68,9 +73,11 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
 
         # Check leave balance if creating new request
         if not self.instance:
-            employee = data['employee']
+            employee = self.context['request'].user
             leave_type = data['leave_type']
-            duration = (data['end_date'] - data['start_date']).days + 1
+            duration = business_days(
+                data['start_date'], data['end_date'], employee.country, employee.department_id
+            )
 
             try:
                 balance = LeaveBalance.objects.get(
@@ -87,6 +94,25 @@ class LeaveRequestSerializer(serializers.ModelSerializer):
                     'leave_type': 'No leave balance found for this type of leave'
                 })
 
+            # Check the department stays staffed on the requested days
+            if COVERAGE_ENFORCEMENT != 'off':
+                shortfalls = coverage_shortfalls(employee, data['start_date'], data['end_date'])
+                if shortfalls and COVERAGE_ENFORCEMENT == 'block':
+                    raise serializers.ValidationError({
+                        'coverage': 'Too few colleagues would be working on '
+                                    f"{', '.join(day['date'].isoformat() for day in shortfalls)}."
+                    })
+                self.coverage_warnings = [
+                    {**day, 'date': day['date'].isoformat()} for day in shortfalls
+                ]
+
+        return data
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Only a request just submitted through this serializer was checked
+        if hasattr(self, 'coverage_warnings'):
+            data['coverage_warnings'] = self.coverage_warnings
         return data
 
 class LeaveRequestApprovalSerializer(serializers.ModelSerializer):
@@ -107,4 +133,18 @@ class LeaveRequestApprovalSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({
                 'rejection_reason': 'Rejection reason is required when rejecting a leave request.'
             })
-        return data
\ No newline at end of file
+        return data
+
+class LeaveRequestBulkReviewSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False, max_length=BULK_REVIEW_LIMIT
+    )
+    status = serializers.ChoiceField(choices=['approved', 'rejected'])
+    rejection_reason = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, data):
+        if data['status'] == 'rejected' and not data.get('rejection_reason'):
+            raise serializers.ValidationError({
+                'rejection_reason': 'Rejection reason is required when rejecting a leave request.'
+            })
+        return data
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from .business_days import clear_holiday_cache, recompute_durations
+from .models import Holiday, LeaveRequest
+from .reviews import leave_requests_reviewed
+from .team_calendar import invalidate_team_calendars
+
+@receiver(pre_save, sender=Holiday)
+def remember_previous_holiday_date(sender, instance, **kwargs):
+    """Keep the stored date so post_save can recompute the requests it left."""
+    instance._previous_date = None
+    if instance.pk:
+        instance._previous_date = Holiday.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def recompute_leave_durations(sender, instance, **kwargs):
+    """Recompute the pending requests spanning the holiday's date, and its previous one."""
+    clear_holiday_cache()
+    for day in {instance.date, getattr(instance, '_previous_date', None)} - {None}:
+        recompute_durations(LeaveRequest.objects.filter(status='pending', start_date__lte=day, end_date__gte=day))
+
+@receiver(pre_save, sender=LeaveRequest)
+def remember_previous_leave_status(sender, instance, **kwargs):
+    """Keep the stored status so post_save can tell whether an approved leave changed."""
+    instance._previous_status = None
+    if instance.pk:
+        instance._previous_status = LeaveRequest.objects.filter(pk=instance.pk).values_list(
+            'status', flat=True
+        ).first()
+
+def _invalidate_on_commit(department_ids):
+    """Drop the cached calendars of ``department_ids`` once the change is committed.
+
+    Dropping them earlier would let a read in between cache the calendar as it was before.
+    """
+    department_ids = set(department_ids)
+    transaction.on_commit(lambda: invalidate_team_calendars(department_ids))
+
+@receiver(post_save, sender=LeaveRequest)
+def invalidate_calendar_after_save(sender, instance, **kwargs):
+    if 'approved' in (instance.status, getattr(instance, '_previous_status', None)):
+        _invalidate_on_commit([instance.employee.department_id])
+
+@receiver(post_delete, sender=LeaveRequest)
+def invalidate_calendar_after_delete(sender, instance, **kwargs):
+    if instance.status == 'approved':
+        _invalidate_on_commit([instance.employee.department_id])
+
+@receiver(leave_requests_reviewed)
+def invalidate_calendar_after_review(sender, requests, status, **kwargs):
+    if status == 'approved':
+        _invalidate_on_commit(
+            LeaveRequest.objects.filter(pk__in=requests).values_list('employee__department_id', flat=True).distinct()
+        )
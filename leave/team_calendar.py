@@ -0,0 +1,102 @@
+"""
+Team leave calendar: who is out on each day of a window, per department.
+
+The approved leaves of a department overlapping the window are read with
+one interval-overlap query (``start_date <= end AND end_date >= start``),
+served by the leave_request_overlap_idx index, and laid out as a boolean
+day-by-employee matrix. Each employee's row is sent as a bitmap: the bits
+of the row packed into bytes, most significant bit first, the first bit
+being the window's first day, base64-encoded. Only employees out at least
+once in the window have a row.
+
+Calendars are kept in the shared cache for LEAVE_TEAM_CALENDAR_CACHE_TTL
+seconds under a per-department generation, which approving, changing or
+deleting an approved leave of the department replaces once the change
+commits, so every process stops serving the old calendars at once.
+"""
+import base64
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import LeaveRequest
+
+CACHE_TTL = getattr(settings, 'LEAVE_TEAM_CALENDAR_CACHE_TTL', 300)
+
+# Longest window one calendar may cover
+MAX_DAYS = getattr(settings, 'LEAVE_TEAM_CALENDAR_MAX_DAYS', 366)
+
+
+def _generation_key(department_id):
+    return f'leave:team-calendar:generation:{department_id}'
+
+
+def department_generation(department_id):
+    generation = cache.get(_generation_key(department_id))
+    if generation is None:
+        generation = uuid.uuid4().hex
+        # Another process may have started one meanwhile; use whichever was stored
+        if not cache.add(_generation_key(department_id), generation, None):
+            generation = cache.get(_generation_key(department_id), generation)
+    return generation
+
+
+def invalidate_team_calendars(department_ids):
+    """Drop the cached calendars of ``department_ids``."""
+    for department_id in set(department_ids):
+        cache.set(_generation_key(department_id), uuid.uuid4().hex, None)
+
+
+def _build(department_id, start, end):
+    leaves = LeaveRequest.objects.filter(
+        status='approved',
+        employee__department_id=department_id,
+        start_date__lte=end,
+        end_date__gte=start,
+    ).values_list(
+        'employee_id', 'employee__first_name', 'employee__middle_name', 'employee__last_name',
+        'start_date', 'end_date',
+    ).order_by()
+
+    days = (end - start).days + 1
+    employees = {}
+    spans = []
+    for employee_id, first, middle, last, start_date, end_date in leaves:
+        # As User.get_full_name() spells it
+        name = f'{first} {middle} {last}' if middle else f'{first} {last}'
+        row = employees.setdefault(employee_id, (len(employees), name))[0]
+        spans.append((row, max((start_date - start).days, 0), min((end_date - start).days, days - 1) + 1))
+
+    out = np.zeros((len(employees), days), dtype=bool)
+    for row, first_day, after_last_day in spans:
+        out[row, first_day:after_last_day] = True
+    bitmaps = np.packbits(out, axis=1)
+
+    rows = sorted(employees.items(), key=lambda item: (item[1][1], str(item[0])))
+    return {
+        'department': str(department_id),
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'days': days,
+        'out_per_day': out.sum(axis=0).tolist(),
+        'employees': [
+            {
+                'id': str(employee_id),
+                'name': name,
+                'bitmap': base64.b64encode(bitmaps[row].tobytes()).decode('ascii'),
+            }
+            for employee_id, (row, name) in rows
+        ],
+    }
+
+
+def team_calendar(department_id, start, end):
+    """The calendar of ``department_id`` from ``start`` to ``end``, both included, from the cache if there."""
+    key = f'leave:team-calendar:{department_id}:{department_generation(department_id)}:{start.isoformat()}:{end.isoformat()}'
+    calendar = cache.get(key)
+    if calendar is None:
+        calendar = _build(department_id, start, end)
+        cache.set(key, calendar, CACHE_TTL)
+    return calendar
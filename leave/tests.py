@@ -1,3 +1,503 @@
-from django.test import TestCase
+import base64
+import threading
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import include, path
+from rest_framework.test import APITestCase
+
+from employees.models import Department
+from .business_days import (
+    business_days, business_days_many, calendar_for, clear_holiday_cache, recompute_durations, weekdays_between,
+)
+from .coverage import coverage_shortfalls
+from .models import Holiday, LeaveBalance, LeaveRequest, LeaveType
+from .reviews import ReviewRefused, review, review_many
+from .team_calendar import MAX_DAYS, department_generation, team_calendar
+
+User = get_user_model()
+
+urlpatterns = [
+    path('api/leave/', include('leave.urls')),
+]
+
+
+def create_user(email, **extra):
+    return User.objects.create_user(
+        email=email, password='password123', first_name='Test', last_name=email.split('@')[0], **extra
+    )
+
+
+class BusinessDayTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.addCleanup(clear_holiday_cache)
+
+    def test_weekdays_match_counting_day_by_day(self):
+        first = date(2025, 3, 1)
+        for offset in range(7):
+            start = first + timedelta(days=offset)
+            for length in range(-1, 30):
+                end = start + timedelta(days=length)
+                expected = sum(
+                    (start + timedelta(days=day)).weekday() < 5 for day in range((end - start).days + 1)
+                )
+                self.assertEqual(weekdays_between(start, end), expected, (start, end))
+
+    def test_calendars_hold_the_holidays_of_their_country_and_department(self):
+        Holiday.objects.create(name='Everywhere', date=date(2025, 3, 3))
+        Holiday.objects.create(name='France', date=date(2025, 3, 4), country='France')
+        Holiday.objects.create(name='Team', date=date(2025, 3, 5), department=self.department)
+        Holiday.objects.create(name='Saturday', date=date(2025, 3, 8), country='france')
+
+        start, end = date(2025, 3, 3), date(2025, 3, 9)
+        self.assertEqual(business_days(start, end), 4)
+        self.assertEqual(business_days(start, end, ' FRANCE '), 3)
+        self.assertEqual(business_days(start, end, 'Germany', self.department.pk), 3)
+        self.assertEqual(business_days(start, end, 'france', self.department.pk), 2)
+        self.assertEqual(calendar_for('france', self.department.pk).ordinals, [
+            date(2025, 3, 3).toordinal(), date(2025, 3, 4).toordinal(), date(2025, 3, 5).toordinal(),
+        ])
+
+    def test_many_spans_at_once_match_one_at_a_time(self):
+        Holiday.objects.create(name='France', date=date(2025, 3, 4), country='France')
+        Holiday.objects.create(name='Team', date=date(2025, 3, 12), department=self.department)
+        spans = [
+            (date(2025, 3, 1) + timedelta(days=offset), date(2025, 3, 1) + timedelta(days=offset + length), country,
+             department)
+            for offset in range(0, 14, 3)
+            for length in (-2, 0, 4, 11)
+            for country, department in (('', None), ('France', None), ('France', self.department.pk))
+        ]
+        self.assertEqual(
+            business_days_many(spans).tolist(),
+            [business_days(start, end, country, department) for start, end, country, department in spans],
+        )
+        self.assertEqual(business_days_many([]).tolist(), [])
+
+
+class LeaveDurationTests(TestCase):
+    def setUp(self):
+        self.employee = create_user('employee@example.com', country='France')
+        self.leave_type = LeaveType.objects.create(name='Annual', days_allowed=25)
+        self.addCleanup(clear_holiday_cache)
+
+    def request(self, start, end, status='pending'):
+        return LeaveRequest.objects.create(
+            employee=self.employee, leave_type=self.leave_type, start_date=start, end_date=end,
+            reason='Holiday', status=status,
+        )
+
+    def test_requests_last_their_business_days(self):
+        Holiday.objects.create(name='France', date=date(2025, 3, 4), country='France')
+        self.assertEqual(self.request(date(2025, 3, 1), date(2025, 3, 16)).total_days, 9)
+
+    def test_holiday_changes_recompute_pending_requests_only(self):
+        pending = self.request(date(2025, 3, 3), date(2025, 3, 7))
+        approved = self.request(date(2025, 3, 3), date(2025, 3, 7), status='approved')
+        later = self.request(date(2025, 3, 10), date(2025, 3, 14))
+
+        holiday = Holiday.objects.create(name='France', date=date(2025, 3, 4), country='France')
+        self.assertEqual(
+            list(LeaveRequest.objects.filter(pk__in=[pending.pk, approved.pk, later.pk]).order_by('pk')
+                 .values_list('total_days', flat=True)),
+            [4, 5, 5],
+        )
+
+        # Moving it moves the day off from one request to the other
+        holiday.date = date(2025, 3, 11)
+        holiday.save()
+        pending.refresh_from_db()
+        later.refresh_from_db()
+        self.assertEqual((pending.total_days, later.total_days), (5, 4))
+
+        holiday.delete()
+        later.refresh_from_db()
+        self.assertEqual(later.total_days, 5)
+
+    def test_recompute_durations_writes_only_changes(self):
+        pending = self.request(date(2025, 3, 3), date(2025, 3, 7))
+        self.request(date(2025, 3, 10), date(2025, 3, 14))
+        LeaveRequest.objects.filter(pk=pending.pk).update(total_days=1)
+
+        self.assertEqual(recompute_durations(LeaveRequest.objects.all()), 1)
+        pending.refresh_from_db()
+        self.assertEqual(pending.total_days, 5)
+        self.assertEqual(recompute_durations(LeaveRequest.objects.all()), 0)
+
+
+class ReviewManyTests(TestCase):
+    def setUp(self):
+        self.reviewer = create_user('hr@example.com', role='hr')
+        self.first, self.second = create_user('first@example.com'), create_user('second@example.com')
+        self.annual = LeaveType.objects.create(name='Annual', days_allowed=25)
+        self.sick = LeaveType.objects.create(name='Sick', days_allowed=10)
+
+    def balance(self, employee, leave_type, days, year=2025):
+        return LeaveBalance.objects.create(employee=employee, leave_type=leave_type, year=year, total_days=days)
+
+    def request(self, employee, leave_type, start, end):
+        return LeaveRequest.objects.create(
+            employee=employee, leave_type=leave_type, start_date=start, end_date=end, reason='Holiday'
+        )
+
+    def test_approvals_charge_only_the_balances_of_their_requests(self):
+        first_annual = self.balance(self.first, self.annual, 6)
+        # Same employees, types and years as the requests, other combinations
+        untouched = [self.balance(self.first, self.sick, 10), self.balance(self.second, self.annual, 10)]
+        second_sick = self.balance(self.second, self.sick, 10)
+        early = self.request(self.first, self.annual, date(2025, 3, 3), date(2025, 3, 7))
+        late = self.request(self.first, self.annual, date(2025, 3, 10), date(2025, 3, 11))
+        sick = self.request(self.second, self.sick, date(2025, 3, 3), date(2025, 3, 4))
+
+        reviewed, refused = review_many([late.pk, sick.pk, early.pk, 0], 'approved', self.reviewer)
+
+        self.assertEqual(sorted(reviewed), sorted([early.pk, sick.pk]))
+        self.assertEqual(refused, {late.pk: 'Insufficient leave balance. Available: 1 days', 0: 'Not found.'})
+        first_annual.refresh_from_db()
+        second_sick.refresh_from_db()
+        self.assertEqual((first_annual.used_days, first_annual.remaining_days), (5, 1))
+        self.assertEqual((second_sick.used_days, second_sick.remaining_days), (2, 8))
+        for balance in untouched:
+            balance.refresh_from_db()
+            self.assertEqual(balance.used_days, 0)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ReviewPermissionTests(APITestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.other_department = Department.objects.create(name='Sales', code='SAL')
+        self.manager = create_user('manager@example.com', role='manager', department=self.department)
+        self.employee = create_user('employee@example.com', department=self.department)
+        self.outsider = create_user('outsider@example.com', department=self.other_department)
+        self.hr = create_user('hr@example.com', role='hr')
+        self.leave_type = LeaveType.objects.create(name='Annual', days_allowed=25)
+        self.requests = {}
+        for user in (self.manager, self.employee, self.outsider, self.hr):
+            LeaveBalance.objects.create(employee=user, leave_type=self.leave_type, year=2025, total_days=25)
+            self.requests[user.pk] = LeaveRequest.objects.create(
+                employee=user, leave_type=self.leave_type, start_date=date(2025, 3, 3), end_date=date(2025, 3, 4),
+                reason='Holiday',
+            )
+
+    def approve(self, user, employee, action='approve'):
+        self.client.force_authenticate(user)
+        return self.client.post(
+            f'/api/leave/requests/{self.requests[employee.pk].pk}/{action}/', {'status': 'approved'}, format='json'
+        )
+
+    def test_managers_review_their_team_only(self):
+        self.assertEqual(self.approve(self.manager, self.outsider).status_code, 404)
+        self.assertEqual(self.approve(self.manager, self.manager).status_code, 404)
+        response = self.approve(self.manager, self.employee, action='approve_request')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], 'approved')
+
+    def test_employees_cannot_review(self):
+        self.assertEqual(self.approve(self.employee, self.employee).status_code, 403)
+        self.assertEqual(self.approve(self.outsider, self.employee, action='approve_request').status_code, 403)
+        self.assertEqual(LeaveRequest.objects.filter(status='approved').count(), 0)
+
+    def test_hr_reviews_anyone_but_themselves(self):
+        self.assertEqual(self.approve(self.hr, self.outsider).status_code, 200)
+        self.assertEqual(self.approve(self.hr, self.hr).status_code, 404)
+
+    def test_bulk_review_refuses_the_reviewers_own_requests(self):
+        self.client.force_authenticate(self.hr)
+        ids = [self.requests[self.hr.pk].pk, self.requests[self.employee.pk].pk]
+        response = self.client.post(
+            '/api/leave/requests/bulk_review/', {'ids': ids, 'status': 'approved'}, format='json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reviewed'], [ids[1]])
+        self.assertEqual(response.data['refused'], [{'id': ids[0], 'detail': 'Not found.'}])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class LeaveSubmissionTests(APITestCase):
+    def setUp(self):
+        self.employee = create_user('employee@example.com')
+        self.colleague = create_user('colleague@example.com')
+        self.leave_type = LeaveType.objects.create(name='Annual', days_allowed=25)
+        LeaveBalance.objects.create(employee=self.colleague, leave_type=self.leave_type, year=2025, total_days=25)
+        self.client.force_authenticate(self.employee)
+
+    def submit(self, **extra):
+        return self.client.post('/api/leave/requests/', {
+            'leave_type': self.leave_type.pk, 'start_date': '2025-03-03', 'end_date': '2025-03-07',
+            'reason': 'Holiday', **extra,
+        }, format='json')
+
+    def test_requests_are_checked_against_the_submitters_balance(self):
+        # The colleague's balance would cover it, the submitter has none
+        response = self.submit(employee=str(self.colleague.pk))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('leave_type', response.data)
+
+        LeaveBalance.objects.create(employee=self.employee, leave_type=self.leave_type, year=2025, total_days=3)
+        response = self.submit(employee=str(self.colleague.pk))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Available: 3 days', str(response.data['duration']))
+        self.assertFalse(LeaveRequest.objects.exists())
+
+    def test_requests_are_filed_for_the_submitter(self):
+        LeaveBalance.objects.create(employee=self.employee, leave_type=self.leave_type, year=2025, total_days=10)
+
+        response = self.submit(employee=str(self.colleague.pk))
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['employee'], self.employee.pk)
+        self.assertEqual(LeaveRequest.objects.get().employee, self.employee)
+
+
+class CoverageTests(APITestCase):
+    """A department of four active employees, half of whom must be working."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.employee = create_user('employee@example.com', department=self.department)
+        first = create_user('first@example.com', department=self.department)
+        second = create_user('second@example.com', department=self.department)
+        create_user('third@example.com', department=self.department)
+        departed = create_user('departed@example.com', department=self.department, is_active=False)
+        self.leave_type = LeaveType.objects.create(name='Annual', days_allowed=25)
+        LeaveBalance.objects.create(employee=self.employee, leave_type=self.leave_type, year=2025, total_days=25)
+        for employee, start, end in (
+            (first, date(2025, 3, 31), date(2025, 4, 1)),
+            (second, date(2025, 3, 28), date(2025, 4, 1)),
+            # Out the whole time, but no longer part of the headcount
+            (departed, date(2025, 3, 24), date(2025, 4, 4)),
+            # The requester's own leave overlapping the new request
+            (self.employee, date(2025, 3, 27), date(2025, 3, 28)),
+        ):
+            LeaveRequest.objects.create(
+                employee=employee, leave_type=self.leave_type, start_date=start, end_date=end,
+                reason='Holiday', status='approved',
+            )
+        # Thursday 27 March to Wednesday 2 April
+        self.start, self.end = date(2025, 3, 27), date(2025, 4, 2)
+        self.shortfalls = [
+            {'date': date(2025, 3, 31), 'working': 1, 'headcount': 4},
+            {'date': date(2025, 4, 1), 'working': 1, 'headcount': 4},
+        ]
+
+    def submit(self):
+        self.client.force_authenticate(self.employee)
+        return self.client.post('/api/leave/requests/', {
+            'leave_type': self.leave_type.pk, 'start_date': self.start.isoformat(), 'end_date': self.end.isoformat(),
+            'reason': 'Holiday',
+        }, format='json')
+
+    def test_shortfalls_across_months(self):
+        self.assertEqual(coverage_shortfalls(self.employee, self.start, self.end, ratio=0.5), self.shortfalls)
+        self.assertEqual(coverage_shortfalls(self.employee, self.start, self.end, ratio=0.25), [])
+        self.assertEqual(coverage_shortfalls(create_user('nobody@example.com'), self.start, self.end), [])
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_warn_returns_the_shortfalls_with_the_request(self):
+        with mock.patch('leave.serializers.COVERAGE_ENFORCEMENT', 'warn'), \
+                mock.patch('leave.coverage.MIN_STAFFING_RATIO', 0.5):
+            response = self.submit()
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['coverage_warnings'], [
+            {**day, 'date': day['date'].isoformat()} for day in self.shortfalls
+        ])
+        self.assertEqual(LeaveRequest.objects.filter(status='pending').count(), 1)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_block_refuses_the_request(self):
+        with mock.patch('leave.serializers.COVERAGE_ENFORCEMENT', 'block'), \
+                mock.patch('leave.coverage.MIN_STAFFING_RATIO', 0.5):
+            response = self.submit()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            str(response.data['coverage'][0]), 'Too few colleagues would be working on 2025-03-31, 2025-04-01.'
+        )
+        self.assertFalse(LeaveRequest.objects.filter(status='pending').exists())
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class TeamCalendarTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.other_department = Department.objects.create(name='Sales', code='SAL')
+        self.alice = create_user('alice@example.com', department=self.department)
+        self.bob = create_user('bob@example.com', department=self.department)
+        outsider = create_user('outsider@example.com', department=self.other_department)
+        leave_type = LeaveType.objects.create(name='Annual', days_allowed=25)
+        for employee, start, end, status in (
+            # Starts before the window and ends after it
+            (self.alice, date(2025, 3, 1), date(2025, 3, 31), 'approved'),
+            (self.bob, date(2025, 3, 12), date(2025, 3, 13), 'approved'),
+            (self.bob, date(2025, 3, 15), date(2025, 3, 16), 'pending'),
+            (outsider, date(2025, 3, 10), date(2025, 3, 16), 'approved'),
+        ):
+            LeaveRequest.objects.create(
+                employee=employee, leave_type=leave_type, start_date=start, end_date=end, reason='Holiday',
+                status=status,
+            )
+
+    def get(self, user, **params):
+        self.client.force_authenticate(user)
+        return self.client.get('/api/leave/calendar/', params)
+
+    def test_calendar_lays_out_the_window(self):
+        response = self.get(self.bob, start_date='2025-03-10', end_date='2025-03-16')
+
+        self.assertEqual(response.status_code, 200)
+        calendar = response.data
+        self.assertEqual(calendar, team_calendar(self.department.pk, date(2025, 3, 10), date(2025, 3, 16)))
+        self.assertEqual(calendar['days'], 7)
+        self.assertEqual(calendar['out_per_day'], [1, 1, 2, 2, 1, 1, 1])
+        self.assertEqual([row['id'] for row in calendar['employees']], [str(self.alice.pk), str(self.bob.pk)])
+        bits = [
+            np.unpackbits(np.frombuffer(base64.b64decode(row['bitmap']), dtype=np.uint8))[:7].tolist()
+            for row in calendar['employees']
+        ]
+        self.assertEqual(bits, [[1, 1, 1, 1, 1, 1, 1], [0, 0, 1, 1, 0, 0, 0]])
+
+    def test_employees_see_only_their_department(self):
+        response = self.get(self.bob, department=str(self.other_department.pk))
+        self.assertEqual(response.status_code, 403)
+
+        hr = create_user('hr@example.com', role='hr')
+        response = self.get(
+            hr, department=str(self.other_department.pk), start_date='2025-03-10', end_date='2025-03-16'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['out_per_day'], [1] * 7)
+
+    def test_window_is_bounded(self):
+        start = date(2025, 1, 1)
+        response = self.get(
+            self.bob, start_date=start.isoformat(), end_date=(start + timedelta(days=MAX_DAYS)).isoformat()
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.get(
+            self.bob, start_date=start.isoformat(), end_date=(start + timedelta(days=MAX_DAYS - 1)).isoformat()
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class TeamCalendarInvalidationTests(TestCase):
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.employee = create_user('employee@example.com', department=self.department)
+        self.leave_type = LeaveType.objects.create(name='Annual', days_allowed=25)
+        LeaveBalance.objects.create(employee=self.employee, leave_type=self.leave_type, year=2025, total_days=25)
+        self.leave_request = LeaveRequest.objects.create(
+            employee=self.employee, leave_type=self.leave_type, start_date=date(2025, 3, 3),
+            end_date=date(2025, 3, 4), reason='Holiday',
+        )
+        self.start, self.end = date(2025, 3, 1), date(2025, 3, 31)
+
+    def test_approval_drops_the_calendar_once_committed(self):
+        self.assertEqual(team_calendar(self.department.pk, self.start, self.end)['employees'], [])
+        generation = department_generation(self.department.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            review(self.leave_request, 'approved', create_user('hr@example.com', role='hr'))
+            # A read before the commit still gets the cached calendar
+            self.assertEqual(department_generation(self.department.pk), generation)
+
+        self.assertNotEqual(department_generation(self.department.pk), generation)
+        self.assertEqual(
+            [row['id'] for row in team_calendar(self.department.pk, self.start, self.end)['employees']],
+            [str(self.employee.pk)],
+        )
+
+    def test_changing_or_deleting_an_approved_leave_drops_the_calendar_once_committed(self):
+        LeaveRequest.objects.filter(pk=self.leave_request.pk).update(status='approved')
+        self.leave_request.refresh_from_db()
+        generation = department_generation(self.department.pk)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.leave_request.end_date = date(2025, 3, 5)
+            self.leave_request.save()
+        self.assertEqual(department_generation(self.department.pk), generation)
+        for callback in callbacks:
+            callback()
+        changed = department_generation(self.department.pk)
+        self.assertNotEqual(changed, generation)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.leave_request.delete()
+        self.assertNotEqual(department_generation(self.department.pk), changed)
+
+
+class ConcurrentReviewTests(TransactionTestCase):
+    """Reviewers approving the same requests at once, against one balance."""
+
+    BALANCE = 5
+    REQUESTS = 8
+    REVIEWS_PER_REQUEST = 2
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('An in-memory SQLite database refuses concurrent writers instead of queueing them')
+
+    def test_concurrent_approvals_charge_the_balance_once_each(self):
+        employee = create_user('employee@example.com')
+        reviewer = create_user('manager@example.com', role='manager')
+        leave_type = LeaveType.objects.create(name='Annual', days_allowed=self.BALANCE)
+        balance = LeaveBalance.objects.create(
+            employee=employee, leave_type=leave_type, year=2025, total_days=self.BALANCE
+        )
+        # One business day each, Monday 3 March 2025 onwards
+        days = [day for day in (date(2025, 3, 3) + timedelta(days=offset) for offset in range(14)) if day.weekday() < 5]
+        requests = [
+            LeaveRequest.objects.create(
+                employee=employee, leave_type=leave_type, start_date=day, end_date=day, reason='Holiday'
+            )
+            for day in days[:self.REQUESTS]
+        ]
+        jobs = requests * self.REVIEWS_PER_REQUEST
+        barrier = threading.Barrier(len(jobs))
+        outcomes = []
+        lock = threading.Lock()
+
+        def approve(leave_request):
+            try:
+                barrier.wait()
+                try:
+                    review(LeaveRequest.objects.get(pk=leave_request.pk), 'approved', reviewer)
+                    outcome = 'approved'
+                except ReviewRefused:
+                    outcome = 'refused'
+                except DatabaseError:
+                    outcome = 'database error'
+                with lock:
+                    outcomes.append((leave_request.pk, outcome))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=approve, args=(leave_request,)) for leave_request in jobs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(outcomes), len(jobs))
+        self.assertEqual(
+            sorted(outcome for _, outcome in outcomes),
+            ['approved'] * self.BALANCE + ['refused'] * (len(jobs) - self.BALANCE),
+        )
+        approved = {pk for pk, outcome in outcomes if outcome == 'approved'}
+        self.assertEqual(set(LeaveRequest.objects.filter(status='approved').values_list('pk', flat=True)), approved)
+        self.assertEqual(LeaveRequest.objects.filter(status='pending').count(), self.REQUESTS - self.BALANCE)
+        balance.refresh_from_db()
+        self.assertEqual((balance.used_days, balance.remaining_days), (self.BALANCE, 0))
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import LeaveTypeViewSet, LeaveBalanceViewSet, LeaveRequestViewSet
+from .views import LeaveTypeViewSet, LeaveBalanceViewSet, LeaveRequestViewSet, TeamCalendarView
 
 app_name = 'leave'
 
@@ -10,5 +10,6 @@ router.register('balances', LeaveBalanceViewSet)
 router.register('requests', LeaveRequestViewSet)
 
 urlpatterns = [
+    path('calendar/', TeamCalendarView.as_view(), name='team-calendar'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,11 +1,20 @@
 from rest_framework import generics, status, permissions, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.generics import get_object_or_404
 from django.db.models import Q
 from django.utils import timezone
+from calendar import monthrange
 from datetime import datetime
+import uuid
 from .models import LeaveType, LeaveBalance, LeaveRequest
-from .serializers import LeaveTypeSerializer, LeaveBalanceSerializer, LeaveRequestSerializer, LeaveRequestApprovalSerializer
+from accounts.permissions import IsManager
+from .reviews import ReviewRefused, review, review_many
+from .team_calendar import MAX_DAYS, team_calendar
+from .serializers import (
+    LeaveTypeSerializer, LeaveBalanceSerializer, LeaveRequestSerializer, LeaveRequestApprovalSerializer,
+    LeaveRequestBulkReviewSerializer
+)
 
 class LeaveTypeViewSet(viewsets.ModelViewSet):
     queryset = LeaveType.objects.all()
@@ -49,20 +58,37 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
 
         return queryset
 
-    @action(detail=True, methods=['post'])
-    def approve(self, request, pk=None):
-        leave_request = self.get_object()
+    def _reviewable(self):
+        """The requests the user may review: HR staff all, managers their team's, never their own."""
+        requests = LeaveRequest.objects.all()
+        if not self.request.user.is_hr:
+            team = Q(employee__manager=self.request.user)
+            if self.request.user.department_id:
+                team |= Q(employee__department_id=self.request.user.department_id)
+            requests = requests.filter(team)
+        return requests.exclude(employee=self.request.user)
+
+    def _review(self, request):
+        leave_request = get_object_or_404(self._reviewable(), pk=self.kwargs['pk'])
         serializer = LeaveRequestApprovalSerializer(data=request.data)
-        
+
         if serializer.is_valid():
-            leave_request.status = serializer.validated_data['status']
-            leave_request.approved_by = request.user
-            leave_request.approved_at = timezone.now()
-            leave_request.save()
-            
+            try:
+                leave_request = review(
+                    leave_request,
+                    serializer.validated_data['status'],
+                    request.user,
+                    serializer.validated_data.get('rejection_reason'),
+                )
+            except ReviewRefused as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
             return Response(LeaveRequestSerializer(leave_request).data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post'], permission_classes=[IsManager])
+    def approve(self, request, pk=None):
+        return self._review(request)
+
     def get_serializer_class(self):
         if self.action == 'approve_request':
             return LeaveRequestApprovalSerializer
@@ -86,51 +112,41 @@ class LeaveRequestViewSet(viewsets.ModelViewSet):
             try:
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
-                queryset = queryset.filter(
-                    Q(start_date__range=[start, end]) |
-                    Q(end_date__range=[start, end])
-                )
+                # Every leave overlapping the range, including those spanning all of it
+                queryset = queryset.filter(start_date__lte=end, end_date__gte=start)
             except ValueError:
                 pass
 
         return queryset
 
     def perform_create(self, serializer):
-        serializer.save(employee=self.request.user.employee)
+        serializer.save(employee=self.request.user)
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], permission_classes=[IsManager])
     def approve_request(self, request, pk=None):
-        leave_request = self.get_object()
-        serializer = self.get_serializer(data=request.data)
-
-        if serializer.is_valid():
-            status = serializer.validated_data['status']
-            rejection_reason = serializer.validated_data.get('rejection_reason')
-
-            if status == 'rejected' and not rejection_reason:
-                return Response(
-                    {"detail": "Rejection reason is required."},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            leave_request.status = status
-            leave_request.rejection_reason = rejection_reason
-            leave_request.approved_by = request.user
-            leave_request.approved_at = timezone.now()
-            leave_request.save()
-
-            # Update leave balance if request is approved
-            if status == 'approved':
-                leave_balance = LeaveBalance.objects.get(
-                    employee=leave_request.employee,
-                    leave_type=leave_request.leave_type
-                )
-                leave_balance.used_days += leave_request.duration_days
-                leave_balance.save()
-
-            return Response(self.get_serializer(leave_request).data)
-
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self._review(request)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsManager])
+    def bulk_review(self, request):
+        """Approve or reject many requests at once; managers review those of their team only, never their own."""
+        serializer = LeaveRequestBulkReviewSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            reviewed, refused = review_many(
+                serializer.validated_data['ids'],
+                serializer.validated_data['status'],
+                request.user,
+                serializer.validated_data.get('rejection_reason'),
+                requests=self._reviewable(),
+            )
+        except ReviewRefused as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            'reviewed': reviewed,
+            'refused': [{'id': pk, 'detail': detail} for pk, detail in refused.items()],
+        })
 
 class EmployeeLeaveBalanceView(generics.ListAPIView):
     serializer_class = LeaveBalanceSerializer
@@ -139,3 +155,44 @@ class EmployeeLeaveBalanceView(generics.ListAPIView):
     def get_queryset(self):
         employee_id = self.kwargs['employee_id']
         return LeaveBalance.objects.filter(employee_id=employee_id)
+
+class TeamCalendarView(generics.GenericAPIView):
+    """Who is on approved leave each day, as a day-by-employee bitmap (see leave.team_calendar).
+
+    ``?department=`` defaults to the user's own, which is the only one
+    employees other than HR staff may see; ``?start_date=`` and
+    ``?end_date=`` default to the current month.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        today = timezone.localdate()
+        start_date = request.query_params.get('start_date', None)
+        end_date = request.query_params.get('end_date', None)
+        try:
+            start = datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else today.replace(day=1)
+            end = (
+                datetime.strptime(end_date, '%Y-%m-%d').date() if end_date
+                else start.replace(day=monthrange(start.year, start.month)[1])
+            )
+        except ValueError:
+            return Response({"detail": "Dates must be in YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+        if end < start:
+            return Response({"detail": "end_date must not be before start_date."}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start).days >= MAX_DAYS:
+            return Response(
+                {"detail": f"The calendar covers at most {MAX_DAYS} days."}, status=status.HTTP_400_BAD_REQUEST
+            )
+
+        department = request.query_params.get('department', None)
+        try:
+            department_id = uuid.UUID(department) if department else request.user.department_id
+        except ValueError:
+            return Response({"detail": "Unknown department."}, status=status.HTTP_400_BAD_REQUEST)
+        if department_id is None:
+            return Response({"detail": "Choose a department."}, status=status.HTTP_400_BAD_REQUEST)
+        if department_id != request.user.department_id and not request.user.is_hr:
+            return Response(
+                {"detail": "You may only see the calendar of your department."}, status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(team_calendar(department_id, start, end))
@@ -4,6 +4,7 @@ from django.contrib.auth import get_user_model
 from django.utils import timezone
 from datetime import datetime, timedelta
 from leave.models import LeaveRequest
+from leave.reviews import leave_requests_reviewed
 from performance.models import PerformanceReview
 from .models import Notification, NotificationType
 
@@ -37,21 +38,31 @@ def notify_leave_request(sender, instance, created, **kwargs):
     
     elif instance.status in ['approved', 'rejected']:
         # Notify employee about leave request status
-        try:
-            notification_type = NotificationType.objects.get(
-                category='leave',
-                name='Leave Request Update'
-            )
-            
-            status_text = "approved" if instance.status == 'approved' else "rejected"
-            Notification.objects.create(
-                notification_type=notification_type,
-                recipient=instance.employee.user,
-                subject=f"Leave Request {status_text.title()}",
-                message=f"Your leave request from {instance.start_date} to {instance.end_date} has been {status_text}."
-            )
-        except NotificationType.DoesNotExist:
-            pass
+        notify_leave_reviews(LeaveRequest, requests=[instance.pk], status=instance.status)
+
+@receiver(leave_requests_reviewed)
+def notify_leave_reviews(sender, requests, status, **kwargs):
+    """Notify the employees of reviewed leave requests, with one insert for the whole batch"""
+    try:
+        notification_type = NotificationType.objects.get(
+            category='leave',
+            name='Leave Request Update'
+        )
+    except NotificationType.DoesNotExist:
+        return
+
+    status_text = "approved" if status == 'approved' else "rejected"
+    Notification.objects.bulk_create([
+        Notification(
+            notification_type=notification_type,
+            recipient_id=employee_id,
+            subject=f"Leave Request {status_text.title()}",
+            message=f"Your leave request from {start_date} to {end_date} has been {status_text}."
+        )
+        for employee_id, start_date, end_date in LeaveRequest.objects.filter(pk__in=requests).values_list(
+            'employee_id', 'start_date', 'end_date'
+        )
+    ])
 
 @receiver(post_save, sender=PerformanceReview)
 def notify_performance_review(sender, instance, created, **kwargs):
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
-from .models import PayrollPeriod, PayrollRecord, Allowance, Deduction
+from .models import PayrollPeriod, PayrollRecord, Allowance, Deduction, PayrollRun, PayrollLedger, TaxBracket, PayrollAuditLog
 
 @admin.register(PayrollPeriod)
 class PayrollPeriodAdmin(admin.ModelAdmin):
@@ -11,15 +11,17 @@ class PayrollPeriodAdmin(admin.ModelAdmin):
 
 @admin.register(Allowance)
 class AllowanceAdmin(admin.ModelAdmin):
-    list_display = ('name', 'amount', 'is_taxable', 'is_fixed')
-    list_filter = ('is_taxable', 'is_fixed')
+    list_display = ('name', 'amount', 'percentage', 'is_taxable', 'is_fixed', 'is_active', 'applies_to_all')
+    list_filter = ('is_taxable', 'is_fixed', 'is_active', 'applies_to_all')
     search_fields = ('name', 'description')
+    filter_horizontal = ('employees', 'departments')
 
 @admin.register(Deduction)
 class DeductionAdmin(admin.ModelAdmin):
-    list_display = ('name', 'amount', 'is_fixed')
-    list_filter = ('is_fixed',)
+    list_display = ('name', 'amount', 'percentage', 'is_fixed', 'is_active', 'applies_to_all')
+    list_filter = ('is_fixed', 'is_active', 'applies_to_all')
     search_fields = ('name', 'description')
+    filter_horizontal = ('employees', 'departments')
 
 @admin.register(PayrollRecord)
 class PayrollRecordAdmin(admin.ModelAdmin):
@@ -36,3 +38,26 @@ class PayrollRecordAdmin(admin.ModelAdmin):
             'fields': ('notes',)
         }),
     )
+
+@admin.register(PayrollRun)
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ('payroll_period', 'status', 'total_employees', 'processed_employees', 'failed_employees', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('timings', 'finished_at')
+
+@admin.register(PayrollLedger)
+class PayrollLedgerAdmin(admin.ModelAdmin):
+    list_display = ('employee', 'year', 'record_count', 'gross_total', 'tax_total', 'net_total')
+    list_filter = ('year',)
+    search_fields = ('employee__email', 'employee__employee_id')
+
+@admin.register(TaxBracket)
+class TaxBracketAdmin(admin.ModelAdmin):
+    list_display = ('year', 'lower_bound', 'rate')
+    list_filter = ('year',)
+
+@admin.register(PayrollAuditLog)
+class PayrollAuditLogAdmin(admin.ModelAdmin):
+    list_display = ('action', 'payroll_period', 'performed_by', 'record_count', 'total_amount', 'created_at')
+    list_filter = ('action', 'to_status')
+    readonly_fields = ('record_ids', 'details')
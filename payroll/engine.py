@@ -0,0 +1,288 @@
+"""
+Set-based payroll run engine.
+
+A run loads everything a period needs in a handful of queries, computes
+basic pay, overtime, allowances, deductions, tax and net salary for the
+whole workforce in one numpy pass and upserts the PayrollRecord rows in
+chunks.
+
+Amounts are carried as int64 cents (see payroll.money), so the stored
+values are exact. Allowances and deductions come from a RulePlan compiled
+once per run (see payroll.rules) and tax from the year's progressive
+brackets (see payroll.tax).
+
+Approved and paid records are never recomputed. The statuses read before
+writing only spare the work; the upsert itself leaves alone any record
+that is no longer pending when it runs.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection, transaction
+
+from .models import PayrollRecord
+from .money import div_half_up, from_cents, to_cents
+from .overtime import approved_overtime
+from .rules import compile_rules
+from .tax import calculate_period_tax, load_tax_table, tax_year
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+CHUNK_SIZE = getattr(settings, 'PAYROLL_CHUNK_SIZE', 2000)
+STANDARD_MONTHLY_HOURS = Decimal(getattr(settings, 'PAYROLL_STANDARD_MONTHLY_HOURS', '173.33'))
+OVERTIME_MULTIPLIER = Decimal(getattr(settings, 'PAYROLL_OVERTIME_MULTIPLIER', '1.50'))
+
+# User.salary is a monthly figure; other period types get a share of it.
+PERIOD_SALARY_FACTORS = {
+    'monthly': (1, 1),
+    'bi_weekly': (12, 26),
+    'weekly': (12, 52),
+}
+
+RECORD_FIELDS = (
+    'basic_salary', 'overtime_hours', 'overtime_rate', 'overtime_amount',
+    'allowances', 'deductions', 'tax', 'net_salary',
+)
+
+# Backends supporting INSERT ... ON CONFLICT DO UPDATE ... WHERE ... RETURNING
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+
+
+def _field_limit(field_name):
+    """Largest value in cents that fits the PayrollRecord column."""
+    return 10 ** PayrollRecord._meta.get_field(field_name).max_digits - 1
+
+
+class PayrollRun:
+    """Compute and persist PayrollRecord rows for one period.
+
+    ``progress`` is an optional callable receiving ``(phase, done, total)``
+    after each chunk is written.
+    """
+
+    def __init__(self, period, employee_ids=None, chunk_size=None, progress=None):
+        self.period = period
+        self.employee_ids = employee_ids
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.progress = progress
+        self.timings = {}
+        self.errors = []
+
+    def run(self):
+        started = time.perf_counter()
+        with self._phase('load_employees'):
+            employee_ids, department_ids, salaries = self.load_employees()
+        with self._phase('load_overtime'):
+            overtime = self.load_overtime(employee_ids)
+        with self._phase('load_rules'):
+            plan = self.load_rules(employee_ids, department_ids)
+            tax_table = load_tax_table(tax_year(self.period))
+        with self._phase('compute'):
+            amounts = self.compute(salaries, overtime, plan, tax_table)
+            valid = self.validate(employee_ids, amounts)
+        with self._phase('write'):
+            created, updated, locked = self.write(employee_ids, amounts, valid)
+        self.timings['total'] = round(time.perf_counter() - started, 4)
+
+        logger.info(
+            'Payroll run for period %s: %d employees, %d created, %d updated in %.2fs',
+            self.period.pk, len(employee_ids), created, updated, self.timings['total']
+        )
+        return {
+            'period': self.period.pk,
+            'employees': len(employee_ids),
+            'created': created,
+            'updated': updated,
+            'locked': locked,
+            'failed': len(self.errors),
+            'failed_ids': [error['employee'] for error in self.errors],
+            'errors': self.errors,
+            'timings': self.timings,
+        }
+
+    @contextmanager
+    def _phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - started, 4)
+
+    def load_employees(self):
+        queryset = User.objects.filter(is_active=True, salary__isnull=False)
+        if self.employee_ids is not None:
+            queryset = queryset.filter(pk__in=self.employee_ids)
+        rows = list(queryset.order_by('pk').values_list('pk', 'department_id', 'salary'))
+        employee_ids = [pk for pk, _, _ in rows]
+        department_ids = [department_id for _, department_id, _ in rows]
+        salaries = np.fromiter((to_cents(salary) for _, _, salary in rows), dtype=np.int64, count=len(rows))
+        return employee_ids, department_ids, salaries
+
+    def load_overtime(self, employee_ids):
+        """Approved overtime in the period, as centi-hours aligned to ``employee_ids``."""
+        totals = approved_overtime(self.period.start_date, self.period.end_date, self.employee_ids)
+        return np.fromiter(
+            (to_cents(totals.get(pk) or 0) for pk in employee_ids),
+            dtype=np.int64,
+            count=len(employee_ids),
+        )
+
+    def load_rules(self, employee_ids, department_ids):
+        return compile_rules(employee_ids, department_ids)
+
+    def compute(self, salaries, overtime, plan, tax_table=None):
+        """Return a dict of int64 cent arrays, one entry per PayrollRecord field."""
+        numerator, denominator = PERIOD_SALARY_FACTORS.get(self.period.period_type, (1, 1))
+        basic = div_half_up(salaries * numerator, denominator)
+        rate = div_half_up(salaries * to_cents(OVERTIME_MULTIPLIER), to_cents(STANDARD_MONTHLY_HOURS))
+        overtime_amount = div_half_up(overtime * rate, 100)
+
+        allowance_total, taxable_allowances, deduction_total = plan.apply(basic, overtime_amount)
+        gross = basic + overtime_amount + allowance_total
+
+        taxable = basic + overtime_amount + taxable_allowances
+        tax = calculate_period_tax(self.period, taxable, tax_table)
+
+        return {
+            'basic_salary': basic,
+            'overtime_hours': overtime,
+            'overtime_rate': rate,
+            'overtime_amount': overtime_amount,
+            'allowances': allowance_total,
+            'deductions': deduction_total,
+            'tax': tax,
+            'net_salary': gross - deduction_total - tax,
+        }
+
+    def validate(self, employee_ids, amounts):
+        """Mask out employees whose amounts do not fit the record columns."""
+        valid = np.ones(len(employee_ids), dtype=bool)
+        for field in RECORD_FIELDS:
+            column = amounts[field]
+            bad = (column > _field_limit(field)) | (column < -_field_limit(field))
+            if field == 'net_salary':
+                bad |= column < 0
+            for index in np.flatnonzero(bad & valid):
+                self.errors.append({
+                    'employee': str(employee_ids[index]),
+                    'error': f'{field} out of range: {from_cents(column[index])}',
+                })
+            valid &= ~bad
+        return valid
+
+    def write(self, employee_ids, amounts, valid):
+        """Upsert the computed rows on (payroll_period, employee), chunk by chunk."""
+        existing = dict(
+            PayrollRecord.objects.filter(payroll_period=self.period).values_list('employee_id', 'status')
+        )
+        columns = {field: amounts[field].tolist() for field in RECORD_FIELDS}
+        records = []
+        locked = 0
+
+        for index, employee_id in enumerate(employee_ids):
+            if not valid[index]:
+                continue
+            status = existing.get(employee_id)
+            if status not in (None, 'pending'):
+                # Approved and paid records are never recomputed
+                locked += 1
+                continue
+            records.append(PayrollRecord(
+                payroll_period=self.period,
+                employee_id=employee_id,
+                **{field: from_cents(columns[field][index]) for field in RECORD_FIELDS}
+            ))
+
+        written = []
+        for start in range(0, len(records), self.chunk_size):
+            chunk = records[start:start + self.chunk_size]
+            try:
+                with transaction.atomic():
+                    chunk_written = self._upsert(chunk)
+                written.extend(chunk_written)
+                locked += len(chunk) - len(chunk_written)
+            except DatabaseError:
+                # Retry row by row so one bad employee does not sink the chunk
+                for record in chunk:
+                    try:
+                        with transaction.atomic():
+                            record_written = self._upsert([record])
+                        written.extend(record_written)
+                        locked += 1 - len(record_written)
+                    except DatabaseError as exc:
+                        self.errors.append({'employee': str(record.employee_id), 'error': str(exc)})
+            self._report('write', min(start + self.chunk_size, len(records)), len(records))
+
+        created = sum(1 for employee_id in written if employee_id not in existing)
+        return created, len(written) - created, locked
+
+    def _upsert(self, records):
+        """Upsert ``records`` on (payroll_period, employee), inside the caller's transaction.
+
+        Returns the employee ids written; records whose row is no longer
+        pending are skipped.
+        """
+        if connection.vendor not in UPSERT_VENDORS:
+            return self._upsert_locked(records)
+
+        quote = connection.ops.quote_name
+        table = quote(PayrollRecord._meta.db_table)
+        fields = [field for field in PayrollRecord._meta.concrete_fields if not field.primary_key]
+        updates = ', '.join(
+            f'{quote(column)} = excluded.{quote(column)}'
+            for column in [PayrollRecord._meta.get_field(field).column for field in RECORD_FIELDS + ('updated_at',)]
+        )
+        employee_key = PayrollRecord._meta.get_field('employee').target_field
+        written = []
+        batch_size = max(connection.ops.bulk_batch_size(fields, records), 1)
+        with connection.cursor() as cursor:
+            for start in range(0, len(records), batch_size):
+                batch = records[start:start + batch_size]
+                params = [
+                    field.get_db_prep_save(field.pre_save(record, add=True), connection)
+                    for record in batch
+                    for field in fields
+                ]
+                row = f'({", ".join(["%s"] * len(fields))})'
+                cursor.execute(
+                    f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+                    f'VALUES {", ".join([row] * len(batch))} '
+                    f'ON CONFLICT ({quote("payroll_period_id")}, {quote("employee_id")}) DO UPDATE SET {updates} '
+                    f'WHERE {table}.{quote("status")} = %s '
+                    f'RETURNING {quote("employee_id")}',
+                    [*params, 'pending'],
+                )
+                written.extend(employee_key.to_python(employee_id) for employee_id, in cursor.fetchall())
+        return written
+
+    def _upsert_locked(self, records):
+        """Upsert fallback: lock the existing rows and write only the pending ones."""
+        rows = PayrollRecord.objects.select_for_update().filter(
+            payroll_period=self.period, employee_id__in=[record.employee_id for record in records],
+        ).values_list('employee_id', 'status')
+        held = {employee_id for employee_id, status in rows if status != 'pending'}
+        records = [record for record in records if record.employee_id not in held]
+        PayrollRecord.objects.bulk_create(
+            records,
+            update_conflicts=True,
+            unique_fields=['payroll_period', 'employee'],
+            update_fields=list(RECORD_FIELDS) + ['updated_at'],
+        )
+        return [record.employee_id for record in records]
+
+    def _report(self, phase, done, total):
+        logger.debug('Payroll run for period %s: %s %d/%d', self.period.pk, phase, done, total)
+        if self.progress:
+            self.progress(phase, done, total)
+
+
+def run_payroll(period, employee_ids=None, chunk_size=None, progress=None):
+    """Compute and write every PayrollRecord of ``period``; returns a run summary."""
+    return PayrollRun(period, employee_ids, chunk_size, progress).run()
@@ -0,0 +1,208 @@
+"""
+Bank payment files.
+
+A payment file lists one credit transfer per paid PayrollRecord of a
+period that has bank details, as CSV or as SEPA-style pain.001 XML. Files
+are generated incrementally: records are read with a server-side cursor
+(QuerySet.iterator) and the file is yielded a block of lines at a time,
+so memory use does not grow with the number of records.
+
+While streaming, the exporter hashes what it yields and counts the
+transfers and their amounts; once the generator is exhausted,
+``manifest`` holds the file's checksum, transaction count and control sum.
+The output only depends on the database, so generating the file again
+reproduces the same checksum.
+"""
+import abc
+import csv
+import hashlib
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.db.models import Count, Sum
+
+from .models import PayrollAuditLog, PayrollRecord
+from .money import from_cents, to_cents
+
+DEBTOR_NAME = getattr(settings, 'PAYROLL_DEBTOR_NAME', 'HR Management System')
+DEBTOR_IBAN = getattr(settings, 'PAYROLL_DEBTOR_IBAN', '')
+DEBTOR_BIC = getattr(settings, 'PAYROLL_DEBTOR_BIC', '')
+PAYMENT_CURRENCY = getattr(settings, 'PAYROLL_PAYMENT_CURRENCY', 'EUR')
+
+# Lines buffered before each yield
+BLOCK_LINES = 500
+
+PAYMENT_FIELDS = (
+    'id', 'employee__employee_id', 'employee__first_name', 'employee__last_name',
+    'employee__bank_name', 'employee__bank_account_number',
+    'net_salary', 'payment_date', 'payment_reference',
+)
+
+
+def payment_records(period):
+    """Paid records of ``period`` that can be paid by bank transfer."""
+    return PayrollRecord.objects.filter(
+        payroll_period=period, status='paid'
+    ).exclude(employee__bank_account_number='')
+
+
+class _Echo:
+    """File-like object whose write returns the line, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+class PaymentFileExporter(abc.ABC):
+    """Base class; subclasses render each transfer and, when the format has them, the header and footer."""
+    content_type = 'application/octet-stream'
+    extension = ''
+
+    def __init__(self, period):
+        self.period = period
+        self.manifest = None
+
+    @property
+    def filename(self):
+        return f'payments_{self.period.pk}_{self.period.end_date:%Y_%m_%d}.{self.extension}'
+
+    def execution_time(self):
+        """When the payments were made: the period's last pay batch, for reproducible files."""
+        log = PayrollAuditLog.objects.filter(payroll_period=self.period, action='pay').order_by('-created_at').first()
+        return log.created_at if log else self.period.updated_at
+
+    def header(self, count, total):
+        return ''
+
+    @abc.abstractmethod
+    def transfer(self, row):
+        """One transfer of the file, for a row of PAYMENT_FIELDS values."""
+
+    def footer(self):
+        return ''
+
+    def __iter__(self):
+        records = payment_records(self.period)
+        summary = records.aggregate(count=Count('pk'), total=Sum('net_salary'))
+        expected_count = summary['count']
+        expected_total = to_cents(summary['total'] or 0)
+
+        digest = hashlib.sha256()
+        size = count = total = 0
+        block = [self.header(expected_count, from_cents(expected_total))]
+
+        rows = records.order_by('pk').values(*PAYMENT_FIELDS).iterator(chunk_size=2000)
+        for row in rows:
+            block.append(self.transfer(row))
+            count += 1
+            total += to_cents(row['net_salary'])
+            if len(block) >= BLOCK_LINES:
+                data = ''.join(block).encode('utf-8')
+                digest.update(data)
+                size += len(data)
+                block = []
+                yield data
+        block.append(self.footer())
+        data = ''.join(block).encode('utf-8')
+        digest.update(data)
+        size += len(data)
+        yield data
+
+        self.manifest = {
+            'period': self.period.pk,
+            'filename': self.filename,
+            'format': self.extension,
+            'transactions': count,
+            'control_sum': str(from_cents(total)),
+            'currency': PAYMENT_CURRENCY,
+            'bytes': size,
+            'sha256': digest.hexdigest(),
+            # Records changed while streaming would make these differ from the header
+            'consistent': count == expected_count and total == expected_total,
+        }
+
+
+class CSVPaymentFile(PaymentFileExporter):
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    COLUMNS = (
+        'record_id', 'employee_id', 'beneficiary', 'bank_name', 'account_number',
+        'amount', 'currency', 'payment_date', 'reference',
+    )
+
+    def __init__(self, period):
+        super().__init__(period)
+        self._writer = csv.writer(_Echo(), lineterminator='\n')
+
+    def header(self, count, total):
+        return self._writer.writerow(self.COLUMNS)
+
+    def transfer(self, row):
+        return self._writer.writerow((
+            row['id'],
+            row['employee__employee_id'],
+            f"{row['employee__first_name']} {row['employee__last_name']}".strip(),
+            row['employee__bank_name'],
+            row['employee__bank_account_number'],
+            row['net_salary'],
+            PAYMENT_CURRENCY,
+            row['payment_date'] or '',
+            row['payment_reference'],
+        ))
+
+
+class SEPAPaymentFile(PaymentFileExporter):
+    """pain.001.001.03 customer credit transfer initiation, one payment batch."""
+    content_type = 'application/xml'
+    extension = 'xml'
+
+    def header(self, count, total):
+        executed = self.execution_time()
+        message_id = f'PAYROLL-{self.period.pk}-{executed:%Y%m%d%H%M%S}'
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Document xmlns="urn:iso:std:iso:20022:tech:xsd:pain.001.001.03">\n'
+            '<CstmrCdtTrfInitn>\n'
+            '<GrpHdr>'
+            f'<MsgId>{message_id}</MsgId>'
+            f'<CreDtTm>{executed:%Y-%m-%dT%H:%M:%S}</CreDtTm>'
+            f'<NbOfTxs>{count}</NbOfTxs>'
+            f'<CtrlSum>{total}</CtrlSum>'
+            f'<InitgPty><Nm>{escape(DEBTOR_NAME)}</Nm></InitgPty>'
+            '</GrpHdr>\n'
+            '<PmtInf>'
+            f'<PmtInfId>{message_id}</PmtInfId>'
+            '<PmtMtd>TRF</PmtMtd>'
+            f'<NbOfTxs>{count}</NbOfTxs>'
+            f'<CtrlSum>{total}</CtrlSum>'
+            '<PmtTpInf><SvcLvl><Cd>SEPA</Cd></SvcLvl><CtgyPurp><Cd>SALA</Cd></CtgyPurp></PmtTpInf>'
+            f'<ReqdExctnDt>{executed:%Y-%m-%d}</ReqdExctnDt>'
+            f'<Dbtr><Nm>{escape(DEBTOR_NAME)}</Nm></Dbtr>'
+            f'<DbtrAcct><Id><IBAN>{escape(DEBTOR_IBAN)}</IBAN></Id></DbtrAcct>'
+            f'<DbtrAgt><FinInstnId><BIC>{escape(DEBTOR_BIC)}</BIC></FinInstnId></DbtrAgt>'
+            '<ChrgBr>SLEV</ChrgBr>\n'
+        )
+
+    def transfer(self, row):
+        name = f"{row['employee__first_name']} {row['employee__last_name']}".strip()
+        reference = row['payment_reference'] or f"PAYROLL-{self.period.pk}-{row['id']}"
+        return (
+            '<CdtTrfTxInf>'
+            f"<PmtId><EndToEndId>{escape(reference)}</EndToEndId></PmtId>"
+            f'<Amt><InstdAmt Ccy="{PAYMENT_CURRENCY}">{row["net_salary"]}</InstdAmt></Amt>'
+            f"<CdtrAgt><FinInstnId><Nm>{escape(row['employee__bank_name'])}</Nm></FinInstnId></CdtrAgt>"
+            f'<Cdtr><Nm>{escape(name)}</Nm></Cdtr>'
+            f"<CdtrAcct><Id><IBAN>{escape(row['employee__bank_account_number'])}</IBAN></Id></CdtrAcct>"
+            f"<RmtInf><Ustrd>Salary {self.period.start_date} - {self.period.end_date}</Ustrd></RmtInf>"
+            '</CdtTrfTxInf>\n'
+        )
+
+    def footer(self):
+        return '</PmtInf>\n</CstmrCdtTrfInitn>\n</Document>\n'
+
+
+EXPORTERS = {
+    'csv': CSVPaymentFile,
+    'xml': SEPAPaymentFile,
+}
@@ -0,0 +1,123 @@
+"""
+Maintenance of the PayrollLedger table.
+
+Ledger rows are keyed by (employee, year), the year being the one the
+payroll period ends in. Only approved and paid records count. A refresh
+re-aggregates the records of the given employees and years in one grouped
+query and upserts the totals, so it is idempotent and safe to call from
+signals, bulk actions and the rebuild command alike.
+
+On PostgreSQL and SQLite the aggregate and the upsert run as a single
+INSERT ... SELECT ... ON CONFLICT statement, so refreshing a whole period
+never materializes ledger rows in Python.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, ExtractYear, Round
+from django.utils import timezone
+
+from .models import PayrollLedger, PayrollRecord
+
+LEDGER_FIELDS = ('record_count', 'gross_total', 'deductions_total', 'tax_total', 'net_total')
+
+# Backends supporting INSERT ... SELECT ... ON CONFLICT DO UPDATE
+UPSERT_VENDORS = ('postgresql', 'sqlite')
+
+
+def ledger_year(period):
+    return period.end_date.year
+
+
+def _money(expression):
+    return Coalesce(Round(Sum(expression), 2), Value(Decimal('0.00')))
+
+
+def _aggregate(records):
+    return records.filter(
+        status__in=PayrollRecord.PROCESSED_STATUSES
+    ).annotate(
+        year=ExtractYear('payroll_period__end_date')
+    ).values('employee_id', 'year').annotate(
+        record_count=Count('id'),
+        gross_total=_money(F('basic_salary') + F('overtime_amount') + F('allowances')),
+        deductions_total=_money('deductions'),
+        tax_total=_money('tax'),
+        net_total=_money('net_salary'),
+    ).order_by()
+
+
+def _upsert_totals(records, now):
+    """Upsert the aggregated totals of ``records`` into the ledger."""
+    if connection.vendor not in UPSERT_VENDORS:
+        rows = [
+            PayrollLedger(updated_at=now, **row)
+            for row in _aggregate(records)
+        ]
+        PayrollLedger.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['employee', 'year'],
+            update_fields=list(LEDGER_FIELDS) + ['updated_at'],
+        )
+        return
+
+    quote = connection.ops.quote_name
+    select_sql, params = _aggregate(records).query.sql_with_params()
+    columns = ['employee_id', 'year'] + list(LEDGER_FIELDS)
+    updates = ', '.join(f'{quote(column)} = excluded.{quote(column)}' for column in LEDGER_FIELDS + ('updated_at',))
+    sql = (
+        f'INSERT INTO {quote(PayrollLedger._meta.db_table)} '
+        f'({", ".join(quote(column) for column in columns + ["updated_at"])}) '
+        f'SELECT {", ".join(quote(column) for column in columns)}, %s FROM ({select_sql}) totals '
+        f'WHERE true '
+        f'ON CONFLICT ({quote("employee_id")}, {quote("year")}) DO UPDATE SET {updates}'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (now, *params))
+
+
+@transaction.atomic
+def _refresh(employees, years):
+    """Recompute the ledger of ``employees`` (ids or a values() subquery) for ``years``."""
+    if not years:
+        return
+    now = timezone.now()
+    # Keys left without processed records drop to zero
+    PayrollLedger.objects.filter(employee_id__in=employees, year__in=years).update(
+        updated_at=now, **{field: 0 for field in LEDGER_FIELDS}
+    )
+    _upsert_totals(
+        PayrollRecord.objects.filter(employee_id__in=employees, payroll_period__end_date__year__in=years),
+        now,
+    )
+
+
+def refresh_ledger(keys):
+    """Recompute the ledger rows for an iterable of (employee_id, year) keys."""
+    keys = set(keys)
+    _refresh({employee_id for employee_id, _ in keys}, {year for _, year in keys})
+    return len(keys)
+
+
+def refresh_ledger_for_records(records):
+    """Refresh the ledger keys touched by a PayrollRecord queryset, set-based."""
+    years = set(
+        records.annotate(year=ExtractYear('payroll_period__end_date'))
+        .values_list('year', flat=True).distinct().order_by()
+    )
+    _refresh(records.values('employee_id'), years)
+
+
+@transaction.atomic
+def rebuild_ledger(year=None):
+    """Rebuild the whole ledger, or one year of it, from the payroll records."""
+    records = PayrollRecord.objects.all()
+    ledgers = PayrollLedger.objects.all()
+    if year is not None:
+        records = records.filter(payroll_period__end_date__year=year)
+        ledgers = ledgers.filter(year=year)
+    ledgers.delete()
+    _upsert_totals(records, timezone.now())
+    return ledgers.count()
@@ -0,0 +1,34 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from payroll.exports import EXPORTERS
+from payroll.models import PayrollPeriod
+
+class Command(BaseCommand):
+    help = 'Write the bank payment file of a paid payroll period, with a .manifest.json next to it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('period', type=int, help='Payroll period id')
+        parser.add_argument('--format', choices=sorted(EXPORTERS), default='csv')
+        parser.add_argument('--output-dir', default='.')
+
+    def handle(self, *args, **options):
+        try:
+            period = PayrollPeriod.objects.get(pk=options['period'])
+        except PayrollPeriod.DoesNotExist:
+            raise CommandError(f"Payroll period {options['period']} does not exist")
+
+        exporter = EXPORTERS[options['format']](period)
+        path = os.path.join(options['output_dir'], exporter.filename)
+        with open(path, 'wb') as output:
+            for data in exporter:
+                output.write(data)
+        with open(f'{path}.manifest.json', 'w') as output:
+            json.dump(exporter.manifest, output, indent=2)
+
+        manifest = exporter.manifest
+        self.stdout.write(self.style.SUCCESS(
+            f"{path}: {manifest['transactions']} transfers, {manifest['control_sum']} {manifest['currency']}, "
+            f"sha256 {manifest['sha256']}"
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from payroll.ledger import rebuild_ledger
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-employee payroll ledger from approved and paid payroll records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help='Only rebuild this year')
+
+    def handle(self, *args, **options):
+        written = rebuild_ledger(year=options['year'])
+        self.stdout.write(self.style.SUCCESS(f'{written} ledger rows rebuilt'))
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0003_payrollrun_payrollrunchunk'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('record_count', models.PositiveIntegerField(default=0)),
+                ('gross_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('deductions_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('tax_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('net_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_ledgers', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'payroll ledger',
+                'verbose_name_plural': 'payroll ledgers',
+                'ordering': ['-year'],
+                'unique_together': {('employee', 'year')},
+            },
+        ),
+    ]
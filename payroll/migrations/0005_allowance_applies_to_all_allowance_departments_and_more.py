@@ -0,0 +1,56 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('employees', '0002_remove_department_manager_alter_department_options_and_more'),
+        ('payroll', '0004_payrollledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='allowance',
+            name='applies_to_all',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='allowance',
+            name='departments',
+            field=models.ManyToManyField(blank=True, related_name='payroll_allowances', to='employees.department'),
+        ),
+        migrations.AddField(
+            model_name='allowance',
+            name='employees',
+            field=models.ManyToManyField(blank=True, related_name='payroll_allowances', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='allowance',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='deduction',
+            name='applies_to_all',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='deduction',
+            name='departments',
+            field=models.ManyToManyField(blank=True, related_name='payroll_deductions', to='employees.department'),
+        ),
+        migrations.AddField(
+            model_name='deduction',
+            name='employees',
+            field=models.ManyToManyField(blank=True, related_name='payroll_deductions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='deduction',
+            name='is_active',
+            field=models.BooleanField(default=True),
+        ),
+    ]
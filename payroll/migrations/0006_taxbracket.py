@@ -0,0 +1,31 @@
+# Generated by Django 5.0.1 on 2026-10-18 08:15
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0005_allowance_applies_to_all_allowance_departments_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaxBracket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField()),
+                ('lower_bound', models.DecimalField(decimal_places=2, max_digits=14, validators=[django.core.validators.MinValueValidator(0)])),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'tax bracket',
+                'verbose_name_plural': 'tax brackets',
+                'ordering': ['-year', 'lower_bound'],
+                'unique_together': {('year', 'lower_bound')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.1 on 2026-10-18 09:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payroll', '0007_payrollauditlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payrollrunchunk',
+            name='lease_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,70 @@
+from decimal import Decimal, ROUND_HALF_UP
 from django.db import models
+from django.db.models import Count, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
-from django.core.validators import MinValueValidator
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.utils.translation import gettext_lazy as _
 
+CENT = Decimal('0.01')
+
+class PayrollRuleQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+
+    def for_employee(self, employee):
+        """Active rules that apply to ``employee`` directly, through its department or to everyone."""
+        assigned = Q(applies_to_all=True) | Q(employees=employee)
+        if employee.department_id:
+            assigned |= Q(departments=employee.department_id)
+        return self.active().filter(assigned).distinct()
+
+class PayrollRule(models.Model):
+    """Fields and assignment shared by allowances and deductions.
+
+    A rule applies to every employee when ``applies_to_all`` is set, and
+    otherwise only to the employees and departments it is assigned to.
+    Non-fixed rules are a percentage of a base amount; see calculate_amount.
+    """
+    name = models.CharField(max_length=100)
+    description = models.TextField(blank=True)
+    is_fixed = models.BooleanField(default=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    percentage = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(0)], default=0)
+    is_active = models.BooleanField(default=True)
+    applies_to_all = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PayrollRuleQuerySet.as_manager()
+
+    def calculate_amount(self, base):
+        """Amount of this rule for ``base``, rounded half-up to the cent."""
+        if self.is_fixed:
+            return self.amount
+        return (Decimal(base) * self.percentage / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        abstract = True
+
+class PayrollPeriodQuerySet(models.QuerySet):
+    def with_totals(self):
+        """Annotate each period with its payroll total and processed record count."""
+        return self.annotate(
+            total_payroll=Coalesce(
+                Sum('payroll_records__net_salary'),
+                Value(Decimal('0.00')),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2),
+            ),
+            processed_records=Count(
+                'payroll_records',
+                filter=Q(payroll_records__status__in=PayrollRecord.PROCESSED_STATUSES),
+            ),
+        )
+
 class PayrollPeriod(models.Model):
     PERIOD_TYPE_CHOICES = (
         ('monthly', 'Monthly'),
@@ -31,6 +93,8 @@ class PayrollPeriod(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PayrollPeriodQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.period_type} Payroll ({self.start_date} to {self.end_date})"
 
@@ -46,6 +110,12 @@ class PayrollRecord(models.Model):
         ('paid', 'Paid'),
         ('cancelled', 'Cancelled'),
     )
+    PROCESSED_STATUSES = ('approved', 'paid')
+    # Target status -> statuses a record may move to it from
+    TRANSITIONS = {
+        'approved': ('pending',),
+        'paid': ('approved',),
+    }
 
     payroll_period = models.ForeignKey(PayrollPeriod, on_delete=models.CASCADE, related_name='payroll_records')
     employee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='payroll_records')
@@ -88,34 +158,168 @@ class PayrollRecord(models.Model):
         ordering = ['-created_at']
         unique_together = ['payroll_period', 'employee']
 
-class Allowance(models.Model):
-    name = models.CharField(max_length=100)
-    description = models.TextField(blank=True)
+class Allowance(PayrollRule):
+    """A payment on top of basic salary; percentages are of the basic salary."""
     is_taxable = models.BooleanField(default=True)
-    is_fixed = models.BooleanField(default=True)
-    amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
+    employees = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='payroll_allowances')
+    departments = models.ManyToManyField('employees.Department', blank=True, related_name='payroll_allowances')
+
+    class Meta:
+        verbose_name = _('allowance')
+        verbose_name_plural = _('allowances')
+
+class Deduction(PayrollRule):
+    """A withholding from pay; percentages are of the gross salary."""
+    employees = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, related_name='payroll_deductions')
+    departments = models.ManyToManyField('employees.Department', blank=True, related_name='payroll_deductions')
+
+    class Meta:
+        verbose_name = _('deduction')
+        verbose_name_plural = _('deductions')
+
+class PayrollRun(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    payroll_period = models.ForeignKey(PayrollPeriod, on_delete=models.CASCADE, related_name='runs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    chunk_size = models.PositiveIntegerField()
+    total_employees = models.PositiveIntegerField(default=0)
+    processed_employees = models.PositiveIntegerField(default=0)
+    failed_employees = models.PositiveIntegerField(default=0)
+    started_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='payroll_runs'
+    )
+    timings = models.JSONField(default=dict, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.name
+        return f"Run {self.pk} of {self.payroll_period}"
 
     class Meta:
-        verbose_name = _('allowance')
-        verbose_name_plural = _('allowances')
+        verbose_name = _('payroll run')
+        verbose_name_plural = _('payroll runs')
+        ordering = ['-created_at']
 
-class Deduction(models.Model):
-    name = models.CharField(max_length=100)
-    description = models.TextField(blank=True)
-    is_fixed = models.BooleanField(default=True)
-    amount = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
-    percentage = models.DecimalField(max_digits=5, decimal_places=2, validators=[MinValueValidator(0)], default=0)
+class PayrollRunChunk(models.Model):
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    run = models.ForeignKey(PayrollRun, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    employee_ids = models.JSONField(default=list)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    processed_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True)
+    timings = models.JSONField(default=dict, blank=True)
+    # A running chunk whose lease has run out is taken to have lost its worker
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.name
+        return f"Chunk {self.index} of run {self.run_id}"
 
     class Meta:
-        verbose_name = _('deduction')
-        verbose_name_plural = _('deductions')
+        verbose_name = _('payroll run chunk')
+        verbose_name_plural = _('payroll run chunks')
+        ordering = ['run', 'index']
+        unique_together = ['run', 'index']
+
+class PayrollLedger(models.Model):
+    """Running per-employee, per-year totals of approved and paid payroll records."""
+    employee = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='payroll_ledgers')
+    year = models.PositiveIntegerField()
+    record_count = models.PositiveIntegerField(default=0)
+    gross_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    deductions_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    tax_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    net_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.employee} - {self.year}"
+
+    class Meta:
+        verbose_name = _('payroll ledger')
+        verbose_name_plural = _('payroll ledgers')
+        ordering = ['-year']
+        unique_together = ['employee', 'year']
+
+class TaxBracket(models.Model):
+    """One band of a year's progressive income tax.
+
+    Bounds are annual amounts; a band runs from its lower bound up to the
+    next band's lower bound and ``rate`` (a percentage) applies to the
+    income inside it.
+    """
+    year = models.PositiveIntegerField()
+    lower_bound = models.DecimalField(max_digits=14, decimal_places=2, validators=[MinValueValidator(0)])
+    rate = models.DecimalField(
+        max_digits=5, decimal_places=2, validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.year}: {self.rate}% from {self.lower_bound}"
+
+    class Meta:
+        verbose_name = _('tax bracket')
+        verbose_name_plural = _('tax brackets')
+        ordering = ['-year', 'lower_bound']
+        unique_together = ['year', 'lower_bound']
+
+class PayrollAuditLog(models.Model):
+    """One row per bulk status change of payroll records."""
+    ACTION_CHOICES = (
+        ('approve', 'Approve'),
+        ('pay', 'Pay'),
+    )
+
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    payroll_period = models.ForeignKey(
+        PayrollPeriod,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='audit_logs'
+    )
+    performed_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='payroll_audit_logs'
+    )
+    from_statuses = models.JSONField(default=list)
+    to_status = models.CharField(max_length=20, choices=PayrollRecord.STATUS_CHOICES)
+    record_count = models.PositiveIntegerField(default=0)
+    record_ids = models.JSONField(default=list)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    details = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.record_count} records ({self.created_at:%Y-%m-%d %H:%M})"
+
+    class Meta:
+        verbose_name = _('payroll audit log')
+        verbose_name_plural = _('payroll audit logs')
+        ordering = ['-created_at']
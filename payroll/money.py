@@ -0,0 +1,21 @@
+"""
+Integer-cent helpers shared by the payroll computations.
+
+Amounts are carried as int64 cents and rounded half-up at the same points
+a Decimal computation would round them, so stored values are exact.
+"""
+from decimal import Decimal
+
+
+def to_cents(value):
+    """Convert a Decimal with at most two decimal places to integer cents."""
+    return int(Decimal(value).scaleb(2))
+
+
+def from_cents(value):
+    return Decimal(int(value)).scaleb(-2)
+
+
+def div_half_up(numerator, denominator):
+    """Integer division rounded half-up, for non-negative numerators."""
+    return (2 * numerator + denominator) // (2 * denominator)
@@ -0,0 +1,90 @@
+"""
+Bridge from attendance overtime to payroll records.
+
+A record's overtime is the approved Attendance overtime of its employee
+within the period, summed in one GROUP BY query (``approved_overtime``;
+the payroll engine loads it the same way). ``sync_overtime`` compares
+those totals with the pending records of a period and recomputes only the
+records that drifted, through the engine for just those employees, so
+their overtime amount, tax and net salary follow; the engine writes them
+back with one bulk upsert per chunk. Approved and paid records are never
+touched.
+
+Attendance changes after a run reach the records incrementally: the
+``attendances_changed`` signal carries the (employee, date) keys of every
+write, including bulk ingestion and re-evaluation, and
+``schedule_overtime_sync`` queues a sync of just those employees for each
+period with a pending record covering one of the dates.
+"""
+from django.db import transaction
+from django.db.models import Sum
+
+from attendance.models import Attendance
+from .models import PayrollRecord
+from .money import to_cents
+
+
+def approved_overtime(start, end, employee_ids=None):
+    """Employee id -> total approved overtime hours from ``start`` to ``end``, one query."""
+    attendances = Attendance.objects.filter(is_approved=True, date__range=[start, end])
+    if employee_ids is not None:
+        attendances = attendances.filter(employee_id__in=employee_ids)
+    return dict(
+        attendances.values('employee_id')
+        .annotate(total=Sum('overtime_hours'))
+        .values_list('employee_id', 'total')
+        .order_by()
+    )
+
+
+def sync_overtime(period, employee_ids=None):
+    """Recompute the pending records of ``period`` whose overtime no longer matches attendance.
+
+    ``employee_ids`` limits the check to these employees. Returns the ids of
+    the employees whose records were recomputed.
+    """
+    from .engine import PayrollRun
+
+    records = PayrollRecord.objects.filter(payroll_period=period, status='pending')
+    if employee_ids is not None:
+        records = records.filter(employee_id__in=employee_ids)
+    stored = dict(records.values_list('employee_id', 'overtime_hours'))
+    if not stored:
+        return []
+    totals = approved_overtime(period.start_date, period.end_date, None if employee_ids is None else list(stored))
+    stale = [
+        employee_id for employee_id, hours in stored.items()
+        if to_cents(hours) != to_cents(totals.get(employee_id) or 0)
+    ]
+    if stale:
+        PayrollRun(period, employee_ids=stale).run()
+    return stale
+
+
+def schedule_overtime_sync(keys):
+    """Queue overtime syncs for the pending records covering (employee_id, date) ``keys``."""
+    keys = set(keys)
+    if not keys:
+        return
+    from .tasks import sync_period_overtime
+
+    dates_by_employee = {}
+    for employee_id, day in keys:
+        dates_by_employee.setdefault(employee_id, []).append(day)
+    dates = [day for _, day in keys]
+    candidates = PayrollRecord.objects.filter(
+        status='pending',
+        employee_id__in=dates_by_employee,
+        payroll_period__start_date__lte=max(dates),
+        payroll_period__end_date__gte=min(dates),
+    ).values_list('payroll_period_id', 'payroll_period__start_date', 'payroll_period__end_date', 'employee_id')
+
+    affected = {}
+    for period_id, start, end, employee_id in candidates:
+        if any(start <= day <= end for day in dates_by_employee[employee_id]):
+            affected.setdefault(period_id, set()).add(employee_id)
+    for period_id, period_employees in affected.items():
+        employee_ids = [str(employee_id) for employee_id in period_employees]
+        transaction.on_commit(
+            lambda period_id=period_id, employee_ids=employee_ids: sync_period_overtime.delay(period_id, employee_ids)
+        )
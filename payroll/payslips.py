@@ -0,0 +1,198 @@
+"""
+PDF payslips.
+
+``render_payslip`` turns one record's plain values into a PDF with
+reportlab. ``stream_period_payslips`` renders every record of a period in
+a process pool and yields a ZIP archive piece by piece as the PDFs come
+back, keeping only a bounded window of payslips in flight.
+
+The pool is started on first use and shared by every download of the
+process, so concurrent downloads queue for the same PAYSLIP_RENDER_WORKERS
+processes instead of each starting their own.
+"""
+import io
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+from accounts.utils import format_currency
+from .models import PayrollRecord
+
+COMPANY_NAME = getattr(settings, 'PAYSLIP_COMPANY_NAME', 'HR Management System')
+CURRENCY = getattr(settings, 'PAYSLIP_CURRENCY', 'USD')
+RENDER_WORKERS = getattr(settings, 'PAYSLIP_RENDER_WORKERS', None) or os.cpu_count() or 1
+
+_pool = None
+_pool_lock = threading.Lock()
+
+PAYSLIP_FIELDS = (
+    'id', 'employee__employee_id', 'employee__first_name', 'employee__last_name',
+    'employee__department__name', 'employee__position__title',
+    'payroll_period__start_date', 'payroll_period__end_date',
+    'basic_salary', 'overtime_hours', 'overtime_rate', 'overtime_amount',
+    'allowances', 'deductions', 'tax', 'net_salary',
+    'status', 'payment_date', 'payment_method',
+)
+
+
+def payslip_values(queryset):
+    """Plain, picklable values for each record of ``queryset``."""
+    return queryset.order_by('pk').values(*PAYSLIP_FIELDS)
+
+
+def payslip_filename(data):
+    start = data['payroll_period__start_date']
+    return f"payslip_{data['employee__employee_id'] or data['id']}_{start:%Y_%m_%d}.pdf"
+
+
+def render_payslip(data):
+    """Render one payslip to PDF bytes."""
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4, pageCompression=1)
+    width, height = A4
+    left, right = 20 * mm, width - 20 * mm
+    y = height - 25 * mm
+
+    pdf.setTitle(payslip_filename(data))
+    pdf.setFont('Helvetica-Bold', 16)
+    pdf.drawString(left, y, COMPANY_NAME)
+    pdf.setFont('Helvetica', 11)
+    pdf.drawRightString(right, y, 'Payslip')
+    y -= 8 * mm
+    pdf.drawString(
+        left, y,
+        f"Period: {data['payroll_period__start_date']} - {data['payroll_period__end_date']}"
+    )
+    y -= 12 * mm
+
+    details = (
+        ('Employee', f"{data['employee__first_name']} {data['employee__last_name']}"),
+        ('Employee ID', data['employee__employee_id'] or ''),
+        ('Department', data['employee__department__name'] or ''),
+        ('Position', data['employee__position__title'] or ''),
+    )
+    for label, value in details:
+        pdf.setFont('Helvetica-Bold', 10)
+        pdf.drawString(left, y, label)
+        pdf.setFont('Helvetica', 10)
+        pdf.drawString(left + 35 * mm, y, str(value))
+        y -= 6 * mm
+    y -= 6 * mm
+
+    gross = data['basic_salary'] + data['overtime_amount'] + data['allowances']
+    lines = (
+        ('Basic salary', data['basic_salary']),
+        (f"Overtime ({data['overtime_hours']} h x {data['overtime_rate']})", data['overtime_amount']),
+        ('Allowances', data['allowances']),
+        ('Gross salary', gross),
+        ('Deductions', data['deductions']),
+        ('Tax', data['tax']),
+    )
+    pdf.line(left, y + 4 * mm, right, y + 4 * mm)
+    for label, amount in lines:
+        pdf.setFont('Helvetica-Bold' if label == 'Gross salary' else 'Helvetica', 10)
+        pdf.drawString(left, y, label)
+        pdf.drawRightString(right, y, format_currency(amount, CURRENCY))
+        y -= 6 * mm
+    pdf.line(left, y + 4 * mm, right, y + 4 * mm)
+    pdf.setFont('Helvetica-Bold', 12)
+    pdf.drawString(left, y - 2 * mm, 'Net salary')
+    pdf.drawRightString(right, y - 2 * mm, format_currency(data['net_salary'], CURRENCY))
+    y -= 14 * mm
+
+    pdf.setFont('Helvetica', 9)
+    payment = f"Status: {data['status']}"
+    if data['payment_date']:
+        payment += f" - paid on {data['payment_date']}"
+    if data['payment_method']:
+        payment += f" by {data['payment_method']}"
+    pdf.drawString(left, y, payment)
+
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+class _ZipStream:
+    """Unseekable sink that lets zipfile write entries we can yield right away."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def render_pool():
+    """The process pool payslips are rendered in, started on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS)
+        return _pool
+
+
+def _discard_pool(pool):
+    """Drop ``pool`` once one of its processes died, so the next download starts a new one."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def stream_period_payslips(period, window=None):
+    """Yield a ZIP archive holding one PDF payslip per record of ``period``.
+
+    At most ``window`` payslips (four per render worker by default) are
+    in flight at once.
+    """
+    window = window or RENDER_WORKERS * 4
+    rows = payslip_values(PayrollRecord.objects.filter(payroll_period=period)).iterator(chunk_size=500)
+    sink = _ZipStream()
+    archive = zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED)
+    executor = render_pool()
+    pending = deque()
+
+    try:
+        for data in rows:
+            pending.append((payslip_filename(data), executor.submit(render_payslip, data)))
+            if len(pending) >= window:
+                name, future = pending.popleft()
+                archive.writestr(name, future.result())
+                yield sink.drain()
+        while pending:
+            name, future = pending.popleft()
+            archive.writestr(name, future.result())
+            yield sink.drain()
+        archive.close()
+        yield sink.drain()
+    except BrokenProcessPool:
+        _discard_pool(executor)
+        raise
+    finally:
+        # Payslips of an aborted download must not hold up the others
+        for _, future in pending:
+            future.cancel()
@@ -1,13 +1,19 @@
+from decimal import Decimal
+from django.db.models import Sum
 from rest_framework import serializers
-from .models import PayrollPeriod, PayrollRecord, Allowance, Deduction
+from .models import PayrollPeriod, PayrollRecord, Allowance, Deduction, PayrollRun, PayrollRunChunk, PayrollLedger, TaxBracket, PayrollAuditLog
 from employees.serializers import EmployeeListSerializer
 
+# Formats computed totals the way model DecimalFields are rendered
+MONEY_FIELD = serializers.DecimalField(max_digits=14, decimal_places=2)
+
 class AllowanceSerializer(serializers.ModelSerializer):
     class Meta:
         model = Allowance
         fields = (
             'id', 'name', 'description', 'amount', 'is_taxable',
-            'is_fixed', 'percentage', 'created_at', 'updated_at'
+            'is_fixed', 'percentage', 'is_active', 'applies_to_all',
+            'employees', 'departments', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
@@ -27,7 +33,8 @@ class DeductionSerializer(serializers.ModelSerializer):
         model = Deduction
         fields = (
             'id', 'name', 'description', 'amount', 'is_fixed',
-            'percentage', 'is_tax_deductible', 'created_at', 'updated_at'
+            'percentage', 'is_active', 'applies_to_all',
+            'employees', 'departments', 'created_at', 'updated_at'
         )
         read_only_fields = ('id', 'created_at', 'updated_at')
 
@@ -49,53 +56,75 @@ class PayrollPeriodSerializer(serializers.ModelSerializer):
     class Meta:
         model = PayrollPeriod
         fields = (
-            'id', 'period_type', 'start_date', 'end_date',
-            'payment_date', 'status', 'total_payroll',
-            'processed_records', 'notes', 'created_at', 'updated_at'
+            'id', 'period_type', 'start_date', 'end_date', 'status',
+            'total_payroll', 'processed_records', 'notes',
+            'created_at', 'updated_at'
         )
         read_only_fields = (
             'id', 'total_payroll', 'processed_records',
             'created_at', 'updated_at'
         )
 
+    # Both totals come from PayrollPeriod.objects.with_totals() annotations;
+    # the queries below only run for instances that were not annotated.
     def get_total_payroll(self, obj):
-        return obj.calculate_total_payroll()
+        if hasattr(obj, 'total_payroll'):
+            total = obj.total_payroll
+        else:
+            total = obj.payroll_records.aggregate(total=Sum('net_salary'))['total'] or Decimal('0.00')
+        return MONEY_FIELD.to_representation(total)
 
     def get_processed_records(self, obj):
-        return obj.payrollrecord_set.filter(status='processed').count()
+        if hasattr(obj, 'processed_records'):
+            return obj.processed_records
+        return obj.payroll_records.filter(status__in=PayrollRecord.PROCESSED_STATUSES).count()
 
     def validate(self, data):
-        if data['start_date'] >= data['end_date']:
+        start_date = data.get('start_date', getattr(self.instance, 'start_date', None))
+        end_date = data.get('end_date', getattr(self.instance, 'end_date', None))
+        if start_date and end_date and start_date >= end_date:
             raise serializers.ValidationError({
                 'end_date': 'End date must be after start date'
             })
-        if data['payment_date'] < data['end_date']:
-            raise serializers.ValidationError({
-                'payment_date': 'Payment date must be after period end date'
-            })
         return data
 
 class PayrollRecordSerializer(serializers.ModelSerializer):
     employee_details = EmployeeListSerializer(source='employee', read_only=True)
-    period_details = PayrollPeriodSerializer(source='period', read_only=True)
-    allowances = AllowanceSerializer(many=True, read_only=True)
-    deductions = DeductionSerializer(many=True, read_only=True)
+    period_details = serializers.SerializerMethodField()
+    gross_salary = serializers.SerializerMethodField()
 
     class Meta:
         model = PayrollRecord
         fields = (
-            'id', 'period', 'period_details', 'employee',
+            'id', 'payroll_period', 'period_details', 'employee',
             'employee_details', 'basic_salary', 'overtime_hours',
-            'overtime_rate', 'overtime_amount', 'allowances',
-            'total_allowances', 'deductions', 'total_deductions',
-            'gross_salary', 'net_salary', 'tax_amount', 'status',
-            'notes', 'created_at', 'updated_at'
+            'overtime_rate', 'overtime_amount', 'allowances', 'deductions',
+            'tax', 'gross_salary', 'net_salary', 'status', 'payment_date',
+            'payment_method', 'payment_reference', 'notes',
+            'created_at', 'updated_at'
         )
         read_only_fields = (
-            'id', 'total_allowances', 'total_deductions',
-            'gross_salary', 'net_salary', 'created_at', 'updated_at'
+            'id', 'overtime_amount', 'gross_salary', 'net_salary',
+            'created_at', 'updated_at'
         )
 
+    def get_period_details(self, obj):
+        # Serialized periods are shared by every record of the response. On
+        # the first miss, all periods referenced by the list being rendered
+        # are loaded in a single annotated query.
+        cache = self.context.setdefault('payroll_period_cache', {})
+        if obj.payroll_period_id not in cache:
+            records = [obj]
+            if isinstance(self.parent, serializers.ListSerializer) and self.parent.instance is not None:
+                records = self.parent.instance
+            period_ids = {record.payroll_period_id for record in records} - set(cache)
+            for period in PayrollPeriod.objects.with_totals().filter(pk__in=period_ids):
+                cache[period.pk] = PayrollPeriodSerializer(period, context=self.context).data
+        return cache.get(obj.payroll_period_id)
+
+    def get_gross_salary(self, obj):
+        return MONEY_FIELD.to_representation(obj.basic_salary + obj.overtime_amount + obj.allowances)
+
 class PayslipSerializer(serializers.ModelSerializer):
     employee_details = EmployeeListSerializer(source='employee', read_only=True)
     period_details = PayrollPeriodSerializer(source='period', read_only=True)
@@ -123,4 +152,126 @@ class PayslipSerializer(serializers.ModelSerializer):
         return [{
             'name': deduction.name,
             'amount': deduction.calculate_amount(obj.gross_salary)
-        } for deduction in obj.deductions.all()]
\ No newline at end of file
+        } for deduction in obj.deductions.all()]
+
+class PayrollRunChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PayrollRunChunk
+        fields = (
+            'id', 'index', 'status', 'attempts', 'processed_count',
+            'failed_count', 'errors', 'timings', 'completed_at'
+        )
+        read_only_fields = fields
+
+class PayrollRunSerializer(serializers.ModelSerializer):
+    chunks = PayrollRunChunkSerializer(many=True, read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PayrollRun
+        fields = (
+            'id', 'payroll_period', 'status', 'chunk_size', 'total_employees',
+            'processed_employees', 'failed_employees', 'progress', 'timings',
+            'chunks', 'started_by', 'finished_at', 'created_at', 'updated_at'
+        )
+        read_only_fields = fields
+
+    def get_progress(self, obj):
+        if not obj.total_employees:
+            return 100.0
+        done = obj.processed_employees + obj.failed_employees
+        return round(100.0 * done / obj.total_employees, 1)
+
+class PayrollLedgerSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PayrollLedger
+        fields = (
+            'year', 'record_count', 'gross_total', 'deductions_total',
+            'tax_total', 'net_total', 'updated_at'
+        )
+        read_only_fields = fields
+
+class TaxBracketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TaxBracket
+        fields = ('id', 'year', 'lower_bound', 'rate', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'created_at', 'updated_at')
+
+class SimulatedRuleSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(max_length=100, required=False)
+    is_fixed = serializers.BooleanField(required=False)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    percentage = serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0, required=False)
+    is_taxable = serializers.BooleanField(required=False)
+    applies_to_all = serializers.BooleanField(default=True)
+    employees = serializers.ListField(child=serializers.UUIDField(), required=False)
+    departments = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+class SimulatedRuleChangesSerializer(serializers.Serializer):
+    add = SimulatedRuleSerializer(many=True, required=False)
+    update = SimulatedRuleSerializer(many=True, required=False)
+    remove = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate_add(self, value):
+        for rule in value:
+            rule.setdefault('is_fixed', True)
+            rule.setdefault('amount', Decimal('0.00'))
+            rule.setdefault('percentage', Decimal('0.00'))
+        return value
+
+    def validate_update(self, value):
+        if any('id' not in rule for rule in value):
+            raise serializers.ValidationError('Updated rules must have an id')
+        return value
+
+class SalaryChangeSerializer(serializers.Serializer):
+    percentage = serializers.DecimalField(
+        max_digits=5, decimal_places=2, min_value=Decimal('-99.99'), default=Decimal('0.00')
+    )
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, default=Decimal('0.00'))
+    departments = serializers.ListField(child=serializers.UUIDField(), required=False)
+    positions = serializers.ListField(child=serializers.UUIDField(), required=False)
+
+class PayrollSimulationSerializer(serializers.Serializer):
+    salary_change = SalaryChangeSerializer(required=False)
+    allowances = SimulatedRuleChangesSerializer(required=False)
+    deductions = SimulatedRuleChangesSerializer(required=False)
+
+    def validate(self, data):
+        for field, model in (('allowances', Allowance), ('deductions', Deduction)):
+            changes = data.get(field, {})
+            rule_ids = {rule['id'] for rule in changes.get('update', ())} | set(changes.get('remove', ()))
+            active = set(model.objects.active().filter(pk__in=rule_ids).values_list('pk', flat=True))
+            if rule_ids - active:
+                raise serializers.ValidationError({
+                    field: f'Unknown or inactive rules: {sorted(rule_ids - active)}'
+                })
+        return data
+
+class PayrollRecordBulkActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+    period = serializers.PrimaryKeyRelatedField(queryset=PayrollPeriod.objects.all(), required=False)
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, data):
+        if 'ids' not in data and 'period' not in data:
+            raise serializers.ValidationError('Either ids or period is required')
+        return data
+
+class PayrollRecordBulkPaySerializer(PayrollRecordBulkActionSerializer):
+    payment_date = serializers.DateField(required=False)
+    payment_method = serializers.CharField(max_length=50)
+    payment_reference = serializers.CharField(max_length=100, required=False, allow_blank=True, default='')
+
+class PayrollAuditLogSerializer(serializers.ModelSerializer):
+    performed_by_name = serializers.CharField(source='performed_by.get_full_name', read_only=True, default=None)
+
+    class Meta:
+        model = PayrollAuditLog
+        fields = (
+            'id', 'action', 'payroll_period', 'performed_by', 'performed_by_name',
+            'from_statuses', 'to_status', 'record_count', 'total_amount',
+            'details', 'created_at'
+        )
+        read_only_fields = fields
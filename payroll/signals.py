@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from attendance.rollups import attendances_changed
+from .ledger import ledger_year, refresh_ledger
+from .models import PayrollRecord
+from .overtime import schedule_overtime_sync
+
+@receiver(pre_save, sender=PayrollRecord)
+def remember_previous_record_state(sender, instance, **kwargs):
+    """Keep the stored status and ledger key so post_save can tell what changed."""
+    instance._ledger_previous = None
+    if instance.pk:
+        previous = PayrollRecord.objects.filter(pk=instance.pk).values_list(
+            'status', 'employee_id', 'payroll_period__end_date'
+        ).first()
+        if previous:
+            status, employee_id, end_date = previous
+            instance._ledger_previous = (status, (employee_id, end_date.year))
+
+@receiver(post_save, sender=PayrollRecord)
+def update_payroll_ledger(sender, instance, **kwargs):
+    """Refresh the employee's ledger when an approved or paid record changes."""
+    keys = set()
+    if instance.status in PayrollRecord.PROCESSED_STATUSES:
+        keys.add((instance.employee_id, ledger_year(instance.payroll_period)))
+    previous = getattr(instance, '_ledger_previous', None)
+    if previous and previous[0] in PayrollRecord.PROCESSED_STATUSES:
+        keys.add(previous[1])
+    refresh_ledger(keys)
+
+@receiver(post_delete, sender=PayrollRecord)
+def remove_from_payroll_ledger(sender, instance, **kwargs):
+    if instance.status in PayrollRecord.PROCESSED_STATUSES:
+        refresh_ledger([(instance.employee_id, ledger_year(instance.payroll_period))])
+
+@receiver(attendances_changed)
+def sync_overtime_after_attendance_change(sender, keys, **kwargs):
+    """Recompute pending records whose approved overtime may have changed."""
+    schedule_overtime_sync(keys)
@@ -0,0 +1,304 @@
+"""
+What-if payroll simulations.
+
+A simulation loads a columnar snapshot of the active workforce (salary,
+department, position and approved overtime as arrays), compiles the
+current rules once, and computes the period twice with the payroll
+engine's own arithmetic: once as things stand and once with the proposed
+changes applied to the arrays. Nothing is written to the database.
+Results are summed per department and per position over the employees'
+dense group codes.
+
+Loading the snapshot dominates the cost, so snapshots are kept in process
+memory and reused while a cheap fingerprint of the employees, rules, tax
+brackets and overtime they were built from is unchanged, for at most
+PAYROLL_SIMULATION_SNAPSHOT_TTL seconds. The cache holds at most
+PAYROLL_SIMULATION_MAX_SNAPSHOTS snapshots and
+PAYROLL_SIMULATION_MAX_CACHED_EMPLOYEES employees across them; the least
+recently used snapshots go first.
+"""
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max, Sum
+
+from attendance.models import Attendance
+from employees.models import Department, Position
+from .engine import PayrollRun
+from .money import div_half_up, from_cents, to_cents
+from .models import Allowance, Deduction, TaxBracket
+from .rules import RulePlan, compile_rules
+from .tax import load_tax_table, tax_year
+
+User = get_user_model()
+
+SNAPSHOT_TTL = getattr(settings, 'PAYROLL_SIMULATION_SNAPSHOT_TTL', 300)
+MAX_CACHED_SNAPSHOTS = getattr(settings, 'PAYROLL_SIMULATION_MAX_SNAPSHOTS', 4)
+# Bounds the memory of the cache, snapshots being arrays over the workforce
+MAX_CACHED_EMPLOYEES = getattr(settings, 'PAYROLL_SIMULATION_MAX_CACHED_EMPLOYEES', 200000)
+
+TOTAL_FIELDS = ('basic_salary', 'overtime_amount', 'allowances', 'deductions', 'tax', 'net_salary')
+
+
+class WorkforceSnapshot:
+    """Active, salaried employees of a period as aligned arrays."""
+
+    def __init__(self, period):
+        self.engine = PayrollRun(period)
+        rows = list(
+            User.objects.filter(is_active=True, salary__isnull=False)
+            .order_by('pk').values_list('pk', 'department_id', 'position_id', 'salary')
+        )
+        self.employee_ids = [row[0] for row in rows]
+        self.department_ids = [row[1] for row in rows]
+        self.salaries = np.fromiter((to_cents(row[3]) for row in rows), dtype=np.int64, count=len(rows))
+        self.overtime = self.engine.load_overtime(self.employee_ids)
+
+        self.departments, self.department_codes = self._encode(self.department_ids)
+        self.positions, self.position_codes = self._encode([row[2] for row in rows])
+        self.plan = compile_rules(self.employee_ids, self.department_ids)
+        self.tax_table = load_tax_table(tax_year(period))
+
+    def __len__(self):
+        return len(self.employee_ids)
+
+    @staticmethod
+    def _encode(values):
+        """Map each value to a dense integer code; returns (distinct values, codes)."""
+        distinct = {}
+        codes = np.fromiter(
+            (distinct.setdefault(value, len(distinct)) for value in values), dtype=np.int64, count=len(values)
+        )
+        return list(distinct), codes
+
+    def mask(self, employees=(), departments=(), positions=()):
+        """Employees matching any of the given employees, departments or positions."""
+        selected = np.zeros(len(self), dtype=bool)
+        if employees:
+            employees = set(employees)
+            selected |= np.fromiter((pk in employees for pk in self.employee_ids), dtype=bool, count=len(self))
+        for distinct, codes, chosen in (
+            (self.departments, self.department_codes, departments),
+            (self.positions, self.position_codes, positions),
+        ):
+            chosen = set(chosen)
+            chosen_codes = [code for code, value in enumerate(distinct) if value in chosen]
+            if chosen_codes:
+                selected |= np.isin(codes, chosen_codes)
+        return selected
+
+    def compute(self, salaries=None, plan=None):
+        return self.engine.compute(
+            self.salaries if salaries is None else salaries,
+            self.overtime,
+            plan or self.plan,
+            self.tax_table,
+        )
+
+
+_snapshots = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def _fingerprint(period):
+    """Cheap summary of everything a snapshot of ``period`` is built from."""
+    parts = [
+        User.objects.filter(is_active=True, salary__isnull=False).aggregate(
+            Count('pk'), Max('updated_at'), Sum('salary')
+        ),
+        Attendance.objects.filter(
+            is_approved=True, date__range=[period.start_date, period.end_date]
+        ).aggregate(Count('pk'), Max('updated_at'), Sum('overtime_hours')),
+        TaxBracket.objects.filter(year=tax_year(period)).aggregate(Count('pk'), Max('updated_at')),
+    ]
+    for model in (Allowance, Deduction):
+        parts.append(model.objects.aggregate(Count('pk'), Max('updated_at')))
+        parts.append(model.employees.through.objects.count())
+        parts.append(model.departments.through.objects.count())
+    return (period.period_type, period.start_date, period.end_date, repr(parts))
+
+
+def _cache_snapshot(period_id, fingerprint, snapshot):
+    now = time.monotonic()
+    with _snapshots_lock:
+        _snapshots.pop(period_id, None)
+        for key in [key for key, cached in _snapshots.items() if now - cached[1] >= SNAPSHOT_TTL]:
+            del _snapshots[key]
+        if len(snapshot) > MAX_CACHED_EMPLOYEES:
+            return
+        _snapshots[period_id] = (fingerprint, now, snapshot)
+        cached_employees = sum(len(cached[2]) for cached in _snapshots.values())
+        while len(_snapshots) > MAX_CACHED_SNAPSHOTS or cached_employees > MAX_CACHED_EMPLOYEES:
+            _, (_, _, evicted) = _snapshots.popitem(last=False)
+            cached_employees -= len(evicted)
+
+
+def clear_snapshot_cache():
+    with _snapshots_lock:
+        _snapshots.clear()
+
+
+def get_snapshot(period):
+    """The cached snapshot of ``period``, reloaded when stale."""
+    fingerprint = _fingerprint(period)
+    with _snapshots_lock:
+        cached = _snapshots.get(period.pk)
+        if cached and cached[0] == fingerprint and time.monotonic() - cached[1] < SNAPSHOT_TTL:
+            _snapshots.move_to_end(period.pk)
+            return cached[2]
+
+    snapshot = WorkforceSnapshot(period)
+    _cache_snapshot(period.pk, fingerprint, snapshot)
+    return snapshot
+
+
+def _rule_mask(snapshot, rule):
+    if rule.get('applies_to_all', True):
+        return np.ones(len(snapshot), dtype=bool)
+    return snapshot.mask(employees=rule.get('employees', ()), departments=rule.get('departments', ()))
+
+
+def _apply_rule_changes(snapshot, rule_set, changes, kind):
+    """Apply ``add``/``update``/``remove`` rule changes to a compiled RuleSet.
+
+    Updated rules keep their assignment and any attribute not given.
+    """
+    updated = []
+    for rule in changes.get('update', ()):
+        column = rule_set.column(rule['id'])
+        updated.append((rule['id'], {
+            'is_fixed': rule.get('is_fixed', rule_set.fixed[column]),
+            'amount': rule.get('amount', from_cents(rule_set.amounts[column])),
+            'percentage': rule.get('percentage', from_cents(rule_set.percentages[column])),
+            'assigned': rule_set.assigned[:, column],
+            'is_taxable': rule.get(
+                'is_taxable', True if rule_set.taxable is None else rule_set.taxable[column]
+            ),
+        }))
+    rule_set = rule_set.without(set(changes.get('remove', ())) | {rule_id for rule_id, _ in updated})
+
+    for rule_id, rule in updated:
+        rule_set = rule_set.with_rule(rule_id, **rule)
+    for index, rule in enumerate(changes.get('add', ())):
+        rule_set = rule_set.with_rule(
+            f'new-{kind}-{index}', rule['is_fixed'], rule['amount'], rule['percentage'],
+            _rule_mask(snapshot, rule), rule.get('is_taxable', True)
+        )
+    return rule_set
+
+
+def _group_totals(amounts, codes, groups):
+    """Sum every amount column per group code."""
+    sums = {}
+    for field in TOTAL_FIELDS:
+        # np.add.at rather than weighted bincount keeps the sums in exact int64
+        sums[field] = np.zeros(groups, dtype=np.int64)
+        np.add.at(sums[field], codes, amounts[field])
+    sums['headcount'] = np.bincount(codes, minlength=groups)
+    return sums
+
+
+def _format(sums, index=None):
+    values = {}
+    for field in TOTAL_FIELDS:
+        total = sums[field] if index is None else sums[field][index]
+        values[field] = str(from_cents(total))
+    return values
+
+
+def _difference(baseline, projected, index=None):
+    return {
+        field: str(from_cents(
+            (projected[field] if index is None else projected[field][index])
+            - (baseline[field] if index is None else baseline[field][index])
+        ))
+        for field in TOTAL_FIELDS
+    }
+
+
+def _breakdown(baseline, projected, codes, distinct, names):
+    groups = len(distinct)
+    before = _group_totals(baseline, codes, groups)
+    after = _group_totals(projected, codes, groups)
+    return [
+        {
+            'id': value,
+            'name': names.get(value),
+            'headcount': int(before['headcount'][index]),
+            'baseline': _format(before, index),
+            'projected': _format(after, index),
+            'difference': _difference(before, after, index),
+        }
+        for index, value in enumerate(distinct)
+    ]
+
+
+def simulate_payroll(period, salary_change=None, allowances=None, deductions=None):
+    """Project ``period``'s payroll with the proposed changes, without writing anything.
+
+    ``salary_change`` holds a ``percentage`` raise and/or a flat ``amount``,
+    limited to some ``departments`` or ``positions`` when given.
+    ``allowances`` and ``deductions`` hold ``add``, ``update`` and
+    ``remove`` lists of rule changes.
+    """
+    timings = {}
+    started = time.perf_counter()
+    snapshot = get_snapshot(period)
+    timings['snapshot'] = round(time.perf_counter() - started, 4)
+
+    started = time.perf_counter()
+    salaries = snapshot.salaries
+    if salary_change:
+        selected = np.ones(len(snapshot), dtype=bool)
+        if salary_change.get('departments') or salary_change.get('positions'):
+            selected = snapshot.mask(
+                departments=salary_change.get('departments', ()),
+                positions=salary_change.get('positions', ()),
+            )
+        percentage = to_cents(salary_change.get('percentage', Decimal('0')))
+        raised = div_half_up(salaries * (10000 + percentage), 10000) + to_cents(salary_change.get('amount', Decimal('0')))
+        salaries = np.where(selected, np.maximum(raised, 0), salaries)
+
+    plan = snapshot.plan
+    if allowances or deductions:
+        plan = RulePlan(
+            _apply_rule_changes(snapshot, plan.allowances, allowances or {}, 'allowance'),
+            _apply_rule_changes(snapshot, plan.deductions, deductions or {}, 'deduction'),
+        )
+
+    baseline = snapshot.compute()
+    projected = snapshot.compute(salaries, plan)
+    timings['compute'] = round(time.perf_counter() - started, 4)
+
+    started = time.perf_counter()
+    department_names = dict(
+        Department.objects.filter(pk__in=[pk for pk in snapshot.departments if pk]).values_list('pk', 'name')
+    )
+    position_names = dict(
+        Position.objects.filter(pk__in=[pk for pk in snapshot.positions if pk]).values_list('pk', 'title')
+    )
+    before = {field: baseline[field].sum() for field in TOTAL_FIELDS}
+    after = {field: projected[field].sum() for field in TOTAL_FIELDS}
+    result = {
+        'period': period.pk,
+        'employees': len(snapshot),
+        'totals': {
+            'baseline': _format(before),
+            'projected': _format(after),
+            'difference': _difference(before, after),
+        },
+        'departments': _breakdown(
+            baseline, projected, snapshot.department_codes, snapshot.departments, department_names
+        ),
+        'positions': _breakdown(
+            baseline, projected, snapshot.position_codes, snapshot.positions, position_names
+        ),
+    }
+    timings['aggregate'] = round(time.perf_counter() - started, 4)
+    result['timings'] = timings
+    return result
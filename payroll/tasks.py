@@ -0,0 +1,221 @@
+"""
+Checkpointed background payroll runs.
+
+A run snapshots the employees of a period into fixed-size chunks stored as
+PayrollRunChunk rows. Each chunk is processed by its own Celery task and
+commits its checkpoint when it is done, so a run that dies halfway can be
+restarted and only the unfinished chunks are processed again. Writes are
+upserts on (payroll_period, employee), which makes redoing a chunk safe.
+
+A worker holds its chunk for PAYROLL_CHUNK_LEASE_SECONDS. Resuming leaves
+running chunks alone until their lease runs out, and a worker that
+outlives its lease finds the chunk taken over and drops its result, so a
+chunk is never counted twice. The run's counters are the sums of its
+chunks', recomputed whenever a chunk completes.
+
+Overtime syncs after attendance corrections (see payroll.overtime) run
+here as well.
+
+Set CELERY_TASK_ALWAYS_EAGER=True to run the tasks in-process.
+"""
+import logging
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .engine import PayrollRun as PayrollRunEngine
+from .models import PayrollPeriod, PayrollRun, PayrollRunChunk
+from .overtime import sync_overtime
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+# A completed run is still unfinished while some of its employees failed
+UNFINISHED_RUNS = Q(status__in=('pending', 'running', 'failed')) | Q(status='completed', failed_employees__gt=0)
+
+# How long a worker holds a chunk before it is taken to have died
+CHUNK_LEASE_SECONDS = getattr(settings, 'PAYROLL_CHUNK_LEASE_SECONDS', 1800)
+
+
+def start_payroll_run(period, user=None, chunk_size=None):
+    """Start a run for ``period``, or resume its unfinished one.
+
+    Resuming re-dispatches the chunks that failed or whose worker's lease
+    ran out and, for completed chunks, retries only the employees that
+    failed. Chunks a live worker holds are left to it.
+    """
+    with transaction.atomic():
+        period = PayrollPeriod.objects.select_for_update().get(pk=period.pk)
+        run = period.runs.filter(UNFINISHED_RUNS).first()
+        if run is None:
+            run = _create_run(period, user, chunk_size or settings.PAYROLL_CHUNK_SIZE)
+        else:
+            run.chunks.filter(
+                Q(status='failed') | Q(status='running', lease_expires_at__lt=timezone.now())
+                | Q(status='running', lease_expires_at__isnull=True)
+            ).update(status='pending', lease_expires_at=None)
+            run.status = 'pending'
+            run.finished_at = None
+            run.save(update_fields=['status', 'finished_at', 'updated_at'])
+
+        if period.status != 'processing':
+            period.status = 'processing'
+            if user is not None:
+                period.processed_by = user
+            period.save()
+
+        chunk_ids = list(
+            run.chunks.filter(Q(status='pending') | Q(status='completed', failed_count__gt=0))
+            .values_list('pk', flat=True)
+        )
+        transaction.on_commit(lambda: _dispatch(run, chunk_ids))
+    return run
+
+
+def _create_run(period, user, chunk_size):
+    employee_ids = [
+        str(pk) for pk in User.objects.filter(
+            is_active=True, salary__isnull=False
+        ).order_by('pk').values_list('pk', flat=True)
+    ]
+    run = PayrollRun.objects.create(
+        payroll_period=period,
+        chunk_size=chunk_size,
+        total_employees=len(employee_ids),
+        started_by=user,
+    )
+    PayrollRunChunk.objects.bulk_create([
+        PayrollRunChunk(run=run, index=index, employee_ids=employee_ids[start:start + chunk_size])
+        for index, start in enumerate(range(0, len(employee_ids), chunk_size))
+    ])
+    return run
+
+
+def _dispatch(run, chunk_ids):
+    if not chunk_ids:
+        finalize_payroll_run(run.pk)
+        return
+    PayrollRun.objects.filter(pk=run.pk).update(status='running', updated_at=timezone.now())
+    for chunk_id in chunk_ids:
+        process_payroll_chunk.delay(chunk_id)
+
+
+@shared_task
+def process_payroll_chunk(chunk_id):
+    """Compute one chunk and commit its checkpoint."""
+    with transaction.atomic():
+        chunk = PayrollRunChunk.objects.select_for_update().select_related(
+            'run__payroll_period'
+        ).get(pk=chunk_id)
+        if chunk.status == 'completed' and not chunk.failed_count:
+            return
+        now = timezone.now()
+        if chunk.status == 'running' and chunk.lease_expires_at and chunk.lease_expires_at > now:
+            # Another worker holds the chunk
+            return
+        retry_failed_only = chunk.status == 'completed'
+        chunk.status = 'running'
+        chunk.attempts += 1
+        chunk.lease_expires_at = now + timedelta(seconds=CHUNK_LEASE_SECONDS)
+        chunk.save(update_fields=['status', 'attempts', 'lease_expires_at', 'updated_at'])
+    # Writes of this attempt only land while no later attempt has taken the chunk over
+    attempt = PayrollRunChunk.objects.filter(pk=chunk.pk, attempts=chunk.attempts, status='running')
+
+    if retry_failed_only:
+        employee_ids = [error['employee'] for error in chunk.errors]
+    else:
+        employee_ids = chunk.employee_ids
+
+    try:
+        summary = PayrollRunEngine(
+            chunk.run.payroll_period, employee_ids=employee_ids, chunk_size=len(employee_ids) or None
+        ).run()
+    except Exception as exc:
+        logger.exception('Payroll chunk %s of run %s failed', chunk.index, chunk.run_id)
+        attempt.update(
+            status='failed', lease_expires_at=None,
+            errors=[{'employee': None, 'error': str(exc)}], updated_at=timezone.now()
+        )
+        finalize_payroll_run(chunk.run_id)
+        return
+
+    failed_ids = set(summary['failed_ids'])
+    processed = len(employee_ids) - len(failed_ids)
+    with transaction.atomic():
+        if retry_failed_only:
+            processed_count = chunk.processed_count + processed
+        else:
+            processed_count = processed
+        completed = attempt.update(
+            status='completed',
+            processed_count=processed_count,
+            failed_count=len(failed_ids),
+            errors=summary['errors'],
+            timings=summary['timings'],
+            lease_expires_at=None,
+            completed_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+        if not completed:
+            logger.warning('Payroll chunk %s of run %s was taken over; result dropped', chunk.index, chunk.run_id)
+            return
+        # Locked after the chunk, in the order resuming takes them, so the sums see every committed chunk
+        PayrollRun.objects.select_for_update().only('pk').get(pk=chunk.run_id)
+        totals = PayrollRunChunk.objects.filter(run_id=chunk.run_id).aggregate(
+            processed=Sum('processed_count'), failed=Sum('failed_count')
+        )
+        PayrollRun.objects.filter(pk=chunk.run_id).update(
+            processed_employees=totals['processed'] or 0,
+            failed_employees=totals['failed'] or 0,
+            updated_at=timezone.now(),
+        )
+    finalize_payroll_run(chunk.run_id)
+
+
+def finalize_payroll_run(run_id):
+    """Close the run once every chunk has stopped, and complete the period if clean."""
+    with transaction.atomic():
+        run = PayrollRun.objects.select_for_update().select_related('payroll_period').get(pk=run_id)
+        if run.status in ('completed', 'failed'):
+            return
+        if run.chunks.filter(status__in=('pending', 'running')).exists():
+            return
+
+        run.finished_at = timezone.now()
+        timings = {}
+        for chunk_timings in run.chunks.values_list('timings', flat=True):
+            for phase, seconds in chunk_timings.items():
+                timings[phase] = round(timings.get(phase, 0) + seconds, 4)
+        timings['elapsed'] = round((run.finished_at - run.created_at).total_seconds(), 4)
+        run.timings = timings
+        if run.chunks.filter(status='failed').exists():
+            run.status = 'failed'
+        else:
+            run.status = 'completed'
+        run.save(update_fields=['status', 'finished_at', 'timings', 'updated_at'])
+
+        if run.status == 'completed' and not run.failed_employees:
+            run.payroll_period.status = 'completed'
+            run.payroll_period.save()
+
+    logger.info(
+        'Payroll run %s %s: %d processed, %d failed',
+        run.pk, run.status, run.processed_employees, run.failed_employees
+    )
+
+
+@shared_task
+def sync_period_overtime(period_id, employee_ids=None):
+    """Bring the period's pending records in line with approved attendance overtime."""
+    period = PayrollPeriod.objects.filter(pk=period_id).first()
+    if period is None:
+        return []
+    synced = sync_overtime(period, employee_ids)
+    logger.info('Overtime of period %s synced: %d records recomputed', period_id, len(synced))
+    return [str(employee_id) for employee_id in synced]
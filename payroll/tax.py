@@ -0,0 +1,114 @@
+"""
+Progressive income tax.
+
+A year's TaxBracket rows are compiled into a TaxTable holding, for each
+bracket, its lower bound, its rate and the tax owed on all income below
+that bound. Tax on an income is then one bisect (or one np.searchsorted
+for a whole vector) plus one multiply-add, whatever the number of brackets.
+
+Brackets are annual. Period pay is annualized by the number of periods in
+a year, taxed, and the annual tax divided back and rounded half-up to the
+cent, once. Everything in between is exact integer arithmetic on cents
+times hundredths of a percent.
+"""
+from bisect import bisect_right
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+
+from .models import TaxBracket
+from .money import div_half_up, from_cents, to_cents
+
+# Used as a single bracket for years without any TaxBracket rows
+FLAT_TAX_RATE = Decimal(getattr(settings, 'PAYROLL_FLAT_TAX_RATE', '0.00'))
+
+PERIODS_PER_YEAR = {
+    'monthly': 12,
+    'bi_weekly': 26,
+    'weekly': 52,
+}
+
+# Rates are stored in hundredths of a percent
+RATE_SCALE = 10000
+
+
+class TaxTable:
+    """Cumulative bracket table for one year.
+
+    ``lower_bounds`` are in cents and ``rates`` in hundredths of a percent,
+    both sorted by bound. Income below the first bound is untaxed.
+    """
+
+    def __init__(self, lower_bounds, rates):
+        lower_bounds, rates = list(lower_bounds), list(rates)
+        if not lower_bounds or lower_bounds[0] > 0:
+            lower_bounds.insert(0, 0)
+            rates.insert(0, 0)
+
+        # Tax owed below each bound, in cents times RATE_SCALE
+        cumulative = [0]
+        for index in range(1, len(lower_bounds)):
+            band = lower_bounds[index] - lower_bounds[index - 1]
+            cumulative.append(cumulative[-1] + band * rates[index - 1])
+
+        self.lower_bounds = lower_bounds
+        self.rates = rates
+        self.cumulative = cumulative
+        self._bounds_array = np.array(lower_bounds, dtype=np.int64)
+        self._rates_array = np.array(rates, dtype=np.int64)
+        self._cumulative_array = np.array(cumulative, dtype=np.int64)
+
+    @classmethod
+    def flat(cls, rate):
+        return cls([0], [to_cents(rate)])
+
+    def _scaled_tax(self, income):
+        index = bisect_right(self.lower_bounds, income) - 1
+        return self.cumulative[index] + (income - self.lower_bounds[index]) * self.rates[index]
+
+    def tax(self, income, periods_per_year=1):
+        """Tax on ``income`` earned in one of ``periods_per_year`` periods, as a Decimal."""
+        income = max(to_cents(income), 0)
+        scaled = self._scaled_tax(income * periods_per_year)
+        return from_cents(div_half_up(scaled, RATE_SCALE * periods_per_year))
+
+    def tax_cents(self, incomes, periods_per_year=1):
+        """Vectorized ``tax`` over an int64 array of per-period incomes in cents."""
+        annual = np.maximum(incomes, 0) * periods_per_year
+        index = np.searchsorted(self._bounds_array, annual, side='right') - 1
+        scaled = self._cumulative_array[index] + (annual - self._bounds_array[index]) * self._rates_array[index]
+        return div_half_up(scaled, RATE_SCALE * periods_per_year)
+
+    def marginal_rate(self, income, periods_per_year=1):
+        """Rate, as a percentage, applying to the next unit of ``income``."""
+        # Income below zero is taxed as none, at the rate of the first bracket
+        index = bisect_right(self.lower_bounds, max(to_cents(income), 0) * periods_per_year) - 1
+        return from_cents(self.rates[index])
+
+
+def load_tax_table(year):
+    """Compile ``year``'s brackets, falling back to the flat rate when it has none."""
+    brackets = list(
+        TaxBracket.objects.filter(year=year).order_by('lower_bound').values_list('lower_bound', 'rate')
+    )
+    if not brackets:
+        return TaxTable.flat(FLAT_TAX_RATE)
+    return TaxTable([to_cents(bound) for bound, _ in brackets], [to_cents(rate) for _, rate in brackets])
+
+
+def tax_year(period):
+    """A period is taxed under the brackets of the year it ends in."""
+    return period.end_date.year
+
+
+def calculate_tax(taxable_income, year, period_type='monthly'):
+    """Tax on one period's ``taxable_income`` under ``year``'s brackets."""
+    return load_tax_table(year).tax(taxable_income, PERIODS_PER_YEAR.get(period_type, 12))
+
+
+def calculate_period_tax(period, taxable_incomes, table=None):
+    """Tax in cents for an array of taxable incomes in cents earned in ``period``."""
+    table = table or load_tax_table(tax_year(period))
+    incomes = np.asarray(taxable_incomes, dtype=np.int64)
+    return table.tax_cents(incomes, PERIODS_PER_YEAR.get(period.period_type, 12))
@@ -1,3 +1,676 @@
-from django.test import TestCase
+import hashlib
+import io
+import zipfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.db.models import F, Sum
+from django.test import TestCase, override_settings
+from django.urls import include, path
+from attendance.models import Attendance
+from employees.models import Department
+from django.utils import timezone
+from rest_framework.test import APITestCase
+
+from .engine import PayrollRun as PayrollRunEngine, run_payroll
+from .exports import CSVPaymentFile, PaymentFileExporter, SEPAPaymentFile
+from .ledger import refresh_ledger_for_records
+from .overtime import approved_overtime, sync_overtime
+from .models import (
+    Allowance, Deduction, PayrollAuditLog, PayrollLedger, PayrollPeriod, PayrollRecord, PayrollRunChunk, TaxBracket,
+)
+from .payslips import render_pool
+from . import simulation
+from .tasks import process_payroll_chunk, start_payroll_run
+from .tax import TaxTable, load_tax_table
+from .transitions import transition_records
+
+User = get_user_model()
+
+urlpatterns = [
+    path('api/payroll/', include('payroll.urls')),
+]
+
+
+def create_user(email, role='employee', salary=None, **extra):
+    return User.objects.create_user(
+        email=email, password='password123', first_name='Test', last_name=email.split('@')[0],
+        role=role, salary=salary, **extra
+    )
+
+
+class PayrollEngineTests(TestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+
+    def test_run_creates_one_record_per_salaried_employee(self):
+        employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+        create_user('unsalaried@example.com')
+
+        summary = run_payroll(self.period)
+
+        self.assertEqual(summary['created'], 1)
+        self.assertEqual(summary['failed'], 0)
+        record = PayrollRecord.objects.get(payroll_period=self.period)
+        self.assertEqual(record.employee, employee)
+        self.assertEqual(record.basic_salary, Decimal('3000.00'))
+        self.assertEqual(record.net_salary, Decimal('3000.00'))
+
+    def test_rerun_updates_records_in_place(self):
+        employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+        run_payroll(self.period)
+        User.objects.filter(pk=employee.pk).update(salary=Decimal('3500.00'))
+
+        summary = run_payroll(self.period)
+
+        self.assertEqual((summary['created'], summary['updated']), (0, 1))
+        self.assertEqual(PayrollRecord.objects.get(payroll_period=self.period).basic_salary, Decimal('3500.00'))
+
+    def test_rerun_leaves_approved_records_alone(self):
+        approved = create_user('approved@example.com', salary=Decimal('3000.00'))
+        create_user('pending@example.com', salary=Decimal('3000.00'))
+        run_payroll(self.period)
+        PayrollRecord.objects.filter(employee=approved).update(status='approved')
+        User.objects.filter(email__in=['approved@example.com', 'pending@example.com']).update(salary=Decimal('3500.00'))
+
+        summary = run_payroll(self.period)
+
+        self.assertEqual((summary['updated'], summary['locked']), (1, 1))
+        self.assertEqual(PayrollRecord.objects.get(employee=approved).basic_salary, Decimal('3000.00'))
+
+    def test_upsert_skips_records_approved_after_the_statuses_were_read(self):
+        employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+        create_user('new@example.com', salary=Decimal('3000.00'))
+        engine = PayrollRunEngine(self.period)
+        run_payroll(self.period)
+        record = PayrollRecord.objects.get(employee=employee)
+        PayrollRecord.objects.filter(pk=record.pk).update(status='approved')
+        stale = PayrollRecord(payroll_period=self.period, employee=employee, basic_salary=Decimal('9000.00'),
+                              net_salary=Decimal('9000.00'))
+
+        for upsert in (engine._upsert, engine._upsert_locked):
+            with self.subTest(upsert=upsert.__name__):
+                self.assertEqual(upsert([stale]), [])
+                self.assertEqual(PayrollRecord.objects.get(pk=record.pk).basic_salary, Decimal('3000.00'))
+
+
+class PayrollRunResumeTests(TestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        for number in range(4):
+            create_user(f'employee{number}@example.com', salary=Decimal('3000.00'))
+
+    def start(self):
+        with mock.patch('payroll.tasks.process_payroll_chunk.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                run = start_payroll_run(self.period, chunk_size=1)
+        return run, {call.args[0] for call in delay.call_args_list}
+
+    def test_resume_leaves_chunks_held_by_live_workers(self):
+        run, dispatched = self.start()
+        self.assertEqual(len(dispatched), 4)
+        live, expired, failed, completed = run.chunks.order_by('index')
+        now = timezone.now()
+        live.status, live.lease_expires_at = 'running', now + timedelta(minutes=5)
+        expired.status, expired.lease_expires_at = 'running', now - timedelta(minutes=5)
+        failed.status = 'failed'
+        for chunk in (live, expired, failed):
+            chunk.save()
+        process_payroll_chunk(completed.pk)
+
+        resumed, dispatched = self.start()
+
+        self.assertEqual(resumed, run)
+        self.assertEqual(dispatched, {expired.pk, failed.pk})
+        live.refresh_from_db()
+        self.assertEqual(live.status, 'running')
+
+    def test_duplicate_delivery_counts_a_chunk_once(self):
+        run, dispatched = self.start()
+        for chunk_id in dispatched:
+            process_payroll_chunk(chunk_id)
+            process_payroll_chunk(chunk_id)
+
+        run.refresh_from_db()
+        self.assertEqual(run.status, 'completed')
+        self.assertEqual((run.processed_employees, run.failed_employees), (4, 0))
+        self.assertEqual(set(run.chunks.values_list('attempts', flat=True)), {1})
+
+    def test_worker_that_lost_its_lease_drops_its_result(self):
+        run, dispatched = self.start()
+        chunk = run.chunks.get(index=0)
+        original_run = PayrollRunEngine.run
+
+        def taken_over(engine):
+            # Another worker takes the chunk over while this one computes
+            PayrollRunChunk.objects.filter(pk=chunk.pk).update(attempts=F('attempts') + 1)
+            return original_run(engine)
+
+        with mock.patch.object(PayrollRunEngine, 'run', taken_over):
+            process_payroll_chunk(chunk.pk)
+
+        chunk.refresh_from_db()
+        run.refresh_from_db()
+        self.assertEqual(chunk.status, 'running')
+        self.assertEqual(run.processed_employees, 0)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ProcessPayrollPermissionTests(APITestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        self.hr = create_user('hr@example.com', role='hr')
+        self.employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+
+    def test_employee_cannot_process_payroll(self):
+        self.client.force_authenticate(self.employee)
+        response = self.client.post(f'/api/payroll/periods/{self.period.pk}/process_payroll/')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.period.runs.exists())
+
+    def test_employee_cannot_read_run_status(self):
+        self.client.force_authenticate(self.employee)
+        response = self.client.get(f'/api/payroll/periods/{self.period.pk}/run_status/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_hr_processes_payroll(self):
+        self.client.force_authenticate(self.hr)
+        response = self.client.post(f'/api/payroll/periods/{self.period.pk}/process_payroll/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['total_employees'], 1)
+
+        response = self.client.get(f'/api/payroll/periods/{self.period.pk}/run_status/')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class PeriodPayslipsTests(APITestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        self.hr = create_user('hr@example.com', role='hr')
+        self.employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+        create_user('other@example.com', salary=Decimal('2500.00'))
+        run_payroll(self.period)
+
+    def download(self):
+        response = self.client.get(f'/api/payroll/periods/{self.period.pk}/payslips/')
+        self.assertEqual(response.status_code, 200)
+        return zipfile.ZipFile(io.BytesIO(b''.join(response.streaming_content)))
+
+    def test_employee_cannot_download_a_periods_payslips(self):
+        self.client.force_authenticate(self.employee)
+        response = self.client.get(f'/api/payroll/periods/{self.period.pk}/payslips/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_downloads_share_one_render_pool(self):
+        self.client.force_authenticate(self.hr)
+        first = self.download()
+        pool = render_pool()
+        second = self.download()
+
+        self.assertIs(render_pool(), pool)
+        self.assertEqual(len(first.namelist()), 2)
+        self.assertEqual(first.namelist(), second.namelist())
+        for name in first.namelist():
+            self.assertTrue(first.read(name).startswith(b'%PDF'))
+
+    def test_employees_download_only_their_own_payslip(self):
+        own = PayrollRecord.objects.get(employee=self.employee)
+        other = PayrollRecord.objects.exclude(employee=self.employee).get()
+        self.client.force_authenticate(self.employee)
+
+        response = self.client.get(f'/api/payroll/records/{own.pk}/generate_payslip/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
+        response = self.client.get(f'/api/payroll/records/{other.pk}/generate_payslip/')
+        self.assertEqual(response.status_code, 404)
+
+        self.client.force_authenticate(self.hr)
+        response = self.client.get(f'/api/payroll/records/{other.pk}/generate_payslip/')
+        self.assertEqual(response.status_code, 200)
+
+
+class PeriodTotalsTests(TestCase):
+    def test_with_totals_sums_net_salary_and_counts_processed_records(self):
+        period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        empty = PayrollPeriod.objects.create(start_date=date(2025, 4, 1), end_date=date(2025, 4, 30))
+        for number, salary in enumerate(('3000.00', '2500.50', '1000.00')):
+            create_user(f'employee{number}@example.com', salary=Decimal(salary))
+        run_payroll(period)
+        PayrollRecord.objects.filter(basic_salary=Decimal('1000.00')).update(status='approved')
+
+        totals = {row.pk: row for row in PayrollPeriod.objects.with_totals()}
+
+        self.assertEqual(totals[period.pk].total_payroll, Decimal('6500.50'))
+        self.assertEqual(totals[period.pk].processed_records, 1)
+        self.assertEqual(totals[empty.pk].total_payroll, Decimal('0.00'))
+        self.assertEqual(totals[empty.pk].processed_records, 0)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class ListQueryCountTests(APITestCase):
+    """The record and period lists take the same number of queries whatever their length."""
+
+    def setUp(self):
+        self.department = Department.objects.create(name='Engineering', code='ENG')
+        self.client.force_authenticate(create_user('hr@example.com', role='hr'))
+        self.employees = 0
+
+    def add_periods(self, count):
+        for _ in range(count):
+            start = date(2025, 1, 1) + timedelta(days=31 * PayrollPeriod.objects.count())
+            period = PayrollPeriod.objects.create(start_date=start, end_date=start + timedelta(days=27))
+            for _ in range(2):
+                self.employees += 1
+                employee = create_user(
+                    f'employee{self.employees}@example.com', salary=Decimal('1000.00'), department=self.department
+                )
+                PayrollRecord.objects.create(
+                    payroll_period=period, employee=employee, basic_salary=Decimal('1000.00'), net_salary=0,
+                    status='approved',
+                )
+
+    def test_record_list(self):
+        self.add_periods(2)
+        # The count, the page, and the totals of the page's periods
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/payroll/records/')
+        self.assertEqual(response.data['count'], 4)
+
+        self.add_periods(2)
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/payroll/records/')
+        self.assertEqual(response.data['count'], 8)
+
+    def test_period_list(self):
+        self.add_periods(2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/payroll/periods/')
+        self.assertEqual(response.data['count'], 2)
+
+        self.add_periods(2)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/payroll/periods/')
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual({row['total_payroll'] for row in response.data['results']}, {'2000.00'})
+
+
+class PayrollLedgerTests(TestCase):
+    def setUp(self):
+        self.employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+        self.march = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        self.april = PayrollPeriod.objects.create(start_date=date(2025, 4, 1), end_date=date(2025, 4, 30))
+        run_payroll(self.march)
+        run_payroll(self.april)
+
+    def ledger(self):
+        return PayrollLedger.objects.filter(employee=self.employee, year=2025).first()
+
+    def test_only_approved_and_paid_records_count(self):
+        self.assertIsNone(self.ledger())
+
+        record = PayrollRecord.objects.get(payroll_period=self.march)
+        record.status = 'approved'
+        record.save()
+
+        ledger = self.ledger()
+        self.assertEqual(ledger.record_count, 1)
+        self.assertEqual(ledger.net_total, Decimal('3000.00'))
+
+    def test_refresh_follows_status_changes_and_deletes(self):
+        for record in PayrollRecord.objects.all():
+            record.status = 'approved'
+            record.save()
+        self.assertEqual(self.ledger().net_total, Decimal('6000.00'))
+
+        record = PayrollRecord.objects.get(payroll_period=self.march)
+        record.status = 'pending'
+        record.save()
+        self.assertEqual(self.ledger().record_count, 1)
+
+        PayrollRecord.objects.get(payroll_period=self.april).delete()
+        ledger = self.ledger()
+        self.assertEqual((ledger.record_count, ledger.net_total), (0, Decimal('0.00')))
+
+    def test_bulk_refresh_matches_per_record_refresh(self):
+        records = PayrollRecord.objects.all()
+        records.update(status='paid')
+        refresh_ledger_for_records(records)
+
+        ledger = self.ledger()
+        self.assertEqual(ledger.record_count, 2)
+        self.assertEqual(ledger.gross_total, Decimal('6000.00'))
+        self.assertEqual(ledger.net_total, Decimal('6000.00'))
+
+
+class RulePlanTests(TestCase):
+    def test_plan_matches_rules_evaluated_one_by_one(self):
+        department = Department.objects.create(name='Engineering', code='ENG')
+        engineer = create_user('engineer@example.com', salary=Decimal('3333.33'), department=department)
+        other = create_user('other@example.com', salary=Decimal('2000.00'))
+        Allowance.objects.create(name='Transport', amount=Decimal('100.00'))
+        bonus = Allowance.objects.create(
+            name='Bonus', amount=0, is_fixed=False, percentage=Decimal('12.50'), applies_to_all=False
+        )
+        bonus.departments.add(department)
+        Allowance.objects.create(name='Retired', amount=Decimal('999.00'), is_active=False)
+        Deduction.objects.create(name='Pension', amount=0, is_fixed=False, percentage=Decimal('7.00'))
+        union = Deduction.objects.create(name='Union', amount=Decimal('15.00'), applies_to_all=False)
+        union.employees.add(other)
+        period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+
+        run_payroll(period)
+
+        for employee in (engineer, other):
+            record = PayrollRecord.objects.get(payroll_period=period, employee=employee)
+            allowances = sum(
+                rule.calculate_amount(employee.salary) for rule in Allowance.objects.for_employee(employee)
+            )
+            gross = employee.salary + allowances
+            deductions = sum(rule.calculate_amount(gross) for rule in Deduction.objects.for_employee(employee))
+            self.assertEqual(record.allowances, allowances)
+            self.assertEqual(record.deductions, deductions)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class RulePermissionTests(APITestCase):
+    def setUp(self):
+        self.hr = create_user('hr@example.com', role='hr')
+        self.employee = create_user('employee@example.com')
+        self.allowance = Allowance.objects.create(name='Transport', amount=Decimal('100.00'))
+        self.deduction = Deduction.objects.create(name='Pension', amount=Decimal('50.00'))
+
+    def test_employee_reads_but_cannot_change_rules(self):
+        self.client.force_authenticate(self.employee)
+        for url, rule in (('/api/payroll/allowances/', self.allowance), ('/api/payroll/deductions/', self.deduction)):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 200)
+                response = self.client.post(url, {'name': 'Bonus', 'amount': '500.00'})
+                self.assertEqual(response.status_code, 403)
+                response = self.client.patch(f'{url}{rule.pk}/', {'employees': [self.employee.pk]})
+                self.assertEqual(response.status_code, 403)
+                self.assertEqual(self.client.delete(f'{url}{rule.pk}/').status_code, 403)
+        self.assertFalse(self.allowance.employees.exists())
+
+    def test_hr_assigns_rules(self):
+        self.client.force_authenticate(self.hr)
+        response = self.client.put(
+            f'/api/payroll/allowances/{self.allowance.pk}/',
+            {'name': 'Transport', 'amount': '100.00', 'is_fixed': True, 'applies_to_all': False,
+             'employees': [self.employee.pk]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.allowance.employees.all()), [self.employee])
+
+
+class TaxTableTests(TestCase):
+    def setUp(self):
+        self.table = TaxTable([0, 1000000, 5000000], [0, 2000, 4000])
+
+    def test_tax_is_progressive(self):
+        # 20% of 40,000 plus 40% of 10,000, over 12 months
+        self.assertEqual(self.table.tax(Decimal('5000.00'), 12), Decimal('1000.00'))
+        self.assertEqual(self.table.tax(Decimal('500.00'), 12), Decimal('0.00'))
+
+    def test_vectorized_tax_matches_scalar_tax(self):
+        incomes = [0, 83333, 83334, 416667, 1234567]
+        cents = self.table.tax_cents(np.array(incomes, dtype=np.int64), 12)
+        for income, tax in zip(incomes, cents):
+            self.assertEqual(self.table.tax(Decimal(income) / 100, 12), Decimal(int(tax)) / 100)
+
+    def test_negative_income_is_untaxed_at_the_first_rate(self):
+        table = TaxTable([1000000], [2000])
+        self.assertEqual(table.tax(Decimal('-100.00')), Decimal('0.00'))
+        self.assertEqual(table.marginal_rate(Decimal('-100.00')), Decimal('0.00'))
+        self.assertEqual(self.table.marginal_rate(Decimal('-1.00'), 12), Decimal('0.00'))
+        self.assertEqual(self.table.marginal_rate(Decimal('5000.00'), 12), Decimal('40.00'))
+
+    def test_years_without_brackets_use_the_flat_rate(self):
+        TaxBracket.objects.create(year=2025, lower_bound=Decimal('10000.00'), rate=Decimal('20.00'))
+        self.assertEqual(load_tax_table(2025).tax(Decimal('20000.00')), Decimal('2000.00'))
+        self.assertEqual(load_tax_table(2024).tax(Decimal('20000.00')), Decimal('0.00'))
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class TaxBracketPermissionTests(APITestCase):
+    def setUp(self):
+        self.hr = create_user('hr@example.com', role='hr')
+        self.employee = create_user('employee@example.com')
+        self.bracket = TaxBracket.objects.create(year=2025, lower_bound=0, rate=Decimal('10.00'))
+
+    def test_employee_reads_but_cannot_change_brackets(self):
+        self.client.force_authenticate(self.employee)
+        self.assertEqual(self.client.get('/api/payroll/tax-brackets/').status_code, 200)
+        response = self.client.get('/api/payroll/tax-brackets/calculate/', {'income': '-50', 'year': 2025})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['tax'], response.data['marginal_rate']), ('0.00', '10.00'))
+
+        response = self.client.post(
+            '/api/payroll/tax-brackets/', {'year': 2025, 'lower_bound': '1000.00', 'rate': '50.00'}
+        )
+        self.assertEqual(response.status_code, 403)
+        response = self.client.patch(f'/api/payroll/tax-brackets/{self.bracket.pk}/', {'rate': '0.00'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.delete(f'/api/payroll/tax-brackets/{self.bracket.pk}/').status_code, 403)
+
+    def test_hr_changes_brackets(self):
+        self.client.force_authenticate(self.hr)
+        response = self.client.post(
+            '/api/payroll/tax-brackets/', {'year': 2025, 'lower_bound': '1000.00', 'rate': '50.00'}
+        )
+        self.assertEqual(response.status_code, 201)
+
+
+class SimulationSnapshotCacheTests(TestCase):
+    def setUp(self):
+        simulation.clear_snapshot_cache()
+        self.addCleanup(simulation.clear_snapshot_cache)
+        for number in range(3):
+            create_user(f'employee{number}@example.com', salary=Decimal('3000.00'))
+        self.periods = [
+            PayrollPeriod.objects.create(start_date=date(2025, month, 1), end_date=date(2025, month, 28))
+            for month in (1, 2, 3)
+        ]
+
+    def test_cache_keeps_the_most_recently_used_snapshots(self):
+        with mock.patch.object(simulation, 'MAX_CACHED_SNAPSHOTS', 2):
+            january = simulation.get_snapshot(self.periods[0])
+            simulation.get_snapshot(self.periods[1])
+            self.assertIs(simulation.get_snapshot(self.periods[0]), january)
+            simulation.get_snapshot(self.periods[2])
+
+        self.assertEqual(list(simulation._snapshots), [self.periods[0].pk, self.periods[2].pk])
+
+    def test_cache_is_bounded_by_employees_held(self):
+        with mock.patch.object(simulation, 'MAX_CACHED_EMPLOYEES', 5):
+            simulation.get_snapshot(self.periods[0])
+            simulation.get_snapshot(self.periods[1])
+            self.assertEqual(list(simulation._snapshots), [self.periods[1].pk])
+
+        with mock.patch.object(simulation, 'MAX_CACHED_EMPLOYEES', 2):
+            simulation.get_snapshot(self.periods[2])
+            self.assertNotIn(self.periods[2].pk, simulation._snapshots)
+
+    def test_changed_salaries_reload_the_snapshot(self):
+        first = simulation.get_snapshot(self.periods[0])
+        User.objects.filter(email='employee0@example.com').update(salary=Decimal('3100.00'))
+        self.assertIsNot(simulation.get_snapshot(self.periods[0]), first)
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class SimulatePermissionTests(APITestCase):
+    def setUp(self):
+        simulation.clear_snapshot_cache()
+        self.addCleanup(simulation.clear_snapshot_cache)
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        self.hr = create_user('hr@example.com', role='hr')
+        self.employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+
+    def test_employee_cannot_simulate(self):
+        self.client.force_authenticate(self.employee)
+        response = self.client.post(f'/api/payroll/periods/{self.period.pk}/simulate/', {}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_hr_projects_a_raise(self):
+        self.client.force_authenticate(self.hr)
+        response = self.client.post(
+            f'/api/payroll/periods/{self.period.pk}/simulate/',
+            {'salary_change': {'percentage': '10.00'}},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['employees'], 1)
+        self.assertEqual(response.data['totals']['difference']['basic_salary'], '300.00')
+        self.assertFalse(PayrollRecord.objects.exists())
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class BulkTransitionTests(APITestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        self.hr = create_user('hr@example.com', role='hr')
+        for number in range(3):
+            create_user(f'employee{number}@example.com', salary=Decimal('1000.00'))
+        run_payroll(self.period)
+        self.client.force_authenticate(self.hr)
+
+    def test_approve_then_pay_a_period(self):
+        response = self.client.post('/api/payroll/records/bulk_approve/', {'period': self.period.pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['record_count'], response.data['total_amount']), (3, '3000.00'))
+
+        response = self.client.post(
+            '/api/payroll/records/bulk_pay/',
+            {'period': self.period.pk, 'payment_method': 'bank_transfer', 'payment_date': '2025-04-01'},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(PayrollRecord.objects.values_list('status', flat=True)), {'paid'})
+        self.assertEqual(PayrollLedger.objects.filter(year=2025).aggregate(total=Sum('net_total'))['total'], 3000)
+        self.assertEqual(PayrollAuditLog.objects.count(), 2)
+
+    def test_a_record_in_the_wrong_status_refuses_the_whole_batch(self):
+        paid = PayrollRecord.objects.first()
+        PayrollRecord.objects.filter(pk=paid.pk).update(status='approved')
+
+        response = self.client.post('/api/payroll/records/bulk_approve/', {'period': self.period.pk}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['records'], [paid.pk])
+        self.assertEqual(PayrollRecord.objects.filter(status='pending').count(), 2)
+        self.assertFalse(PayrollAuditLog.objects.exists())
+
+    def test_employee_cannot_approve(self):
+        self.client.force_authenticate(create_user('employee@example.com'))
+        response = self.client.post('/api/payroll/records/bulk_approve/', {'period': self.period.pk}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_records_added_after_the_lock_are_left_alone(self):
+        late = create_user('late@example.com', salary=Decimal('500.00'))
+
+        def add_record():
+            # Runs after the batch is locked and checked, before it is updated
+            PayrollRecord.objects.create(
+                payroll_period=self.period, employee=late, basic_salary=Decimal('500.00'), net_salary=0,
+            )
+            return timezone.now()
+
+        with mock.patch('payroll.transitions.timezone') as clock:
+            clock.now.side_effect = add_record
+            log = transition_records(PayrollRecord.objects.filter(payroll_period=self.period), 'approve', self.hr)
+
+        self.assertEqual((log.record_count, log.total_amount), (3, Decimal('3000.00')))
+        self.assertEqual(PayrollRecord.objects.get(employee=late).status, 'pending')
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class OvertimeSyncTests(APITestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        self.employee = create_user('employee@example.com', salary=Decimal('3000.00'))
+        self.other = create_user('other@example.com', salary=Decimal('3000.00'))
+        self.overtime(self.employee, date(2025, 3, 3), hours=11)
+        self.overtime(self.employee, date(2025, 3, 4), hours=10, is_approved=False)
+        self.overtime(self.employee, date(2025, 4, 1), hours=12)
+        run_payroll(self.period)
+
+    def overtime(self, employee, day, hours, is_approved=True):
+        check_in = timezone.make_aware(datetime(day.year, day.month, day.day, 8))
+        return Attendance.objects.create(
+            employee=employee, date=day, check_in=check_in, check_out=check_in + timedelta(hours=hours),
+            is_approved=is_approved,
+        )
+
+    def record(self, employee):
+        return PayrollRecord.objects.get(payroll_period=self.period, employee=employee)
+
+    def test_records_carry_approved_overtime_of_the_period(self):
+        self.assertEqual(approved_overtime(date(2025, 3, 1), date(2025, 3, 31)), {self.employee.pk: Decimal('3.00')})
+        self.assertEqual(self.record(self.employee).overtime_hours, Decimal('3.00'))
+        self.assertEqual(self.record(self.other).overtime_hours, Decimal('0.00'))
+
+    def test_sync_recomputes_only_drifted_pending_records(self):
+        before = self.record(self.employee)
+        Attendance.objects.filter(employee=self.employee, date=date(2025, 3, 4)).update(is_approved=True)
+        PayrollRecord.objects.filter(pk=self.record(self.other).pk).update(status='approved')
+        self.overtime(self.other, date(2025, 3, 5), hours=9)
+
+        self.assertEqual(sync_overtime(self.period), [self.employee.pk])
+
+        after = self.record(self.employee)
+        self.assertEqual(after.overtime_hours, Decimal('5.00'))
+        self.assertGreater(after.overtime_amount, before.overtime_amount)
+        self.assertEqual(self.record(self.other).overtime_hours, Decimal('0.00'))
+        self.assertEqual(sync_overtime(self.period), [])
+
+    def test_attendance_changes_queue_a_sync_of_their_employees(self):
+        with mock.patch('payroll.tasks.sync_period_overtime.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.overtime(self.employee, date(2025, 3, 6), hours=9)
+                self.overtime(self.employee, date(2025, 5, 6), hours=9)
+        delay.assert_called_once_with(self.period.pk, [str(self.employee.pk)])
+
+    def test_hr_syncs_a_period_on_demand(self):
+        self.overtime(self.other, date(2025, 3, 5), hours=9)
+        self.client.force_authenticate(create_user('hr@example.com', role='hr'))
+
+        response = self.client.post(f'/api/payroll/periods/{self.period.pk}/sync_overtime/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'synced': 1, 'employees': [str(self.other.pk)]})
+        self.client.force_authenticate(self.employee)
+        response = self.client.post(f'/api/payroll/periods/{self.period.pk}/sync_overtime/')
+        self.assertEqual(response.status_code, 403)
+
+
+class PaymentFileTests(TestCase):
+    def setUp(self):
+        self.period = PayrollPeriod.objects.create(start_date=date(2025, 3, 1), end_date=date(2025, 3, 31))
+        for number in range(3):
+            create_user(
+                f'employee{number}@example.com', salary=Decimal('1000.00'),
+                bank_name='Bank', bank_account_number=f'DE00{number}' if number else '',
+            )
+        run_payroll(self.period)
+        PayrollRecord.objects.update(status='paid')
+
+    def test_exporters_must_render_transfers(self):
+        with self.assertRaises(TypeError):
+            PaymentFileExporter(self.period)
+
+    def test_manifest_describes_the_streamed_file(self):
+        for exporter_class in (CSVPaymentFile, SEPAPaymentFile):
+            exporter = exporter_class(self.period)
+            content = b''.join(exporter)
+            manifest = exporter.manifest
+            self.assertEqual((manifest['transactions'], manifest['control_sum']), (2, '2000.00'))
+            self.assertEqual(manifest['bytes'], len(content))
+            self.assertEqual(manifest['sha256'], hashlib.sha256(content).hexdigest())
+            self.assertTrue(manifest['consistent'])
+            # Streaming the same records again gives the same file
+            self.assertEqual(b''.join(exporter_class(self.period)), content)
@@ -0,0 +1,92 @@
+"""
+Bulk status transitions of payroll records.
+
+A transition moves a whole batch of records to a new status with one
+UPDATE, after checking, under row locks in the same transaction, that
+every record is in a status it may move from (PayrollRecord.TRANSITIONS).
+PayrollRecord.save() and its signals are bypassed, so net salaries stay
+exactly as the engine computed them; the ledger is refreshed once for the
+batch instead, and a single PayrollAuditLog row records it.
+"""
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .ledger import refresh_ledger_for_records
+from .models import PayrollAuditLog, PayrollRecord
+
+ACTIONS = {
+    'approve': 'approved',
+    'pay': 'paid',
+}
+
+
+class InvalidTransition(Exception):
+    def __init__(self, message, record_ids=()):
+        super().__init__(message)
+        self.record_ids = list(record_ids)
+
+
+@transaction.atomic
+def transition_records(records, action, user=None, payment_date=None, payment_method='',
+                       payment_reference='', notes=''):
+    """Apply ``action`` ('approve' or 'pay') to every record of ``records``.
+
+    All or nothing: raises InvalidTransition, listing the offending record
+    ids, if any record cannot make the transition. Returns the audit row.
+    """
+    to_status = ACTIONS[action]
+    from_statuses = PayrollRecord.TRANSITIONS[to_status]
+
+    # Lock the batch so no record changes status between the check and the update
+    rows = list(records.select_for_update().order_by('pk').values_list('pk', 'status', 'payroll_period_id'))
+    if not rows:
+        raise InvalidTransition('No payroll records selected')
+    invalid = [pk for pk, status, _ in rows if status not in from_statuses]
+    if invalid:
+        raise InvalidTransition(
+            f"Only {' or '.join(from_statuses)} records can be marked {to_status}", invalid
+        )
+
+    now = timezone.now()
+    changes = {'status': to_status, 'updated_at': now}
+    details = {}
+    if to_status == 'paid':
+        payment_date = payment_date or now.date()
+        changes.update(
+            payment_date=payment_date,
+            payment_method=payment_method,
+            payment_reference=payment_reference,
+        )
+        details.update(
+            payment_date=payment_date.isoformat(),
+            payment_method=payment_method,
+            payment_reference=payment_reference,
+        )
+    if notes:
+        details['notes'] = notes
+
+    # Work on exactly the rows locked and checked above: re-running ``records``
+    # could pick up records created or changed since the lock was taken
+    record_ids = [pk for pk, _, _ in rows]
+    locked = PayrollRecord.objects.filter(pk__in=record_ids)
+    total = locked.aggregate(total=Sum('net_salary'))['total'] or 0
+    updated = locked.update(**changes)
+    if updated != len(rows):
+        raise InvalidTransition('Payroll records changed during the transition', record_ids)
+
+    if to_status in PayrollRecord.PROCESSED_STATUSES and not set(from_statuses) & set(PayrollRecord.PROCESSED_STATUSES):
+        refresh_ledger_for_records(locked)
+
+    periods = {period_id for _, _, period_id in rows}
+    return PayrollAuditLog.objects.create(
+        action=action,
+        payroll_period_id=periods.pop() if len(periods) == 1 else None,
+        performed_by=user,
+        from_statuses=list(from_statuses),
+        to_status=to_status,
+        record_count=updated,
+        record_ids=record_ids,
+        total_amount=total,
+        details=details,
+    )
@@ -5,6 +5,10 @@ from .views import (
     PayrollRecordViewSet,
     AllowanceViewSet,
     DeductionViewSet,
+    TaxBracketViewSet,
+    EmployeePayrollHistoryView,
+    EmployeeYearToDateView,
+    EmployeeTaxSummaryView,
 )
 
 app_name = 'payroll'
@@ -14,7 +18,11 @@ router.register('periods', PayrollPeriodViewSet)
 router.register('records', PayrollRecordViewSet)
 router.register('allowances', AllowanceViewSet)
 router.register('deductions', DeductionViewSet)
+router.register('tax-brackets', TaxBracketViewSet)
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('employees/<uuid:employee_id>/history/', EmployeePayrollHistoryView.as_view(), name='employee-payroll-history'),
+    path('employees/<uuid:employee_id>/year-to-date/', EmployeeYearToDateView.as_view(), name='employee-payroll-ytd'),
+    path('employees/<uuid:employee_id>/tax-summary/', EmployeeTaxSummaryView.as_view(), name='employee-tax-summary'),
 ]
\ No newline at end of file
@@ -1,11 +1,29 @@
 from rest_framework import generics, status, permissions, viewsets
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from django.db.models import Q, Sum
+from django.contrib.auth import get_user_model
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from datetime import datetime
-from .models import PayrollPeriod, PayrollRecord, Allowance, Deduction
-from .serializers import PayrollPeriodSerializer, PayrollRecordSerializer, AllowanceSerializer, DeductionSerializer
+from decimal import Decimal, InvalidOperation
+from accounts.permissions import IsHRStaff, IsHRStaffOrReadOnly
+from .models import PayrollPeriod, PayrollRecord, Allowance, Deduction, PayrollLedger, TaxBracket
+from .serializers import (
+    PayrollPeriodSerializer, PayrollRecordSerializer, AllowanceSerializer, DeductionSerializer,
+    PayrollRunSerializer, PayrollLedgerSerializer, TaxBracketSerializer, PayrollSimulationSerializer,
+    PayrollRecordBulkActionSerializer, PayrollRecordBulkPaySerializer, PayrollAuditLogSerializer,
+)
+from .overtime import sync_overtime
+from .simulation import simulate_payroll
+from .tasks import start_payroll_run
+from .transitions import InvalidTransition, transition_records
+from .tax import PERIODS_PER_YEAR, load_tax_table
+from .exports import EXPORTERS
+from .payslips import payslip_filename, payslip_values, render_payslip, stream_period_payslips
+
+User = get_user_model()
 
 class PayrollPeriodViewSet(viewsets.ModelViewSet):
     queryset = PayrollPeriod.objects.all()
@@ -13,7 +31,7 @@ class PayrollPeriodViewSet(viewsets.ModelViewSet):
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
-        queryset = PayrollPeriod.objects.all()
+        queryset = PayrollPeriod.objects.with_totals()
         period_type = self.request.query_params.get('period_type', None)
         status = self.request.query_params.get('status', None)
         start_date = self.request.query_params.get('start_date', None)
@@ -32,23 +50,83 @@ class PayrollPeriodViewSet(viewsets.ModelViewSet):
                 pass
         return queryset
 
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
     def process_payroll(self, request, pk=None):
         period = self.get_object()
-        if period.status == 'draft':
-            period.status = 'processing'
-            period.save()
-            # Add your payroll processing logic here
-            return Response({'status': 'payroll processing started'}, status=status.HTTP_200_OK)
+        # A period still 'processing' has an unfinished run, which is resumed
+        if period.status in ('draft', 'processing'):
+            run = start_payroll_run(period, user=request.user)
+            run.refresh_from_db()
+            return Response(PayrollRunSerializer(run).data, status=status.HTTP_202_ACCEPTED)
         return Response({'error': 'payroll cannot be processed'}, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def sync_overtime(self, request, pk=None):
+        """Recompute the pending records whose overtime differs from approved attendance."""
+        synced = sync_overtime(self.get_object())
+        return Response({'synced': len(synced), 'employees': [str(employee_id) for employee_id in synced]})
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def simulate(self, request, pk=None):
+        """Project the period's payroll under proposed salary and rule changes; writes nothing."""
+        period = self.get_object()
+        serializer = PayrollSimulationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(simulate_payroll(period, **serializer.validated_data))
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def payslips(self, request, pk=None):
+        period = self.get_object()
+        response = StreamingHttpResponse(stream_period_payslips(period), content_type='application/zip')
+        response['Content-Disposition'] = (
+            f'attachment; filename="payslips_{period.start_date}_{period.end_date}.zip"'
+        )
+        return response
+
+    def _payment_file(self, request):
+        period = self.get_object()
+        exporter_class = EXPORTERS.get(request.query_params.get('file_format', 'csv'))
+        if exporter_class is None:
+            return None, Response(
+                {'error': f"file_format must be one of {', '.join(EXPORTERS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return exporter_class(period), None
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def bank_file(self, request, pk=None):
+        exporter, error = self._payment_file(request)
+        if error:
+            return error
+        response = StreamingHttpResponse(iter(exporter), content_type=exporter.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{exporter.filename}"'
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def bank_file_manifest(self, request, pk=None):
+        """Checksum manifest of the file bank_file returns, computed by streaming it."""
+        exporter, error = self._payment_file(request)
+        if error:
+            return error
+        for _ in exporter:
+            pass
+        return Response(exporter.manifest)
+
+    @action(detail=True, methods=['get'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def run_status(self, request, pk=None):
+        period = self.get_object()
+        run = period.runs.first()
+        if run is None:
+            return Response({'error': 'payroll has not been processed'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(PayrollRunSerializer(run).data)
+
 class PayrollRecordViewSet(viewsets.ModelViewSet):
     queryset = PayrollRecord.objects.all()
     serializer_class = PayrollRecordSerializer
     permission_classes = (permissions.IsAuthenticated,)
 
     def get_queryset(self):
-        queryset = PayrollRecord.objects.all()
+        queryset = PayrollRecord.objects.select_related('employee__department')
         employee = self.request.query_params.get('employee', None)
         period = self.request.query_params.get('period', None)
         status = self.request.query_params.get('status', None)
@@ -56,29 +134,54 @@ class PayrollRecordViewSet(viewsets.ModelViewSet):
         if employee:
             queryset = queryset.filter(employee_id=employee)
         if period:
-            queryset = queryset.filter(period_id=period)
+            queryset = queryset.filter(payroll_period_id=period)
         if status:
             queryset = queryset.filter(status=status)
+        if self.action == 'generate_payslip' and not self.request.user.is_hr:
+            # Employees may only download their own payslips
+            queryset = queryset.filter(employee=self.request.user)
         return queryset
 
     @action(detail=True, methods=['get'])
     def generate_payslip(self, request, pk=None):
         record = self.get_object()
-        # Add your payslip generation logic here
-        payslip_data = {
-            'employee': record.employee.get_full_name(),
-            'period': f"{record.period.start_date} - {record.period.end_date}",
-            'basic_salary': record.basic_salary,
-            'total_allowances': record.total_allowances,
-            'total_deductions': record.total_deductions,
-            'net_salary': record.net_salary
-        }
-        return Response(payslip_data)
+        data = payslip_values(PayrollRecord.objects.filter(pk=record.pk)).get()
+        response = HttpResponse(render_payslip(data), content_type='application/pdf')
+        response['Content-Disposition'] = f'attachment; filename="{payslip_filename(data)}"'
+        return response
+
+    def _bulk_transition(self, request, action, serializer_class):
+        serializer = serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        options = dict(serializer.validated_data)
+
+        records = PayrollRecord.objects.all()
+        if 'ids' in options:
+            records = records.filter(pk__in=options.pop('ids'))
+        if 'period' in options:
+            records = records.filter(payroll_period=options.pop('period'))
+
+        try:
+            log = transition_records(records, action, user=request.user, **options)
+        except InvalidTransition as exc:
+            return Response(
+                {'error': str(exc), 'records': exc.record_ids[:100]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(PayrollAuditLogSerializer(log).data)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def bulk_approve(self, request):
+        return self._bulk_transition(request, 'approve', PayrollRecordBulkActionSerializer)
+
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated, IsHRStaff])
+    def bulk_pay(self, request):
+        return self._bulk_transition(request, 'pay', PayrollRecordBulkPaySerializer)
 
 class AllowanceViewSet(viewsets.ModelViewSet):
     queryset = Allowance.objects.all()
     serializer_class = AllowanceSerializer
-    permission_classes = (permissions.IsAuthenticated,)
+    permission_classes = (permissions.IsAuthenticated, IsHRStaffOrReadOnly)
 
     def get_queryset(self):
         queryset = Allowance.objects.all()
@@ -86,7 +189,7 @@ class AllowanceViewSet(viewsets.ModelViewSet):
         allowance_type = self.request.query_params.get('type', None)
 
         if employee:
-            queryset = queryset.filter(employee_id=employee)
+            queryset = queryset.for_employee(get_object_or_404(User, pk=employee))
         if allowance_type:
             queryset = queryset.filter(allowance_type=allowance_type)
         return queryset
@@ -97,16 +200,16 @@ class AllowanceViewSet(viewsets.ModelViewSet):
         if not employee_id:
             return Response({'error': 'employee parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        total = self.get_queryset().filter(
-            employee_id=employee_id
-        ).aggregate(total_amount=Sum('amount'))
+        employee = get_object_or_404(User, pk=employee_id)
+        base = employee.salary or Decimal('0.00')
+        total = sum((allowance.calculate_amount(base) for allowance in self.get_queryset()), Decimal('0.00'))
 
-        return Response(total)
+        return Response({'total_amount': total})
 
 class DeductionViewSet(viewsets.ModelViewSet):
     queryset = Deduction.objects.all()
     serializer_class = DeductionSerializer
-    permission_classes = (permissions.IsAuthenticated,)
+    permission_classes = (permissions.IsAuthenticated, IsHRStaffOrReadOnly)
 
     def get_queryset(self):
         queryset = Deduction.objects.all()
@@ -114,7 +217,7 @@ class DeductionViewSet(viewsets.ModelViewSet):
         deduction_type = self.request.query_params.get('type', None)
 
         if employee:
-            queryset = queryset.filter(employee_id=employee)
+            queryset = queryset.for_employee(get_object_or_404(User, pk=employee))
         if deduction_type:
             queryset = queryset.filter(deduction_type=deduction_type)
         return queryset
@@ -125,11 +228,47 @@ class DeductionViewSet(viewsets.ModelViewSet):
         if not employee_id:
             return Response({'error': 'employee parameter is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-        total = self.get_queryset().filter(
-            employee_id=employee_id
-        ).aggregate(total_amount=Sum('amount'))
+        employee = get_object_or_404(User, pk=employee_id)
+        basic = employee.salary or Decimal('0.00')
+        gross = basic + sum(
+            allowance.calculate_amount(basic) for allowance in Allowance.objects.for_employee(employee)
+        )
+        total = sum((deduction.calculate_amount(gross) for deduction in self.get_queryset()), Decimal('0.00'))
+
+        return Response({'total_amount': total})
+
+class TaxBracketViewSet(viewsets.ModelViewSet):
+    queryset = TaxBracket.objects.all()
+    serializer_class = TaxBracketSerializer
+    permission_classes = (permissions.IsAuthenticated, IsHRStaffOrReadOnly)
+
+    def get_queryset(self):
+        queryset = TaxBracket.objects.all()
+        year = self.request.query_params.get('year', None)
+        if year:
+            queryset = queryset.filter(year=year)
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def calculate(self, request):
+        try:
+            income = Decimal(request.query_params.get('income', ''))
+            year = int(request.query_params.get('year', timezone.now().year))
+        except (InvalidOperation, ValueError):
+            return Response({'error': 'income and year must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        if not income.is_finite():
+            return Response({'error': 'income and year must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        period_type = request.query_params.get('period_type', 'monthly')
+        if period_type not in PERIODS_PER_YEAR:
+            return Response({'error': 'Invalid period_type'}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response(total)
+        table = load_tax_table(year)
+        periods = PERIODS_PER_YEAR[period_type]
+        return Response({
+            'income': str(income),
+            'tax': str(table.tax(income, periods)),
+            'marginal_rate': str(table.marginal_rate(income, periods)),
+        })
 
 class EmployeePayrollHistoryView(generics.ListAPIView):
     serializer_class = PayrollRecordSerializer
@@ -140,16 +279,53 @@ class EmployeePayrollHistoryView(generics.ListAPIView):
         start_date = self.request.query_params.get('start_date', None)
         end_date = self.request.query_params.get('end_date', None)
 
-        queryset = PayrollRecord.objects.filter(employee_id=employee_id)
+        queryset = PayrollRecord.objects.filter(employee_id=employee_id).select_related('employee__department')
 
         if start_date and end_date:
             try:
                 start = datetime.strptime(start_date, '%Y-%m-%d').date()
                 end = datetime.strptime(end_date, '%Y-%m-%d').date()
                 queryset = queryset.filter(
-                    period__start_date__range=[start, end]
+                    payroll_period__start_date__range=[start, end]
                 )
             except ValueError:
                 pass
 
-        return queryset.order_by('-period__start_date')
+        return queryset.order_by('-payroll_period__start_date')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        ledgers = PayrollLedger.objects.filter(employee_id=self.kwargs['employee_id'])
+        response.data['yearly_totals'] = PayrollLedgerSerializer(ledgers, many=True).data
+        return response
+
+class EmployeeYearToDateView(generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, employee_id):
+        try:
+            year = int(request.query_params.get('year', timezone.now().year))
+        except ValueError:
+            return Response({'error': 'year must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        ledger = PayrollLedger.objects.filter(employee_id=employee_id, year=year).first()
+        if ledger is None:
+            ledger = PayrollLedger(employee_id=employee_id, year=year)
+        return Response(PayrollLedgerSerializer(ledger).data)
+
+class EmployeeTaxSummaryView(generics.GenericAPIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request, employee_id):
+        summary = []
+        for ledger in PayrollLedger.objects.filter(employee_id=employee_id):
+            effective_rate = Decimal('0.00')
+            if ledger.gross_total:
+                effective_rate = (100 * ledger.tax_total / ledger.gross_total).quantize(Decimal('0.01'))
+            summary.append({
+                'year': ledger.year,
+                'gross_total': str(ledger.gross_total),
+                'tax_total': str(ledger.tax_total),
+                'effective_tax_rate': str(effective_rate),
+            })
+        return Response(summary)